@@ -0,0 +1,237 @@
+import argparse
+import csv
+from datetime import datetime
+
+from config import DB_FILE, EXPORT_CHUNK_SIZE, IMPORT_BATCH_SIZE
+
+# Колонки CSV-файла экспорта (импорт использует те же названия)
+CSV_FIELDS = [
+    'id', 'user_id', 'user_name', 'service_id', 'service_name',
+    'service_price', 'appointment_datetime', 'duration', 'created_at'
+]
+
+
+def write_csv(appointments, file):
+    """
+    Записывает записи в CSV-файл по мере их поступления
+
+    Args:
+        appointments (iterable): Записи (например, из Database.iter_appointments_by_date_range)
+        file: Открытый текстовый файл для записи
+
+    Returns:
+        int: Количество записанных строк
+    """
+    writer = csv.DictWriter(file, fieldnames=CSV_FIELDS, extrasaction='ignore')
+    writer.writeheader()
+
+    count = 0
+    for appointment in appointments:
+        writer.writerow(appointment)
+        count += 1
+
+    return count
+
+
+def _ics_escape(text):
+    """
+    Экранирует текст для значения свойства iCalendar
+    """
+    return (
+        str(text).replace('\\', '\\\\').replace(';', '\\;')
+        .replace(',', '\\,').replace('\n', '\\n')
+    )
+
+
+def _ics_unescape(text):
+    """
+    Отменяет экранирование значения свойства iCalendar
+    """
+    return (
+        text.replace('\\n', '\n').replace('\\,', ',')
+        .replace('\\;', ';').replace('\\\\', '\\')
+    )
+
+
+def write_ics(appointments, file, calendar_name="Записи"):
+    """
+    Записывает записи в файл формата iCalendar (.ics) по мере их поступления
+
+    Args:
+        appointments (iterable): Записи models.Appointment (например, из Database.iter_appointments_by_date_range)
+        file: Открытый текстовый файл для записи
+        calendar_name (str): Название календаря
+
+    Returns:
+        int: Количество записанных событий
+    """
+    file.write(
+        "BEGIN:VCALENDAR\r\n"
+        "VERSION:2.0\r\n"
+        "PRODID:-//Appointments Bot//RU\r\n"
+        f"X-WR-CALNAME:{_ics_escape(calendar_name)}\r\n"
+    )
+
+    count = 0
+    for appointment in appointments:
+        stamp = datetime.fromisoformat(appointment.created_at) if appointment.created_at else appointment.start
+
+        file.write(
+            "BEGIN:VEVENT\r\n"
+            f"UID:appointment-{appointment.id}@appointments-bot\r\n"
+            f"DTSTAMP:{stamp.strftime('%Y%m%dT%H%M%S')}\r\n"
+            f"DTSTART:{appointment.start.strftime('%Y%m%dT%H%M%S')}\r\n"
+            f"DTEND:{appointment.end.strftime('%Y%m%dT%H%M%S')}\r\n"
+            f"SUMMARY:{_ics_escape(appointment.service_name or 'Запись')}\r\n"
+            f"X-APPOINTMENT-USER-ID:{appointment.user_id}\r\n"
+            f"X-APPOINTMENT-USER-NAME:{_ics_escape(appointment.user_name or '')}\r\n"
+            f"X-APPOINTMENT-SERVICE-ID:{appointment.service_id}\r\n"
+            "END:VEVENT\r\n"
+        )
+        count += 1
+
+    file.write("END:VCALENDAR\r\n")
+    return count
+
+
+def read_csv(file):
+    """
+    Читает записи из CSV-файла в формате экспорта
+
+    Args:
+        file: Открытый текстовый файл
+
+    Yields:
+        tuple: (user_id, user_name, service_id, appointment_datetime, duration, created_at)
+    """
+    for row in csv.DictReader(file):
+        yield (
+            row['user_id'],
+            row['user_name'],
+            row['service_id'],
+            row['appointment_datetime'],
+            row['duration'],
+            row.get('created_at') or None,
+        )
+
+
+def read_ics(file):
+    """
+    Читает записи из файла iCalendar, созданного функцией write_ics.
+    События без X-APPOINTMENT-* свойств пропускаются
+
+    Args:
+        file: Открытый текстовый файл
+
+    Yields:
+        tuple: (user_id, user_name, service_id, appointment_datetime, duration, created_at)
+    """
+    event = None
+    for line in file:
+        line = line.rstrip('\r\n')
+
+        if line == 'BEGIN:VEVENT':
+            event = {}
+            continue
+
+        if line == 'END:VEVENT':
+            if event and {'DTSTART', 'DTEND', 'X-APPOINTMENT-USER-ID', 'X-APPOINTMENT-SERVICE-ID'} <= event.keys():
+                start = datetime.strptime(event['DTSTART'], "%Y%m%dT%H%M%S")
+                end = datetime.strptime(event['DTEND'], "%Y%m%dT%H%M%S")
+                created_at = None
+                if 'DTSTAMP' in event:
+                    created_at = datetime.strptime(event['DTSTAMP'], "%Y%m%dT%H%M%S").strftime("%Y-%m-%d %H:%M:%S")
+                yield (
+                    event['X-APPOINTMENT-USER-ID'],
+                    _ics_unescape(event.get('X-APPOINTMENT-USER-NAME', '')),
+                    event['X-APPOINTMENT-SERVICE-ID'],
+                    start.strftime("%Y-%m-%d %H:%M"),
+                    int((end - start).total_seconds() // 60),
+                    created_at,
+                )
+            event = None
+            continue
+
+        if event is not None and ':' in line:
+            name, value = line.split(':', 1)
+            # Параметры свойства (например, DTSTART;TZID=...) нам не нужны
+            event[name.split(';', 1)[0]] = value
+
+
+def export_appointments(db, start_date, end_date, file, file_format='csv'):
+    """
+    Экспортирует записи за диапазон дат в файл, не загружая их все в память
+
+    Args:
+        db (Database): Экземпляр базы данных
+        start_date (str): Начальная дата в формате "ГГГГ-ММ-ДД"
+        end_date (str): Конечная дата в формате "ГГГГ-ММ-ДД"
+        file: Открытый текстовый файл для записи
+        file_format (str): 'csv' или 'ics'
+
+    Returns:
+        int: Количество экспортированных записей
+    """
+    appointments = db.iter_appointments_by_date_range(start_date, end_date, chunk_size=EXPORT_CHUNK_SIZE)
+    if file_format == 'ics':
+        return write_ics(appointments, file)
+    return write_csv(appointments, file)
+
+
+def import_appointments(db, file, file_format='csv', check_conflicts=True):
+    """
+    Импортирует записи из CSV- или ICS-файла
+
+    Args:
+        db (Database): Экземпляр базы данных
+        file: Открытый текстовый файл
+        file_format (str): 'csv' или 'ics'
+        check_conflicts (bool): Пропускать записи, пересекающиеся с существующими
+
+    Returns:
+        dict: Количество импортированных и пропущенных записей
+    """
+    rows = read_ics(file) if file_format == 'ics' else read_csv(file)
+    return db.import_appointments(rows, batch_size=IMPORT_BATCH_SIZE, check_conflicts=check_conflicts)
+
+
+def main():
+    """
+    Точка входа для запуска экспорта и импорта из командной строки:
+
+        python appointments_io.py export 2024-01-01 2024-12-31 appointments.csv
+        python appointments_io.py import history.ics
+    """
+    from database import Database
+
+    parser = argparse.ArgumentParser(description="Экспорт и импорт записей")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help="Экспорт записей в файл")
+    export_parser.add_argument('start_date')
+    export_parser.add_argument('end_date')
+    export_parser.add_argument('path')
+
+    import_parser = subparsers.add_parser('import', help="Импорт записей из файла")
+    import_parser.add_argument('path')
+    import_parser.add_argument('--no-conflict-check', action='store_true')
+
+    parser.add_argument('--db', default=DB_FILE)
+    args = parser.parse_args()
+
+    db = Database(args.db)
+    db.create_tables()
+    file_format = 'ics' if args.path.lower().endswith('.ics') else 'csv'
+
+    if args.command == 'export':
+        with open(args.path, 'w', encoding='utf-8', newline='') as file:
+            count = export_appointments(db, args.start_date, args.end_date, file, file_format)
+        print(f"Экспортировано записей: {count}")
+    else:
+        with open(args.path, encoding='utf-8', newline='') as file:
+            result = import_appointments(db, file, file_format, not args.no_conflict_check)
+        print(f"Импортировано записей: {result['imported']}, пропущено из-за пересечений: {result['conflicts']}")
+
+
+if __name__ == '__main__':
+    main()
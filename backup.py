@@ -0,0 +1,185 @@
+import asyncio
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+
+import metrics
+from logging_setup import trace_id_var, new_trace_id
+from config import BACKUP_STEP_PAGES, BACKUP_STEP_SLEEP, BACKUP_MAX_RESTARTS
+
+logger = logging.getLogger(__name__)
+
+
+class _TooManyRestarts(Exception):
+    """
+    Постраничное копирование слишком часто начиналось заново из-за записи в базу
+    """
+
+
+class BackupJob:
+    def __init__(self, db_file, backup_dir, keep, compress=False):
+        """
+        Инициализация резервного копирования базы данных
+
+        Копия делается через online backup API SQLite небольшими порциями страниц
+        в отдельном потоке и с отдельным соединением. Между порциями блокировка
+        базы отпускается, поэтому запись новых данных не останавливается, а цикл
+        событий бота не блокируется. Копия проверяется (PRAGMA integrity_check)
+        и только после этого получает свое имя; старые копии удаляются
+
+        Args:
+            db_file (str): Путь к файлу базы данных
+            backup_dir (str): Папка для резервных копий
+            keep (int): Сколько последних копий хранить
+            compress (bool): Сохранять копию в сжатом виде (.db.gz)
+        """
+        self.db_file = db_file
+        self.backup_dir = backup_dir
+        self.keep = keep
+        self.compress = compress
+        self.running = False
+        self._prefix = os.path.splitext(os.path.basename(db_file))[0] + "-"
+        self._lock = asyncio.Lock()
+
+    async def run(self):
+        """
+        Создает одну резервную копию
+
+        Returns:
+            dict: Путь к копии ('path'), размер в байтах ('size'), количество
+                перезапусков копирования ('restarts') и время в секундах ('seconds')
+        """
+        async with self._lock:
+            started_at = time.perf_counter()
+            os.makedirs(self.backup_dir, exist_ok=True)
+            name = f"{self._prefix}{datetime.now().strftime('%Y%m%d-%H%M%S')}.db"
+            path = os.path.join(self.backup_dir, name + ".gz" if self.compress else name)
+            partial = os.path.join(self.backup_dir, name + ".partial")
+
+            try:
+                restarts = await asyncio.to_thread(self._copy, partial)
+                await asyncio.to_thread(self._verify, partial)
+                if self.compress:
+                    await asyncio.to_thread(self._compress, partial, path)
+                    os.remove(partial)
+                else:
+                    os.replace(partial, path)
+            except Exception:
+                metrics.inc("backup.failed")
+                if os.path.exists(partial):
+                    os.remove(partial)
+                raise
+
+            self._rotate()
+
+            seconds = time.perf_counter() - started_at
+            size = os.path.getsize(path)
+            metrics.inc("backup.completed")
+            metrics.observe("backup.duration", seconds)
+            logger.info(
+                "Резервная копия создана",
+                extra={'path': path, 'size': size, 'restarts': restarts, 'seconds': round(seconds, 3)}
+            )
+            return {'path': path, 'size': size, 'restarts': restarts, 'seconds': seconds}
+
+    def _copy(self, path):
+        """
+        Копирует базу данных порциями по BACKUP_STEP_PAGES страниц
+
+        Если базу меняет другое соединение, SQLite начинает копирование заново.
+        После BACKUP_MAX_RESTARTS перезапусков остаток копируется за один шаг:
+        это короткая блокировка записи, зато копия гарантированно завершается
+
+        Returns:
+            int: Количество перезапусков
+        """
+        source = sqlite3.connect(self.db_file)
+        target = sqlite3.connect(path)
+        state = {'remaining': None, 'restarts': 0}
+
+        def progress(status, remaining, total):
+            if state['remaining'] is not None and remaining >= state['remaining']:
+                state['restarts'] += 1
+                metrics.inc("backup.restarts")
+                if state['restarts'] > BACKUP_MAX_RESTARTS:
+                    raise _TooManyRestarts()
+            state['remaining'] = remaining
+            # sqlite3 делает паузу (параметр sleep) только при занятой базе, поэтому
+            # окно для записи между шагами дает сама функция прогресса
+            if remaining:
+                time.sleep(BACKUP_STEP_SLEEP)
+
+        try:
+            try:
+                source.backup(target, pages=BACKUP_STEP_PAGES, progress=progress)
+            except _TooManyRestarts:
+                logger.warning("База данных часто меняется, копирование завершается одним шагом")
+                source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        return state['restarts']
+
+    def _verify(self, path):
+        """
+        Проверяет целостность копии
+
+        Raises:
+            RuntimeError: Если проверка нашла ошибки
+        """
+        conn = sqlite3.connect(path)
+        try:
+            result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+        finally:
+            conn.close()
+        if result != 'ok':
+            raise RuntimeError(f"Копия повреждена: {result}")
+
+    def _compress(self, source, target):
+        """
+        Сжимает проверенную копию в .gz
+        """
+        with open(source, 'rb') as src, gzip.open(target, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+
+    def _rotate(self):
+        """
+        Удаляет старые копии, оставляя self.keep последних
+        """
+        backups = sorted(
+            name for name in os.listdir(self.backup_dir)
+            if name.startswith(self._prefix) and (name.endswith(".db") or name.endswith(".db.gz"))
+        )
+        for name in backups[:-self.keep] if self.keep > 0 else []:
+            os.remove(os.path.join(self.backup_dir, name))
+            logger.info(f"Удалена старая резервная копия {name}")
+
+    async def start(self, interval_hours):
+        """
+        Запускает периодическое резервное копирование
+
+        Args:
+            interval_hours (float): Интервал между копиями в часах
+        """
+        self.running = True
+
+        while self.running:
+            await asyncio.sleep(interval_hours * 3600)
+            if not self.running:
+                break
+
+            trace_id_var.set(new_trace_id())
+            try:
+                await self.run()
+            except Exception as e:
+                logger.error(f"Ошибка резервного копирования: {e}")
+
+    def stop(self):
+        """
+        Останавливает периодическое резервное копирование
+        """
+        self.running = False
@@ -1,28 +1,57 @@
 import asyncio
 import logging
+import os
+import tempfile
+import time
 from datetime import datetime, timedelta
 
-from aiogram import Bot, Dispatcher, types, F
+from aiogram import Dispatcher, F
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
 from aiogram.filters.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import (
     Message, CallbackQuery, InlineKeyboardMarkup, 
-    InlineKeyboardButton
+    InlineKeyboardButton, FSInputFile
 )
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-from database import Database
-from scheduler import AppointmentScheduler
+from models import Appointment
 from keyboards import (
     get_services_keyboard, get_cancel_keyboard, 
-    get_time_slots_keyboard, get_my_appointments_keyboard
+    get_time_slots_keyboard, get_my_appointments_keyboard,
+    get_waitlist_windows_keyboard, get_soonest_slots_keyboard,
+    get_series_count_keyboard
+)
+from appointments_io import export_appointments
+from working_schedule import DAY_NAMES, minutes_to_time, parse_intervals
+from outbox import BULK
+from ics_feed import IcsFeed
+from backup import BackupJob
+from profiling import Profiler
+from loop_watchdog import LoopWatchdog
+from telegram_calendar import precompute_calendars
+from middlewares import (
+    ThrottlingMiddleware, TraceMiddleware, IdempotencyMiddleware, BackpressureMiddleware, CaptureMiddleware,
+    TenantMiddleware
+)
+from tenants import TenantProxy, current_tenant, create_registry, run_reminder_checks
+from capture import UpdateRecorder
+from logging_setup import setup_logging
+import metrics
+from config import (
+    STORAGE_BACKEND, ADMIN_IDS, WARM_UP_DAYS,
+    WAITLIST_RANGE_DAYS, WAITLIST_NOTIFY_LIMIT, SOONEST_DAYS, SOONEST_LIMIT,
+    EDIT_IN_PLACE, SERIES_OCCURRENCE_OPTIONS, LOG_LEVEL, LOG_FILE, FANOUT_PROGRESS_INTERVAL, FIND_PAGE_SIZE,
+    ICS_FEED_HOST, ICS_FEED_PORT, ICS_FEED_BASE_URL, ICS_FEED_SECRET, CAPTURE_FILE, CAPTURE_SALT,
+    BACKUP_DIR, BACKUP_INTERVAL_HOURS, BACKUP_KEEP, BACKUP_COMPRESS, PROFILE_DIR, PROFILE_MAX_SECONDS, PROFILE_TOP,
+    LOOP_LAG_INTERVAL, LOOP_LAG_THRESHOLD
 )
-from config import BOT_TOKEN
 
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
+# Настройка логирования: JSON-записи через очередь и фоновый поток
+setup_logging(LOG_LEVEL, LOG_FILE)
 logger = logging.getLogger(__name__)
 
 # Определение состояний для FSM (Finite State Machine)
@@ -33,33 +62,301 @@ class BookingStates(StatesGroup):
     confirming = State()         # Состояние подтверждения записи
     cancelling = State()         # Состояние отмены записи
 
-# Инициализация базы данных и планировщика
-db = Database('appointments.db')
-scheduler = None  # Будет инициализирован позже
+# Хранилище, планировщик и очередь отправки бизнеса, чье обновление обрабатывается
+# (один процесс может обслуживать несколько ботов, см. tenants.py)
+db = TenantProxy('db')
+scheduler = TenantProxy('scheduler')
+outbox = TenantProxy('outbox')
+ics_feed = None  # Лента календаря, создается, если задан ICS_FEED_PORT (только для одного бизнеса)
+profiler = Profiler(PROFILE_DIR, PROFILE_TOP)  # Профилирование процесса по командам /profile и /memory
+
+# Колбэки, изменяющие данные: повторное нажатие не должно создавать или удалять записи второй раз
+IDEMPOTENT_CALLBACKS = ('confirm', 'repeat_count', 'confirm_cancel', 'series_drop', 'bulk_cancel')
+
+# Колбэки создания записей: в упрощенном режиме (при перегрузке) пользователь получает
+# просьбу повторить подтверждение чуть позже
+DEGRADED_REJECTED_CALLBACKS = ('confirm', 'repeat_count')
+
+def services_keyboard(degraded=False):
+    """
+    Возвращает клавиатуру с услугами
+    
+    Args:
+        degraded (bool): Упрощенный режим - взять последнюю построенную клавиатуру,
+            не обращаясь к базе данных
+        
+    Returns:
+        InlineKeyboardMarkup: Клавиатура с услугами
+    """
+    tenant = current_tenant.get()
+    if degraded and tenant.services_keyboard is not None:
+        return tenant.services_keyboard
+    tenant.services_keyboard = get_services_keyboard(db.get_services())
+    return tenant.services_keyboard
+
+def is_admin(user_id: int) -> bool:
+    """
+    Проверяет, является ли пользователь администратором бизнеса, чей бот получил обновление
+    """
+    return user_id in current_tenant.get().admin_ids
+
+def is_process_admin(user_id: int) -> bool:
+    """
+    Проверяет, является ли пользователь администратором всего процесса (ADMIN_IDS).
+    Только им доступны команды, показывающие состояние процесса, общее для всех
+    бизнесов: метрики, профилирование и память
+    """
+    return user_id in ADMIN_IDS
 
 # Функция для отправки напоминаний
-async def send_reminder(bot: Bot, user_id: int, service_name: str, date: str, time: str):
+async def send_reminder(user_id: int, service_name: str, date: str, time: str):
     """
     Отправляет напоминание пользователю о предстоящей записи
     """
-    await bot.send_message(
+    await outbox.send(
         user_id,
         f"⏰ Напоминание!\n\n"
         f"Завтра у вас запись на {service_name}\n"
         f"Дата: {date}\n"
         f"Время: {time}\n\n"
-        f"Для отмены используйте команду /cancel"
+        f"Для отмены используйте команду /cancel",
+        lane=BULK
     )
 
-# Инициализация бота и диспетчера
-async def main():
-    # Инициализация бота и диспетчера
-    bot = Bot(token=BOT_TOKEN)
+async def notify_waitlist(appointment: Appointment):
+    """
+    Уведомляет первых пользователей из листа ожидания об освободившемся времени
+    и удаляет их заявки
+    """
+    matches = scheduler.find_waitlist_matches(appointment, WAITLIST_NOTIFY_LIMIT)
+    if not matches:
+        return
+    
+    formatted_date = appointment.date_label
+    
+    async def notify(entry):
+        # Услугу могли удалить после подачи заявки - тогда сообщаем без ее названия
+        service = db.get_service_by_id(entry['service_id'])
+        service_label = f" для услуги {service.name}" if service else ""
+        try:
+            await outbox.send(
+                entry['user_id'],
+                f"🔔 Освободилось время на {formatted_date}{service_label}!\n\n"
+                f"Успейте записаться с помощью команды /book",
+                lane=BULK
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось уведомить пользователя {entry['user_id']} из листа ожидания: {e}")
+    
+    # Отправляем уведомления одной пачкой
+    await asyncio.gather(*(notify(entry) for entry in matches))
+    db.remove_from_waitlist([entry['id'] for entry in matches])
+
+async def fan_out(chat_id: int, messages: list, title: str):
+    """
+    Рассылает сообщения через массовую полосу очереди и показывает ход рассылки,
+    редактируя одно сообщение в чате chat_id
+    
+    Args:
+        chat_id (int): Чат, в котором показывается ход рассылки
+        messages (list): Кортежи (ID получателя, текст)
+        title (str): Заголовок сообщения о ходе рассылки
+        
+    Returns:
+        tuple: (отправлено, ошибок)
+    """
+    total = len(messages)
+    progress = await outbox.send(chat_id, f"{title}: 0 из {total}")
+    
+    # Ставим все сообщения в очередь сразу: частоту отправки ограничивает сама очередь
+    tasks = [asyncio.ensure_future(outbox.send(user_id, text, lane=BULK)) for user_id, text in messages]
+    done = 0
+    failed = 0
+    reported_at = time.monotonic()
+    for task in asyncio.as_completed(tasks):
+        try:
+            await task
+        except Exception as e:
+            failed += 1
+            logger.warning(f"Не удалось отправить сообщение рассылки: {e}")
+        done += 1
+        
+        if done < total and time.monotonic() - reported_at >= FANOUT_PROGRESS_INTERVAL:
+            reported_at = time.monotonic()
+            try:
+                await outbox.edit_text(chat_id, progress.message_id, f"{title}: {done} из {total}")
+            except TelegramBadRequest:
+                pass
+    
+    try:
+        await outbox.edit_text(
+            chat_id, progress.message_id,
+            f"{title}: завершено, отправлено {total - failed}, ошибок {failed}."
+        )
+    except TelegramBadRequest:
+        pass
+    return total - failed, failed
+
+def cancellation_messages(appointments: list, search_from: datetime) -> list:
+    """
+    Готовит уведомления об отмене записей: одно сообщение на пользователя
+    со списком отмененных записей и ближайшим свободным временем
+    
+    Args:
+        appointments (list): Отмененные записи
+        search_from (datetime): С какого момента искать свободное время
+        
+    Returns:
+        list: Кортежи (ID пользователя, текст)
+    """
+    # Свободное время ищем один раз для каждой пары (услуга, длительность), а не для каждой записи
+    suggestions = {}
+    for key in {(appointment.service_id, appointment.duration) for appointment in appointments}:
+        service = db.get_service_by_id(key[0])
+        slots = scheduler.find_first_available(
+            key[1],
+            days=SOONEST_DAYS,
+            limit=SOONEST_LIMIT,
+            now=search_from,
+            service_id=key[0],
+            capacity=service.capacity if service else 1
+        )
+        suggestions[key] = ", ".join(
+            f"{datetime.strptime(date, '%Y-%m-%d').strftime('%d.%m')} {slot_time}" for date, slot_time in slots
+        )
+    
+    by_user = {}
+    for appointment in appointments:
+        by_user.setdefault(appointment.user_id, []).append(appointment)
+    
+    messages = []
+    for user_id, user_appointments in by_user.items():
+        lines = []
+        offers = []
+        for appointment in user_appointments:
+            service = db.get_service_by_id(appointment.service_id)
+            service_name = service.name if service else "Запись"
+            lines.append(f"• {service_name} - {appointment.date_label} {appointment.time}")
+            
+            suggestion = suggestions[(appointment.service_id, appointment.duration)]
+            offer = f"{service_name}: {suggestion}"
+            if suggestion and offer not in offers:
+                offers.append(offer)
+        
+        text = "❌ К сожалению, специалист не сможет вас принять, и ваши записи отменены:\n" + "\n".join(lines)
+        if offers:
+            text += "\n\nБлижайшее свободное время:\n" + "\n".join(offers)
+        text += "\n\nЧтобы записаться снова, используйте команду /book"
+        messages.append((user_id, text))
+    return messages
+
+def search_page(query: str, offset: int):
+    """
+    Готовит страницу результатов поиска записей
+    
+    Args:
+        query (str): Поисковый запрос
+        offset (int): Сколько найденных записей пропустить
+        
+    Returns:
+        tuple: (текст сообщения, клавиатура перехода между страницами или None)
+    """
+    # Запрашиваем на одну запись больше, чтобы узнать, есть ли следующая страница
+    appointments = db.search_appointments(query, limit=FIND_PAGE_SIZE + 1, offset=offset)
+    has_next = len(appointments) > FIND_PAGE_SIZE
+    appointments = appointments[:FIND_PAGE_SIZE]
+    
+    if not appointments:
+        return f"По запросу «{query}» ничего не найдено.", None
+    
+    lines = [f"🔎 «{query}», записи {offset + 1}-{offset + len(appointments)}:\n"]
+    for appointment in appointments:
+        lines.append(
+            f"#{appointment.id} {appointment.date_label} {appointment.time} - "
+            f"{appointment.service_name or 'Услуга удалена'} - "
+            f"{appointment.user_name or 'без имени'} (ID {appointment.user_id})"
+        )
+    
+    builder = InlineKeyboardBuilder()
+    if offset > 0:
+        builder.button(text="◀️ Назад", callback_data=f"find_page_{max(offset - FIND_PAGE_SIZE, 0)}")
+    if has_next:
+        builder.button(text="Дальше ▶️", callback_data=f"find_page_{offset + FIND_PAGE_SIZE}")
+    builder.adjust(2)
+    return "\n".join(lines), builder.as_markup() if offset > 0 or has_next else None
+
+# Префиксы колбэков, относящихся к процессу бронирования
+FLOW_CALLBACK_PREFIXES = ('service_', 'calendar', 'time_', 'soonest_', 'waitlist_', 'repeat_')
+
+async def current_flow_message(callback_query: CallbackQuery, state: FSMContext) -> bool:
+    """
+    Фильтр: колбэк пришел из текущего сообщения процесса бронирования,
+    а не из сообщения прошлой сессии
+    """
+    data = await state.get_data()
+    flow_message_id = data.get('flow_message_id')
+    return flow_message_id is None or flow_message_id == callback_query.message.message_id
+
+async def render(callback_query: CallbackQuery, state: FSMContext, text: str, reply_markup=None):
+    """
+    Показывает следующий шаг бронирования. В режиме EDIT_IN_PLACE редактирует
+    текущее сообщение вместо отправки нового, а если его уже нельзя изменить -
+    отправляет новое и продолжает работу с ним
+    """
+    message = callback_query.message
+    
+    if EDIT_IN_PLACE:
+        try:
+            await outbox.edit_text(message.chat.id, message.message_id, text, reply_markup=reply_markup)
+            return
+        except TelegramBadRequest as e:
+            if 'message is not modified' in str(e):
+                return
+            logger.info(f"Не удалось отредактировать сообщение {message.message_id}: {e}")
+    
+    sent = await outbox.answer(message, text, reply_markup=reply_markup)
+    await state.update_data(flow_message_id=sent.message_id)
+
+def create_dispatcher(registry, recorder=None, limits=True) -> Dispatcher:
+    """
+    Создает диспетчер с промежуточными обработчиками и обработчиками команд.
+    Один диспетчер обслуживает ботов всех бизнесов процесса
+    
+    Args:
+        registry (TenantRegistry): Бизнесы процесса
+        recorder (UpdateRecorder): Запись входящих обновлений или None
+        limits (bool): Ограничивать частоту запросов пользователей и нагрузку на диспетчер
+            (False - для воспроизведения записи на максимальной скорости, чтобы
+            ни одно обновление не было отброшено)
+        
+    Returns:
+        Dispatcher: Диспетчер, готовый к поллингу или к feed_update
+    """
     storage = MemoryStorage()
     dp = Dispatcher(storage=storage)
     
-    global scheduler
-    scheduler = AppointmentScheduler(db)
+    # Запись обновлений подключается первой, чтобы учитывать все время обработки
+    if recorder is not None:
+        dp.update.outer_middleware(CaptureMiddleware(recorder))
+    
+    # ID трассировки присваивается каждому обновлению до всех остальных обработчиков
+    dp.update.outer_middleware(TraceMiddleware())
+    
+    # Бизнес выбирается по боту, получившему обновление; его кэши загружаются при первом обращении
+    dp.update.outer_middleware(TenantMiddleware(registry))
+    
+    if limits:
+        # Ограничиваем число одновременно обрабатываемых обновлений; при перегрузке
+        # обработчики получают флаг degraded и переходят в упрощенный режим
+        dp.update.outer_middleware(BackpressureMiddleware(DEGRADED_REJECTED_CALLBACKS))
+        
+        # Ограничиваем частоту запросов до того, как они дойдут до фильтров и базы данных
+        throttling = ThrottlingMiddleware()
+        dp.message.outer_middleware(throttling)
+        dp.callback_query.outer_middleware(throttling)
+    
+    # Колбэки, которые пишут в базу, выполняются не более одного раза на сообщение
+    dp.callback_query.middleware(IdempotencyMiddleware(IDEMPOTENT_CALLBACKS))
     
     # Регистрация обработчиков команд
     @dp.message(Command("start"))
@@ -68,31 +365,47 @@ async def main():
         Обработчик команды /start
         Отправляет приветственное сообщение и инструкции по использованию бота
         """
-        await message.answer(
+        await outbox.answer(
+            message,
             "👋 Добро пожаловать в бот записи на прием!\n\n"
             "Используйте следующие команды:\n"
             "/book - забронировать время\n"
+            "/soonest - найти ближайшее свободное время\n"
             "/my_appointments - просмотреть ваши записи\n"
+            "/calendar - добавить записи в календарь телефона\n"
             "/cancel - отменить запись"
         )
 
     @dp.message(Command("book"))
-    async def cmd_book(message: Message, state: FSMContext):
+    async def cmd_book(message: Message, state: FSMContext, degraded: bool = False):
         """
         Обработчик команды /book
         Начинает процесс бронирования, показывая доступные услуги
         """
-        # Получаем список услуг из базы данных
-        services = db.get_services()
-        # Создаем клавиатуру с услугами
-        keyboard = get_services_keyboard(services)
+        # Создаем клавиатуру с услугами (при перегрузке - из кэша)
+        keyboard = services_keyboard(degraded)
         
-        await message.answer("Выберите услугу:", reply_markup=keyboard)
-        # Устанавливаем состояние выбора услуги
+        sent = await outbox.answer(message, "Выберите услугу:", reply_markup=keyboard)
+        # Устанавливаем состояние выбора услуги и сбрасываем данные прошлых сессий.
+        # Запоминаем сообщение, которое дальше будет редактироваться на каждом шаге
         await state.set_state(BookingStates.selecting_service)
+        await state.set_data({'flow_message_id': sent.message_id})
 
-    @dp.callback_query(lambda c: c.data.startswith('service_'), BookingStates.selecting_service)
-    async def process_service_selection(callback_query: CallbackQuery, state: FSMContext):
+    @dp.message(Command("soonest"))
+    async def cmd_soonest(message: Message, state: FSMContext, degraded: bool = False):
+        """
+        Обработчик команды /soonest
+        Начинает поиск ближайшего свободного времени с выбора услуги
+        """
+        keyboard = services_keyboard(degraded)
+        
+        sent = await outbox.answer(message, "Выберите услугу, и мы найдем ближайшее свободное время:", reply_markup=keyboard)
+        # Используем тот же шаг выбора услуги, что и /book, но вместо календаря покажем ближайшие слоты
+        await state.set_state(BookingStates.selecting_service)
+        await state.set_data({'soonest': True, 'flow_message_id': sent.message_id})
+
+    @dp.callback_query(lambda c: c.data.startswith('service_'), BookingStates.selecting_service, current_flow_message)
+    async def process_service_selection(callback_query: CallbackQuery, state: FSMContext, degraded: bool = False):
         """
         Обработчик выбора услуги
         Сохраняет выбранную услугу и показывает календарь для выбора даты
@@ -106,45 +419,82 @@ async def main():
         # Сохраняем выбранную услугу в состоянии
         await state.update_data(
             service_id=service_id,
-            service_name=service['name'],
-            duration=service['duration']
+            service_name=service.name,
+            duration=service.duration,
+            capacity=service.capacity
         )
+        
+        data = await state.get_data()
+        if data.get('soonest'):
+            # Ищем ближайшие свободные слоты сразу на несколько дней вперед.
+            # При перегрузке ограничиваемся днями, занятость которых уже в кэше
+            days = min(SOONEST_DAYS, WARM_UP_DAYS) if degraded else SOONEST_DAYS
+            slots = scheduler.find_first_available(
+                service.duration,
+                days=days,
+                limit=SOONEST_LIMIT,
+                service_id=service_id,
+                capacity=service.capacity
+            )
+            
+            await callback_query.answer()
+            if not slots:
+                await render(
+                    callback_query,
+                    state,
+                    f"К сожалению, в ближайшие {days} дней нет свободного времени для услуги {service.name}."
+                )
+                await state.clear()
+                return
+            
+            await render(
+                callback_query,
+                state,
+                f"Ближайшее свободное время для услуги {service.name} (Длительность: {service.duration} мин):",
+                reply_markup=get_soonest_slots_keyboard(slots)
+            )
+            await state.set_state(BookingStates.selecting_time)
+            return
 
         # Импортируем календарь только тут, чтобы избежать циклических импортов
-        from telegram_calendar import create_calendar
+        from telegram_calendar import get_calendar
         
         # Получаем текущую дату
         now = datetime.now()
         
-        # Создаем клавиатуру календаря
-        calendar_markup = create_calendar(
+        # Берем готовую клавиатуру календаря
+        calendar_markup = get_calendar(
             year=now.year,
             month=now.month,
         )
         
         await callback_query.answer()
-        await callback_query.message.answer(
-            f"Вы выбрали: {service['name']} (Длительность: {service['duration']} мин)\n\nТеперь выберите дату:",
+        await render(
+            callback_query,
+            state,
+            f"Вы выбрали: {service.name} (Длительность: {service.duration} мин)\n\nТеперь выберите дату:",
             reply_markup=calendar_markup
         )
         
         # Устанавливаем состояние выбора даты
         await state.set_state(BookingStates.selecting_date)
 
-    @dp.callback_query(lambda c: c.data.startswith('calendar'), BookingStates.selecting_date)
+    @dp.callback_query(lambda c: c.data.startswith('calendar'), BookingStates.selecting_date, current_flow_message)
     async def process_calendar(callback_query: CallbackQuery, state: FSMContext):
         """
         Обработчик выбора даты в календаре
         Проверяет выбранную дату и показывает доступные временные слоты
         """
-        from telegram_calendar import process_calendar_selection, create_calendar
+        from telegram_calendar import process_calendar_selection, get_calendar
         
         # Обрабатываем данные колбэка календаря
         result, key, step = process_calendar_selection(callback_query.data)
         
         if not result and key:
             # Пользователь переключил месяц или год, обновляем календарь
-            await callback_query.message.edit_reply_markup(
+            await outbox.edit_reply_markup(
+                callback_query.message.chat.id,
+                callback_query.message.message_id,
                 reply_markup=key
             )
             return
@@ -168,27 +518,44 @@ async def main():
             duration = data['duration']
             
             # Получаем доступные временные слоты для выбранной даты и услуги
-            available_slots = scheduler.get_available_slots(
-                selected_date, 
-                duration
+            # При переносе текущее время записи не считается занятым
+            available_slots = scheduler.get_slot_availability(
+                selected_date,
+                duration,
+                service_id,
+                data['capacity'],
+                exclude=data.get('reschedule_from')
             )
             
             if not available_slots:
+                # Добавляем к календарю кнопку записи в лист ожидания
+                calendar_markup = get_calendar(
+                    year=selected_date.year,
+                    month=selected_date.month
+                )
+                markup = InlineKeyboardMarkup(
+                    inline_keyboard=calendar_markup.inline_keyboard + [[
+                        InlineKeyboardButton(text="🔔 Встать в лист ожидания", callback_data="waitlist_join")
+                    ]]
+                )
+                
                 await callback_query.answer()
-                await callback_query.message.answer(
-                    "К сожалению, на выбранную дату нет доступных слотов. Пожалуйста, выберите другую дату.",
-                    reply_markup=create_calendar(
-                        year=selected_date.year,
-                        month=selected_date.month
-                    )
+                await render(
+                    callback_query,
+                    state,
+                    "К сожалению, на выбранную дату нет доступных слотов. Пожалуйста, выберите другую дату "
+                    "или встаньте в лист ожидания - мы сообщим, когда время освободится.",
+                    reply_markup=markup
                 )
                 return
             
             # Создаем клавиатуру с доступными временными слотами
-            time_slots_markup = get_time_slots_keyboard(available_slots)
+            time_slots_markup = get_time_slots_keyboard(available_slots, data['capacity'])
             
             await callback_query.answer()
-            await callback_query.message.answer(
+            await render(
+                callback_query,
+                state,
                 f"Выбранная дата: {selected_date.strftime('%d.%m.%Y')}\n\nДоступные временные слоты:",
                 reply_markup=time_slots_markup
             )
@@ -196,7 +563,61 @@ async def main():
             # Устанавливаем состояние выбора времени
             await state.set_state(BookingStates.selecting_time)
 
-    @dp.callback_query(lambda c: c.data.startswith('time_'), BookingStates.selecting_time)
+    @dp.callback_query(F.data == "waitlist_join", BookingStates.selecting_date, current_flow_message)
+    async def process_waitlist_join(callback_query: CallbackQuery, state: FSMContext):
+        """
+        Обработчик кнопки листа ожидания
+        Предлагает выбрать удобное окно времени
+        """
+        await callback_query.answer()
+        await render(
+            callback_query,
+            state,
+            "Выберите удобное время:",
+            reply_markup=get_waitlist_windows_keyboard()
+        )
+
+    @dp.callback_query(lambda c: c.data.startswith('waitlist_window_'), BookingStates.selecting_date, current_flow_message)
+    async def process_waitlist_window(callback_query: CallbackQuery, state: FSMContext):
+        """
+        Обработчик выбора окна времени для листа ожидания
+        Сохраняет заявку и завершает процесс бронирования
+        """
+        time_from, time_to = map(int, callback_query.data.split('_')[2:4])
+        
+        data = await state.get_data()
+        date_from = datetime.strptime(data['selected_date'], "%Y-%m-%d")
+        date_to = date_from + timedelta(days=WAITLIST_RANGE_DAYS)
+        
+        entry_id = db.add_to_waitlist(
+            user_id=callback_query.from_user.id,
+            service_id=data['service_id'],
+            duration=data['duration'],
+            date_from=date_from.strftime("%Y-%m-%d"),
+            date_to=date_to.strftime("%Y-%m-%d"),
+            time_from=time_from,
+            time_to=time_to
+        )
+        
+        await callback_query.answer()
+        if entry_id:
+            await render(
+                callback_query,
+                state,
+                f"🔔 Вы в листе ожидания на {data['service_name']} "
+                f"с {date_from.strftime('%d.%m.%Y')} по {date_to.strftime('%d.%m.%Y')}.\n"
+                f"Мы сообщим, как только освободится подходящее время."
+            )
+        else:
+            await render(
+                callback_query,
+                state,
+                "❌ Не удалось добавить вас в лист ожидания. Пожалуйста, попробуйте снова."
+            )
+        
+        await state.clear()
+
+    @dp.callback_query(lambda c: c.data.startswith('time_'), BookingStates.selecting_time, current_flow_message)
     async def process_time_selection(callback_query: CallbackQuery, state: FSMContext):
         """
         Обработчик выбора временного слота
@@ -207,21 +628,67 @@ async def main():
         
         # Сохраняем выбранное время в состоянии
         await state.update_data(selected_time=selected_time)
+        
+        await request_confirmation(callback_query, state)
+
+    @dp.callback_query(lambda c: c.data.startswith('soonest_'), BookingStates.selecting_time, current_flow_message)
+    async def process_soonest_selection(callback_query: CallbackQuery, state: FSMContext):
+        """
+        Обработчик выбора одного из ближайших свободных слотов
+        Сохраняет дату и время и запрашивает подтверждение бронирования
+        """
+        _, selected_date, selected_time = callback_query.data.split('_')
+        
+        await state.update_data(selected_date=selected_date, selected_time=selected_time)
+        
+        await request_confirmation(callback_query, state)
+
+    async def request_confirmation(callback_query: CallbackQuery, state: FSMContext):
+        """
+        Показывает выбранные услугу, дату и время и запрашивает подтверждение бронирования
+        """
         data = await state.get_data()
         service_name = data['service_name']
         selected_date = data['selected_date']
+        selected_time = data['selected_time']
         
         # Форматируем дату для отображения
         formatted_date = datetime.strptime(selected_date, "%Y-%m-%d").strftime("%d.%m.%Y")
         
+        if data.get('reschedule_id'):
+            # Перенос подтверждается без повторяющейся серии
+            builder = InlineKeyboardBuilder()
+            builder.button(text="Перенести", callback_data="confirm")
+            builder.button(text="Отмена", callback_data="cancel")
+            builder.adjust(2)
+            
+            old_datetime = datetime.strptime(data['reschedule_from'], "%Y-%m-%d %H:%M")
+            await callback_query.answer()
+            await render(
+                callback_query,
+                state,
+                f"Пожалуйста, подтвердите перенос записи:\n\n"
+                f"Услуга: {service_name}\n"
+                f"Было: {old_datetime.strftime('%d.%m.%Y %H:%M')}\n"
+                f"Станет: {formatted_date} {selected_time}\n\n"
+                f"Всё верно?",
+                reply_markup=builder.as_markup()
+            )
+            await state.set_state(BookingStates.confirming)
+            return
+        
         # Создаем клавиатуру для подтверждения бронирования
         builder = InlineKeyboardBuilder()
         builder.button(text="Подтвердить", callback_data="confirm")
         builder.button(text="Отмена", callback_data="cancel")
-        builder.adjust(2)  # Размещаем кнопки в один ряд
+        builder.button(text="🔁 Каждую неделю", callback_data="repeat_1")
+        builder.button(text="🔁 Раз в 2 недели", callback_data="repeat_2")
+        builder.adjust(2)  # Размещаем кнопки по две в ряд
         
         await callback_query.answer()
-        await callback_query.message.answer(
+        await render(
+            callback_query,
+            state,
             f"Пожалуйста, подтвердите бронирование:\n\n"
             f"Услуга: {service_name}\n"
             f"Дата: {formatted_date}\n"
@@ -233,7 +700,7 @@ async def main():
         # Устанавливаем состояние подтверждения
         await state.set_state(BookingStates.confirming)
 
-    @dp.callback_query(F.data == "confirm", BookingStates.confirming)
+    @dp.callback_query(F.data == "confirm", BookingStates.confirming, current_flow_message)
     async def process_confirmation(callback_query: CallbackQuery, state: FSMContext):
         """
         Обработчик подтверждения бронирования
@@ -250,6 +717,10 @@ async def main():
         selected_time = data['selected_time']
         duration = data['duration']
         
+        if data.get('reschedule_id'):
+            await confirm_reschedule(callback_query, state, data)
+            return
+        
         # Форматируем дату и время для сохранения в базе данных
         appointment_datetime = f"{selected_date} {selected_time}"
         
@@ -259,18 +730,33 @@ async def main():
             user_name=user_name,
             service_id=service_id,
             appointment_datetime=appointment_datetime,
-            duration=duration
+            duration=duration,
+            capacity=data['capacity']
         )
         
         # Форматируем дату для отображения
         formatted_date = datetime.strptime(selected_date, "%Y-%m-%d").strftime("%d.%m.%Y")
         
+        if appointment_id is None:
+            await callback_query.answer()
+            await render(
+                callback_query,
+                state,
+                f"❌ Не удалось записаться на {formatted_date} в {selected_time}: "
+                f"это время уже занято.\n"
+                f"Чтобы выбрать другое время, используйте команду /book."
+            )
+            await state.clear()
+            return
+        
         # Планируем напоминание о записи
         reminder_date = datetime.strptime(appointment_datetime, "%Y-%m-%d %H:%M") - timedelta(days=1)
         scheduler.schedule_reminder(appointment_id, user_id, service_name, formatted_date, selected_time, reminder_date)
         
         await callback_query.answer()
-        await callback_query.message.answer(
+        await render(
+            callback_query,
+            state,
             f"✅ Запись успешно создана!\n\n"
             f"Услуга: {service_name}\n"
             f"Дата: {formatted_date}\n"
@@ -282,20 +768,153 @@ async def main():
         # Сбрасываем состояние
         await state.clear()
 
-    @dp.callback_query(F.data == "cancel", BookingStates.confirming)
+    async def confirm_reschedule(callback_query: CallbackQuery, state: FSMContext, data: dict):
+        """
+        Переносит запись на выбранное время. Запись и напоминание меняются одной
+        транзакцией: если время уже заняли, запись остается на старом месте
+        """
+        await callback_query.answer()
+        
+        appointment = db.get_appointment_by_id(data['reschedule_id'])
+        if not appointment or appointment.user_id != callback_query.from_user.id:
+            await render(callback_query, state, "❌ Запись не найдена. Возможно, она уже отменена.")
+            await state.clear()
+            return
+        
+        new_datetime = datetime.strptime(f"{data['selected_date']} {data['selected_time']}", "%Y-%m-%d %H:%M")
+        result = scheduler.reschedule(appointment, new_datetime, data['capacity'])
+        
+        if result is None:
+            await render(
+                callback_query,
+                state,
+                f"❌ Это время уже занято. Ваша запись осталась на {appointment.date_label} в {appointment.time}.\n"
+                f"Чтобы выбрать другое время, используйте команду /my_appointments."
+            )
+            await state.clear()
+            return
+        
+        old, new = result
+        await render(
+            callback_query,
+            state,
+            f"✅ Запись перенесена!\n\n"
+            f"Услуга: {data['service_name']}\n"
+            f"Дата: {new.date_label}\n"
+            f"Время: {new.time}\n\n"
+            f"Напоминание придет за день до нового времени."
+        )
+        await state.clear()
+        
+        # Старое время освободилось - сообщаем листу ожидания
+        await notify_waitlist(old)
+
+    @dp.callback_query(lambda c: c.data.startswith('repeat_') and c.data.count('_') == 1, BookingStates.confirming, current_flow_message)
+    async def process_repeat_selection(callback_query: CallbackQuery, state: FSMContext):
+        """
+        Обработчик выбора повторяющейся записи
+        Сохраняет интервал повторения и предлагает выбрать количество записей
+        """
+        interval_weeks = int(callback_query.data.split('_')[1])
+        await state.update_data(repeat_weeks=interval_weeks)
+        
+        await callback_query.answer()
+        await render(
+            callback_query,
+            state,
+            f"{'Каждую неделю' if interval_weeks == 1 else f'Раз в {interval_weeks} недели'}. "
+            f"Сколько записей создать?",
+            reply_markup=get_series_count_keyboard(SERIES_OCCURRENCE_OPTIONS)
+        )
+
+    @dp.callback_query(lambda c: c.data.startswith('repeat_count_'), BookingStates.confirming, current_flow_message)
+    async def process_series_confirmation(callback_query: CallbackQuery, state: FSMContext):
+        """
+        Обработчик выбора количества повторений
+        Создает серию записей с напоминаниями одной транзакцией
+        """
+        count = int(callback_query.data.split('_')[2])
+        user_id = callback_query.from_user.id
+        user_name = callback_query.from_user.username or f"{callback_query.from_user.first_name} {callback_query.from_user.last_name or ''}"
+        
+        data = await state.get_data()
+        first_datetime = datetime.strptime(f"{data['selected_date']} {data['selected_time']}", "%Y-%m-%d %H:%M")
+        
+        result = scheduler.book_series(
+            user_id=user_id,
+            user_name=user_name,
+            service_id=data['service_id'],
+            duration=data['duration'],
+            first_datetime=first_datetime,
+            interval_weeks=data['repeat_weeks'],
+            count=count,
+            capacity=data['capacity']
+        )
+        
+        await callback_query.answer()
+        
+        if not result['appointments']:
+            await render(
+                callback_query,
+                state,
+                "❌ Не удалось создать серию: все выбранные даты заняты. Попробуйте другое время: /book"
+            )
+            await state.clear()
+            return
+        
+        text = (
+            f"✅ Серия записей создана!\n\n"
+            f"Услуга: {data['service_name']}\n"
+            f"Время: {data['selected_time']}\n"
+            f"Даты: " + ", ".join(
+                appointment.day_label for appointment in result['appointments']
+            )
+        )
+        if result['conflicts']:
+            text += "\n\nЗанято, запись не создана: " + ", ".join(
+                datetime.strptime(conflict, "%Y-%m-%d %H:%M").strftime("%d.%m") for conflict in result['conflicts']
+            )
+        text += "\n\nЧтобы отменить всю серию, используйте команду /cancel."
+        
+        await render(callback_query, state, text)
+        await state.clear()
+
+    @dp.callback_query(F.data == "cancel", BookingStates.confirming, current_flow_message)
     async def process_cancel_confirmation(callback_query: CallbackQuery, state: FSMContext):
         """
         Обработчик отмены во время подтверждения бронирования
         Отменяет процесс бронирования и сбрасывает состояние
         """
+        data = await state.get_data()
         await callback_query.answer()
-        await callback_query.message.answer(
-            "❌ Бронирование отменено. Чтобы начать заново, используйте команду /book."
+        await render(
+            callback_query,
+            state,
+            "Перенос отменен, ваша запись осталась без изменений." if data.get('reschedule_id')
+            else "❌ Бронирование отменено. Чтобы начать заново, используйте команду /book."
         )
         
         # Сбрасываем состояние
         await state.clear()
 
+    @dp.callback_query(
+        lambda c: c.data in ('confirm', 'cancel') or c.data.startswith(FLOW_CALLBACK_PREFIXES)
+    )
+    async def process_stale_flow_callback(callback_query: CallbackQuery):
+        """
+        Обработчик нажатий в сообщениях прошлых сессий бронирования
+        Заменяет устаревшее меню на подсказку одним редактированием
+        """
+        await callback_query.answer()
+        try:
+            await outbox.edit_text(
+                callback_query.message.chat.id,
+                callback_query.message.message_id,
+                "⌛ Это меню устарело. Чтобы записаться, используйте команду /book."
+            )
+        except TelegramBadRequest:
+            pass
+
     @dp.message(Command("my_appointments"))
     async def cmd_my_appointments(message: Message):
         """
@@ -308,26 +927,83 @@ async def main():
         appointments = db.get_user_appointments(user_id)
         
         if not appointments:
-            await message.answer("У вас нет активных записей.")
+            await outbox.answer(message, "У вас нет активных записей.")
             return
         
         # Создаем текст сообщения со списком записей
         appointments_text = "Ваши записи:\n\n"
         
         for idx, appointment in enumerate(appointments, 1):
-            service_name = db.get_service_by_id(appointment['service_id'])['name']
-            appointment_datetime = datetime.strptime(appointment['appointment_datetime'], "%Y-%m-%d %H:%M")
-            formatted_date = appointment_datetime.strftime("%d.%m.%Y")
-            formatted_time = appointment_datetime.strftime("%H:%M")
+            service_name = db.get_service_by_id(appointment.service_id).name
             
             appointments_text += f"{idx}. {service_name}\n" \
-                               f"   Дата: {formatted_date}\n" \
-                               f"   Время: {formatted_time}\n\n"
+                               f"   Дата: {appointment.date_label}\n" \
+                               f"   Время: {appointment.time}\n\n"
         
         # Создаем клавиатуру для отмены записей
         keyboard = get_my_appointments_keyboard(appointments)
         
-        await message.answer(appointments_text, reply_markup=keyboard)
+        await outbox.answer(message, appointments_text, reply_markup=keyboard)
+
+    @dp.callback_query(lambda c: c.data.startswith('reschedule_'))
+    async def process_reschedule_button(callback_query: CallbackQuery, state: FSMContext):
+        """
+        Обработчик кнопки переноса записи
+        Начинает процесс выбора новой даты и времени для той же услуги
+        """
+        appointment_id = int(callback_query.data.split('_')[1])
+        appointment = db.get_appointment_by_id(appointment_id)
+        
+        if not appointment:
+            await callback_query.answer(text="Запись не найдена!")
+            return
+        
+        if appointment.user_id != callback_query.from_user.id:
+            await callback_query.answer(text="Эта запись не принадлежит вам!")
+            return
+        
+        service = db.get_service_by_id(appointment.service_id)
+        
+        from telegram_calendar import get_calendar
+        now = datetime.now()
+        
+        await callback_query.answer()
+        sent = await outbox.answer(
+            callback_query.message,
+            f"Перенос записи: {service.name}, {appointment.date_label} в {appointment.time}\n\n"
+            f"Выберите новую дату:",
+            reply_markup=get_calendar(year=now.year, month=now.month)
+        )
+        
+        # Дальше используются те же шаги выбора даты и времени, что и в /book
+        await state.set_state(BookingStates.selecting_date)
+        await state.set_data({
+            'flow_message_id': sent.message_id,
+            'reschedule_id': appointment.id,
+            'reschedule_from': appointment.appointment_datetime,
+            'service_id': service.id,
+            'service_name': service.name,
+            'duration': appointment.duration,
+            'capacity': service.capacity,
+        })
+
+    @dp.message(Command("calendar"))
+    async def cmd_calendar(message: Message):
+        """
+        Обработчик команды /calendar
+        Отправляет персональную ссылку на календарь с записями пользователя
+        """
+        if ics_feed is None:
+            await outbox.answer(message, "Подписка на календарь сейчас недоступна.")
+            return
+        
+        await outbox.answer(
+            message,
+            "Добавьте эту ссылку в приложение календаря как подписку - "
+            "ваши записи будут появляться и исчезать автоматически:\n\n"
+            f"{ics_feed.url(message.from_user.id)}\n\n"
+            "Не пересылайте ссылку: по ней видны все ваши записи."
+        )
 
     @dp.callback_query(lambda c: c.data.startswith('cancel_appointment_'))
     async def process_cancel_appointment_button(callback_query: CallbackQuery):
@@ -346,17 +1022,12 @@ async def main():
             return
         
         # Проверяем, что запись принадлежит текущему пользователю
-        if appointment['user_id'] != callback_query.from_user.id:
+        if appointment.user_id != callback_query.from_user.id:
             await callback_query.answer(text="Эта запись не принадлежит вам!")
             return
         
         # Получаем информацию об услуге
-        service = db.get_service_by_id(appointment['service_id'])
-        
-        # Форматируем дату и время для отображения
-        appointment_datetime = datetime.strptime(appointment['appointment_datetime'], "%Y-%m-%d %H:%M")
-        formatted_date = appointment_datetime.strftime("%d.%m.%Y")
-        formatted_time = appointment_datetime.strftime("%H:%M")
+        service = db.get_service_by_id(appointment.service_id)
         
         # Создаем клавиатуру для подтверждения отмены
         builder = InlineKeyboardBuilder()
@@ -365,11 +1036,12 @@ async def main():
         builder.adjust(2)  # Размещаем кнопки в один ряд
         
         await callback_query.answer()
-        await callback_query.message.answer(
+        await outbox.answer(
+            callback_query.message,
             f"Вы уверены, что хотите отменить запись?\n\n"
-            f"Услуга: {service['name']}\n"
-            f"Дата: {formatted_date}\n"
-            f"Время: {formatted_time}",
+            f"Услуга: {service.name}\n"
+            f"Дата: {appointment.date_label}\n"
+            f"Время: {appointment.time}",
             reply_markup=builder.as_markup()
         )
 
@@ -382,20 +1054,71 @@ async def main():
         # Извлекаем ID записи из данных колбэка
         appointment_id = int(callback_query.data.split('_')[2])
         
+        # Запоминаем запись, чтобы после удаления найти подходящие заявки листа ожидания
+        appointment = db.get_appointment_by_id(appointment_id)
+        
         # Удаляем запись из базы данных
         success = db.delete_appointment(appointment_id)
         
         if success:
             await callback_query.answer()
-            await callback_query.message.answer(
+            await outbox.answer(
+                callback_query.message,
                 "✅ Запись успешно отменена."
             )
+            
+            if appointment:
+                await notify_waitlist(appointment)
         else:
             await callback_query.answer()
-            await callback_query.message.answer(
+            await outbox.answer(
+                callback_query.message,
                 "❌ Произошла ошибка при отмене записи. Пожалуйста, попробуйте снова."
             )
 
+    @dp.callback_query(lambda c: c.data.startswith('series_ask_'))
+    async def process_cancel_series_button(callback_query: CallbackQuery):
+        """
+        Обработчик кнопки отмены серии записей
+        Запрашивает подтверждение отмены всей серии
+        """
+        series_id = int(callback_query.data.split('_')[2])
+        
+        builder = InlineKeyboardBuilder()
+        builder.button(text="Да, отменить серию", callback_data=f"series_drop_{series_id}")
+        builder.button(text="Нет, оставить", callback_data="cancel_confirmation")
+        builder.adjust(2)  # Размещаем кнопки в один ряд
+        
+        await callback_query.answer()
+        await outbox.answer(
+            callback_query.message,
+            "Вы уверены, что хотите отменить все будущие записи этой серии?",
+            reply_markup=builder.as_markup()
+        )
+
+    @dp.callback_query(lambda c: c.data.startswith('series_drop_'))
+    async def process_confirm_cancel_series(callback_query: CallbackQuery):
+        """
+        Обработчик подтверждения отмены серии
+        Удаляет все будущие записи серии и их напоминания одной операцией
+        """
+        series_id = int(callback_query.data.split('_')[2])
+        
+        cancelled = db.delete_appointment_series(series_id, callback_query.from_user.id)
+        
+        await callback_query.answer()
+        if cancelled:
+            await outbox.answer(
+                callback_query.message,
+                f"✅ Серия отменена, удалено записей: {len(cancelled)}."
+            )
+            await asyncio.gather(*(notify_waitlist(appointment) for appointment in cancelled))
+        else:
+            await outbox.answer(
+                callback_query.message,
+                "❌ В этой серии нет будущих записей для отмены."
+            )
+
     @dp.callback_query(F.data == "cancel_confirmation")
     async def process_cancel_confirmation_cancel(callback_query: CallbackQuery):
         """
@@ -403,7 +1126,8 @@ async def main():
         Отменяет процесс отмены и отправляет сообщение пользователю
         """
         await callback_query.answer()
-        await callback_query.message.answer(
+        await outbox.answer(
+            callback_query.message,
             "Отмена записи отменена. Ваша запись сохранена."
         )
 
@@ -419,26 +1143,438 @@ async def main():
         appointments = db.get_user_appointments(user_id)
         
         if not appointments:
-            await message.answer("У вас нет активных записей для отмены.")
+            await outbox.answer(message, "У вас нет активных записей для отмены.")
             return
         
         # Создаем текст сообщения со списком записей
         appointments_text = "Выберите запись для отмены:\n\n"
         
         for idx, appointment in enumerate(appointments, 1):
-            service_name = db.get_service_by_id(appointment['service_id'])['name']
-            appointment_datetime = datetime.strptime(appointment['appointment_datetime'], "%Y-%m-%d %H:%M")
-            formatted_date = appointment_datetime.strftime("%d.%m.%Y")
-            formatted_time = appointment_datetime.strftime("%H:%M")
+            service_name = db.get_service_by_id(appointment.service_id).name
             
             appointments_text += f"{idx}. {service_name}\n" \
-                               f"   Дата: {formatted_date}\n" \
-                               f"   Время: {formatted_time}\n\n"
+                               f"   Дата: {appointment.date_label}\n" \
+                               f"   Время: {appointment.time}\n\n"
         
         # Создаем клавиатуру для отмены записей
         keyboard = get_cancel_keyboard(appointments)
         
-        await message.answer(appointments_text, reply_markup=keyboard)
+        await outbox.answer(message, appointments_text, reply_markup=keyboard)
+
+    @dp.message(Command("export"))
+    async def cmd_export(message: Message):
+        """
+        Обработчик команды /export (только для администраторов)
+        Выгружает записи за период в CSV или ICS: /export 2024-01-01 2024-12-31 [csv|ics]
+        """
+        if not is_admin(message.from_user.id):
+            return
+        
+        args = message.text.split()[1:]
+        try:
+            start_date, end_date = args[0], args[1]
+            datetime.strptime(start_date, "%Y-%m-%d")
+            datetime.strptime(end_date, "%Y-%m-%d")
+        except (IndexError, ValueError):
+            await outbox.answer(message, "Использование: /export ГГГГ-ММ-ДД ГГГГ-ММ-ДД [csv|ics]")
+            return
+        file_format = 'ics' if len(args) > 2 and args[2].lower() == 'ics' else 'csv'
+        
+        # Пишем файл потоково в отдельном потоке, чтобы не блокировать цикл событий
+        fd, path = tempfile.mkstemp(suffix=f".{file_format}")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8', newline='') as file:
+                count = await asyncio.to_thread(
+                    export_appointments, db, start_date, end_date, file, file_format
+                )
+            await outbox.send_document(
+                message.chat.id,
+                FSInputFile(path, filename=f"appointments_{start_date}_{end_date}.{file_format}"),
+                caption=f"Экспортировано записей: {count}"
+            )
+        finally:
+            os.remove(path)
+
+    @dp.message(Command("stats"))
+    async def cmd_stats(message: Message):
+        """
+        Обработчик команды /stats (только для администраторов)
+        Показывает статистику за день или неделю: /stats [day|week] [ГГГГ-ММ-ДД]
+        """
+        if not is_admin(message.from_user.id):
+            return
+        
+        args = message.text.split()[1:]
+        period = args[0] if args and args[0] in ('day', 'week') else 'day'
+        try:
+            day = datetime.strptime(args[-1], "%Y-%m-%d") if args and args[-1] not in ('day', 'week') else datetime.now()
+        except ValueError:
+            await outbox.answer(message, "Использование: /stats [day|week] [ГГГГ-ММ-ДД]")
+            return
+        
+        if period == 'week':
+            start = day - timedelta(days=day.weekday())
+            end = start + timedelta(days=6)
+            title = f"Статистика за неделю {start.strftime('%d.%m.%Y')} - {end.strftime('%d.%m.%Y')}"
+        else:
+            start = end = day
+            title = f"Статистика за {day.strftime('%d.%m.%Y')}"
+        
+        stats = db.get_stats(start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d"))
+        
+        text = f"📊 {title}\n\n"
+        if not stats['services']:
+            text += "Записей нет.\n"
+        for service in stats['services']:
+            text += f"{service['name']}: {service['bookings']} зап., {service['revenue']:g} грн.\n"
+        
+        total_revenue = sum(service['revenue'] for service in stats['services'])
+        text += f"\nВыручка: {total_revenue:g} грн.\n"
+        if stats['working_minutes']:
+            occupancy = stats['booked_minutes'] / stats['working_minutes'] * 100
+            text += f"Загрузка: {occupancy:.0f}% ({stats['booked_minutes']} из {stats['working_minutes']} мин)"
+        else:
+            text += "Загрузка: нерабочий период"
+        
+        await outbox.answer(message, text)
+
+    @dp.message(Command("rebuild_stats"))
+    async def cmd_rebuild_stats(message: Message):
+        """
+        Обработчик команды /rebuild_stats (только для администраторов)
+        Полностью пересчитывает сводную статистику по всем записям
+        """
+        if not is_admin(message.from_user.id):
+            return
+        
+        success = await asyncio.to_thread(db.rebuild_stats)
+        await outbox.answer(message, "✅ Статистика пересчитана." if success else "❌ Не удалось пересчитать статистику.")
+
+    @dp.message(Command("capacity"))
+    async def cmd_capacity(message: Message):
+        """
+        Обработчик команды /capacity (только для администраторов)
+        Изменяет вместимость услуги для групповых занятий: /capacity ID_услуги количество
+        """
+        if not is_admin(message.from_user.id):
+            return
+        
+        args = message.text.split()[1:]
+        try:
+            service_id, capacity = int(args[0]), int(args[1])
+            if capacity < 1:
+                raise ValueError
+        except (IndexError, ValueError):
+            await outbox.answer(message, "Использование: /capacity ID_услуги количество (не меньше 1)")
+            return
+        
+        if db.set_service_capacity(service_id, capacity):
+            await outbox.answer(message, f"✅ Вместимость услуги {service_id}: {capacity}.")
+        else:
+            await outbox.answer(message, "❌ Услуга не найдена.")
+
+    @dp.message(Command("schedule"))
+    async def cmd_schedule(message: Message):
+        """
+        Обработчик команды /schedule (только для администраторов)
+        Показывает и изменяет расписание работы:
+        /schedule - текущее расписание
+        /schedule 0 09:00-13:00 14:00-18:00 - часы дня недели (0 = Понедельник), off - выходной
+        /schedule 2024-12-31 10:00-14:00 - особое расписание на дату, off - праздник, reset - отменить
+        """
+        if not is_admin(message.from_user.id):
+            return
+        
+        args = message.text.split()[1:]
+        
+        if not args:
+            schedule = db.get_schedule()
+            
+            def format_intervals(intervals):
+                return ", ".join(
+                    f"{minutes_to_time(start)}-{minutes_to_time(end)}" for start, end in intervals
+                ) or "выходной"
+            
+            text = "🗓 Расписание:\n"
+            for day, day_name in enumerate(DAY_NAMES):
+                text += f"{day} {day_name}: {format_intervals(schedule.weekly.get(day, ()))}\n"
+            
+            today = datetime.now().strftime("%Y-%m-%d")
+            upcoming = sorted(date for date in schedule.overrides if date >= today)
+            if upcoming:
+                text += "\nОсобые дни:\n"
+                for date in upcoming:
+                    text += f"{date}: {format_intervals(schedule.overrides[date])}\n"
+            
+            await outbox.answer(message, text)
+            return
+        
+        usage = (
+            "Использование:\n"
+            "/schedule 0 09:00-13:00 14:00-18:00 (день недели 0-6 или off)\n"
+            "/schedule ГГГГ-ММ-ДД 10:00-14:00 (или off, reset)"
+        )
+        target, values = args[0], args[1:]
+        try:
+            if not values:
+                raise ValueError
+            if values == ['reset']:
+                intervals = None
+            elif values == ['off']:
+                intervals = []
+            else:
+                intervals = parse_intervals(values)
+        except ValueError:
+            await outbox.answer(message, usage)
+            return
+        
+        if target.isdigit() and int(target) < 7 and intervals is not None:
+            success = db.set_weekly_hours(int(target), intervals)
+        else:
+            try:
+                datetime.strptime(target, "%Y-%m-%d")
+            except ValueError:
+                await outbox.answer(message, usage)
+                return
+            if intervals is None:
+                success = db.clear_date_override(target)
+            else:
+                success = db.set_date_override(target, intervals)
+        
+        await outbox.answer(message, "✅ Расписание обновлено." if success else "❌ Не удалось изменить расписание.")
+
+    @dp.message(Command("broadcast"))
+    async def cmd_broadcast(message: Message):
+        """
+        Обработчик команды /broadcast (только для администраторов)
+        Рассылает сообщение всем клиентам через массовую полосу очереди,
+        не мешая интерактивным ответам: /broadcast текст
+        """
+        if not is_admin(message.from_user.id):
+            return
+        
+        text = message.text.partition(' ')[2].strip()
+        if not text:
+            await outbox.answer(message, "Использование: /broadcast текст сообщения")
+            return
+        
+        user_ids = db.get_client_ids()
+        await fan_out(message.chat.id, [(user_id, text) for user_id in user_ids], "📣 Рассылка")
+
+    @dp.message(Command("find"))
+    async def cmd_find(message: Message, state: FSMContext):
+        """
+        Обработчик команды /find (только для администраторов)
+        Ищет записи по имени клиента и названию услуги: /find текст
+        """
+        if not is_admin(message.from_user.id):
+            return
+        
+        query = message.text.partition(' ')[2].strip()
+        if not query:
+            await outbox.answer(message, "Использование: /find имя клиента или название услуги (можно начало слова)")
+            return
+        
+        # Запрос запоминаем для перехода между страницами: в данные колбэка он может не поместиться
+        await state.update_data(find_query=query)
+        text, keyboard = search_page(query, 0)
+        await outbox.answer(message, text, reply_markup=keyboard)
+
+    @dp.callback_query(lambda c: c.data.startswith('find_page_'))
+    async def process_find_page(callback_query: CallbackQuery, state: FSMContext):
+        """
+        Обработчик перехода между страницами результатов поиска
+        """
+        if not is_admin(callback_query.from_user.id):
+            await callback_query.answer()
+            return
+        
+        query = (await state.get_data()).get('find_query')
+        if not query:
+            await callback_query.answer("Поиск устарел, повторите команду /find", show_alert=True)
+            return
+        
+        text, keyboard = search_page(query, int(callback_query.data.split('_')[2]))
+        await callback_query.answer()
+        try:
+            await outbox.edit_text(
+                callback_query.message.chat.id, callback_query.message.message_id, text, reply_markup=keyboard
+            )
+        except TelegramBadRequest:
+            pass
+
+    @dp.message(Command("cancel_day"))
+    async def cmd_cancel_day(message: Message):
+        """
+        Обработчик команды /cancel_day (только для администраторов)
+        Отменяет все записи за день или часть дня и уведомляет клиентов:
+        /cancel_day ГГГГ-ММ-ДД [ЧЧ:ММ-ЧЧ:ММ]
+        """
+        if not is_admin(message.from_user.id):
+            return
+        
+        args = message.text.split()[1:]
+        try:
+            date = datetime.strptime(args[0], "%Y-%m-%d").strftime("%Y-%m-%d")
+            start, end = parse_intervals(args[1:2])[0] if len(args) > 1 else ("00:00", "24:00")
+        except (IndexError, ValueError):
+            await outbox.answer(
+                message,
+                "Использование: /cancel_day ГГГГ-ММ-ДД [ЧЧ:ММ-ЧЧ:ММ]\n"
+                "Например: /cancel_day 2024-05-10 или /cancel_day 2024-05-10 09:00-13:00"
+            )
+            return
+        
+        appointments = [
+            appointment for appointment in db.get_appointments_by_date_range(date, date)
+            if start <= appointment.time < end
+        ]
+        if not appointments:
+            await outbox.answer(message, "В этот период нет записей.")
+            return
+        
+        clients = len({appointment.user_id for appointment in appointments})
+        builder = InlineKeyboardBuilder()
+        builder.button(
+            text=f"Отменить {len(appointments)} записей",
+            callback_data=f"bulk_cancel_{date}_{start.replace(':', '')}_{end.replace(':', '')}"
+        )
+        await outbox.answer(
+            message,
+            f"Будут отменены все записи {date} с {start} до {end}: {len(appointments)} записей, "
+            f"{clients} клиентов. Клиенты получат уведомление с ближайшим свободным временем.\n\n"
+            f"Не забудьте закрыть этот период командой /schedule, чтобы на него нельзя было записаться.",
+            reply_markup=builder.as_markup()
+        )
+
+    @dp.callback_query(lambda c: c.data.startswith('bulk_cancel_'))
+    async def process_bulk_cancel(callback_query: CallbackQuery):
+        """
+        Обработчик подтверждения массовой отмены записей
+        Отменяет записи одной транзакцией и рассылает клиентам уведомления
+        """
+        if not is_admin(callback_query.from_user.id):
+            await callback_query.answer()
+            return
+        
+        date, start, end = callback_query.data.split('_')[2:5]
+        start_datetime = datetime.strptime(f"{date} {start}", "%Y-%m-%d %H%M")
+        # Конец "24:00" означает начало следующего дня
+        end_datetime = datetime.strptime(date, "%Y-%m-%d") + timedelta(minutes=int(end[:2]) * 60 + int(end[2:]))
+        
+        appointments = db.cancel_appointments_in_range(
+            start_datetime.strftime("%Y-%m-%d %H:%M"), end_datetime.strftime("%Y-%m-%d %H:%M")
+        )
+        await callback_query.answer()
+        await outbox.edit_reply_markup(callback_query.message.chat.id, callback_query.message.message_id, None)
+        if not appointments:
+            await outbox.answer(callback_query.message, "Записей для отмены не осталось.")
+            return
+        
+        metrics.inc("appointments.bulk_cancelled", len(appointments))
+        messages = cancellation_messages(appointments, max(end_datetime, datetime.now()))
+        await fan_out(
+            callback_query.message.chat.id, messages, f"❌ Отменено записей: {len(appointments)}. Уведомления"
+        )
+
+    @dp.message(Command("metrics"))
+    async def cmd_metrics(message: Message):
+        """
+        Обработчик команды /metrics (только для администраторов процесса)
+        Показывает текущие метрики процесса (всех бизнесов)
+        """
+        if not is_process_admin(message.from_user.id):
+            return
+        
+        await outbox.answer(message, metrics.format_snapshot())
+
+    @dp.message(Command("backup"))
+    async def cmd_backup(message: Message):
+        """
+        Обработчик команды /backup (только для администраторов)
+        Создает резервную копию базы данных, не останавливая бота
+        """
+        if not is_admin(message.from_user.id):
+            return
+        
+        backup_job = current_tenant.get().backup_job
+        if backup_job is None:
+            await outbox.answer(message, "Резервное копирование доступно только для хранилища SQLite.")
+            return
+        
+        await outbox.answer(message, "⏳ Создаю резервную копию...")
+        try:
+            result = await backup_job.run()
+        except Exception as e:
+            logger.error(f"Ошибка резервного копирования: {e}")
+            await outbox.answer(message, f"❌ Не удалось создать резервную копию: {e}")
+            return
+        
+        await outbox.answer(
+            message,
+            f"✅ Резервная копия создана и проверена: {result['path']}\n"
+            f"Размер: {result['size'] / 1024:.0f} КБ, время: {result['seconds']:.1f} с"
+        )
+
+    @dp.message(Command("profile"))
+    async def cmd_profile(message: Message):
+        """
+        Обработчик команды /profile (только для администраторов процесса)
+        Профилирует процесс заданное число секунд: /profile 30 [функция]
+        """
+        if not is_process_admin(message.from_user.id):
+            return
+        
+        args = message.text.split()[1:]
+        try:
+            seconds = float(args[0]) if args else 30
+        except ValueError:
+            seconds = 0
+        if not 0 < seconds <= PROFILE_MAX_SECONDS:
+            await outbox.answer(
+                message,
+                f"Использование: /profile секунды [функция], не больше {PROFILE_MAX_SECONDS} секунд.\n"
+                "Например: /profile 60 get_available_slots"
+            )
+            return
+        function = args[1] if len(args) > 1 else None
+        
+        await outbox.answer(message, f"⏳ Профилирую {seconds:g} с...")
+        try:
+            path, summary = await profiler.profile(seconds, function)
+        except RuntimeError as e:
+            await outbox.answer(message, f"❌ {e}")
+            return
+        
+        await outbox.answer(message, f"📊 Профиль сохранен: {path}\n\n{summary[:3500]}")
+
+    @dp.message(Command("memory"))
+    async def cmd_memory(message: Message):
+        """
+        Обработчик команды /memory (только для администраторов процесса)
+        /memory start - начать отслеживание памяти, /memory - прирост с прошлого снимка,
+        /memory stop - остановить отслеживание
+        """
+        if not is_process_admin(message.from_user.id):
+            return
+        
+        action = message.text.partition(' ')[2].strip()
+        if action == 'start':
+            profiler.start_memory()
+            await outbox.answer(message, "🔍 Отслеживание памяти запущено. /memory покажет прирост с этого момента.")
+            return
+        if action == 'stop':
+            profiler.stop_memory()
+            await outbox.answer(message, "Отслеживание памяти остановлено.")
+            return
+        
+        try:
+            path, summary = profiler.memory_diff()
+        except RuntimeError as e:
+            await outbox.answer(message, f"❌ {e}. Используйте /memory start")
+            return
+        
+        await outbox.answer(message, f"📈 Снимок памяти сохранен: {path}\n\n{summary[:3500]}")
 
     @dp.message()
     async def process_other_messages(message: Message):
@@ -446,34 +1582,102 @@ async def main():
         Обработчик для любых других сообщений
         Отправляет инструкции по использованию бота
         """
-        await message.answer(
+        await outbox.answer(
+            message,
             "Пожалуйста, используйте команды:\n"
             "/book - забронировать время\n"
+            "/soonest - найти ближайшее свободное время\n"
             "/my_appointments - просмотреть ваши записи\n"
             "/cancel - отменить запись"
         )
 
-    # Запускаем планировщик для напоминаний
-    asyncio.create_task(scheduler.start_scheduler(lambda user_id, service, date, time: 
-                                                send_reminder(bot, user_id, service, date, time)))
+    return dp
+
+def prepare_tenants(registry) -> list:
+    """
+    Готовит базы данных бизнесов к работе: проверяет схему и добавляет данные
+    по умолчанию. Кэши бизнеса загружаются при его первом обновлении, а если
+    бизнес один - сразу
+    
+    Args:
+        registry (TenantRegistry): Бизнесы процесса
+        
+    Returns:
+        list: Бизнесы, готовые к работе
+    """
+    tenants = [tenant for tenant in registry if tenant.prepare()]
+    if len(registry) == 1 and tenants:
+        registry.get(tenants[0].bot.id)
+    
+    # Клавиатуры календаря общие для всех бизнесов, они показываются в упрощенном режиме
+    precompute_calendars()
+    return tenants
+
+# Инициализация ботов и диспетчера
+async def main():
+    started_at = time.perf_counter()
     
-    # Создаем таблицы в базе данных и добавляем тестовые данные
-    db.create_tables()
-    services = db.get_services()
-    if not services:
-        db.add_service("Консультация", 30, 1000)
-        db.add_service("Диагностика", 60, 2000)
-        db.add_service("Тренировка", 90, 3000)
+    # Боты всех бизнесов используют одну HTTP-сессию с общим пулом соединений
+    session = AiohttpSession()
+    registry = create_registry(session)
+    # ID администраторов всех бизнесов не обезличиваются, чтобы их команды воспроизводились
+    admin_ids = set(ADMIN_IDS).union(*(tenant.admin_ids for tenant in registry))
+    recorder = UpdateRecorder(CAPTURE_FILE, CAPTURE_SALT, admin_ids) if CAPTURE_FILE else None
+    dp = create_dispatcher(registry, recorder)
     
-    logger.info("Бот успешно запущен!")
+    tenants = prepare_tenants(registry)
+    if not tenants:
+        logger.error("Бот не запущен")
+        await session.close()
+        return
+    
+    global ics_feed
+    if ICS_FEED_PORT:
+        if len(registry) == 1:
+            ics_feed = IcsFeed(tenants[0].db, ICS_FEED_SECRET, ICS_FEED_BASE_URL)
+        else:
+            logger.warning("Лента календаря поддерживается только для одного бизнеса и не запущена")
+    
+    # Запускаем очереди отправки и резервное копирование каждого бизнеса только после
+    # подготовки базы данных. Обработчики очереди создаются при первой отправке,
+    # а напоминания всех бизнесов проверяет один общий цикл
+    for tenant in tenants:
+        await tenant.outbox.start()
+        if STORAGE_BACKEND == 'sqlite':
+            backup_dir = BACKUP_DIR if len(registry) == 1 else os.path.join(BACKUP_DIR, tenant.id)
+            tenant.backup_job = BackupJob(tenant.db_file, backup_dir, BACKUP_KEEP, BACKUP_COMPRESS)
+            if BACKUP_INTERVAL_HOURS:
+                tenant.create_task(tenant.backup_job.start(BACKUP_INTERVAL_HOURS))
+    reminders_task = asyncio.create_task(run_reminder_checks(tenants, send_reminder))
+    if ics_feed is not None:
+        await ics_feed.start(ICS_FEED_HOST, ICS_FEED_PORT)
+    
+    # Наблюдение за задержкой цикла событий общее для всех бизнесов процесса
+    watchdog = LoopWatchdog(LOOP_LAG_INTERVAL, LOOP_LAG_THRESHOLD) if LOOP_LAG_THRESHOLD else None
+    if watchdog is not None:
+        asyncio.create_task(watchdog.start())
+    
+    logger.info(
+        f"Бот готов к работе (бизнесов: {len(tenants)}), запуск занял {time.perf_counter() - started_at:.3f} с"
+    )
     
     try:
-        # Запускаем поллинг
-        await dp.start_polling(bot)
+        # Запускаем поллинг всех ботов в одном диспетчере
+        await dp.start_polling(*(tenant.bot for tenant in tenants), close_bot_session=False)
     finally:
-        # Закрываем сессию бота при завершении
-        await bot.session.close()
-        scheduler.stop_scheduler()
+        reminders_task.cancel()
+        for tenant in tenants:
+            if tenant.backup_job is not None:
+                tenant.backup_job.stop()
+            await tenant.outbox.stop()
+        if ics_feed is not None:
+            await ics_feed.stop()
+        if watchdog is not None:
+            watchdog.stop()
+        if recorder is not None:
+            recorder.close()
+        # Закрываем общую сессию при завершении
+        await session.close()
 
 if __name__ == '__main__':
     # Запускаем бота
@@ -0,0 +1,254 @@
+import hashlib
+import hmac
+import json
+import queue
+import re
+import threading
+import time
+
+# Поля объектов Telegram, в которых лежат пользователь или чат
+_PERSON_KEYS = ('from', 'chat', 'user', 'sender_chat', 'forward_from', 'forward_from_chat')
+
+# Личные данные, которые не попадают в запись
+_PRIVATE_FIELDS = ('last_name', 'username', 'title', 'bio', 'phone_number')
+_DROPPED_KEYS = ('contact', 'location', 'venue', 'photo', 'document', 'voice', 'video')
+
+
+def anonymize_id(salt, value):
+    """
+    Заменяет ID пользователя или чата постоянным псевдонимом
+
+    Args:
+        salt (bytes): Секретная соль записи
+        value (int): ID Telegram
+
+    Returns:
+        int: Псевдоним того же знака (один ID всегда дает один и тот же псевдоним)
+    """
+    digest = hmac.new(salt, str(abs(value)).encode(), hashlib.sha256).digest()
+    alias = int.from_bytes(digest[:6], 'big') + 1
+    return -alias if value < 0 else alias
+
+
+def anonymize(data, salt, keep_ids=()):
+    """
+    Убирает из обновления Telegram (в виде словаря) личные данные
+
+    ID пользователей и чатов заменяются псевдонимами, имена - заглушкой,
+    контакты, геопозиции и файлы удаляются. Текст сообщений и данные колбэков
+    сохраняются: без них запись нельзя воспроизвести
+
+    Args:
+        data (dict): Обновление (Update.model_dump(mode='json'))
+        salt (bytes): Секретная соль записи
+        keep_ids (iterable): ID, которые остаются как есть (администраторы,
+            чтобы их команды воспроизводились с той же настройкой ADMIN_IDS)
+
+    Returns:
+        dict: Обезличенная копия
+    """
+    result = {}
+    for key, value in data.items():
+        if key in _DROPPED_KEYS or key in _PRIVATE_FIELDS:
+            continue
+        if key in _PERSON_KEYS and isinstance(value, dict):
+            value = anonymize(value, salt, keep_ids)
+            if value.get('id') is not None and value['id'] not in keep_ids:
+                value['id'] = anonymize_id(salt, value['id'])
+            if 'first_name' in value:
+                value['first_name'] = 'User'
+        elif isinstance(value, dict):
+            value = anonymize(value, salt, keep_ids)
+        elif isinstance(value, list):
+            value = [anonymize(item, salt, keep_ids) if isinstance(item, dict) else item for item in value]
+        result[key] = value
+    return result
+
+
+def update_kind(data):
+    """
+    Определяет тип обновления для группировки задержек: команда ("/book"),
+    префикс колбэка ("confirm_cancel", "calendar:day") или "message"
+
+    Args:
+        data (dict): Обновление в виде словаря
+
+    Returns:
+        str: Тип обновления
+    """
+    message = data.get('message')
+    if message is not None:
+        text = message.get('text') or ''
+        return text.split()[0].split('@')[0] if text.startswith('/') else 'message'
+
+    callback_query = data.get('callback_query')
+    if callback_query is not None:
+        match = re.match(r"[a-z_:]+", callback_query.get('data') or '')
+        return match.group(0).rstrip('_:') if match else 'callback'
+
+    return 'other'
+
+
+class UpdateRecorder:
+    def __init__(self, path, salt, keep_ids=()):
+        """
+        Инициализация записи входящих обновлений
+
+        Каждое обновление дописывается в конец файла одной строкой JSON:
+        {"ts": время получения, "ms": время обработки, "kind": тип, "update": обновление}.
+        Записи передаются через очередь фоновому потоку, чтобы запись на диск не
+        блокировала цикл событий; поток сбрасывает буфер на диск не чаще раза
+        в секунду и после секунды без новых записей
+
+        Args:
+            path (str): Путь к файлу записи
+            salt (bytes): Секретная соль для псевдонимов ID
+            keep_ids (iterable): ID, которые не обезличиваются
+        """
+        self.path = path
+        self.salt = salt
+        self.keep_ids = set(keep_ids)
+        self._file = open(path, 'a', encoding='utf-8')
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name='update-recorder', daemon=True)
+        self._thread.start()
+
+    def prepare(self, update):
+        """
+        Обезличивает обновление в момент получения
+
+        Args:
+            update (Update): Обновление Telegram
+
+        Returns:
+            dict: Обезличенное обновление
+        """
+        return anonymize(update.model_dump(mode='json', exclude_none=True, by_alias=True), self.salt, self.keep_ids)
+
+    def write(self, received_at, duration, data):
+        """
+        Дописывает обработанное обновление в файл
+
+        Args:
+            received_at (float): Время получения (time.time())
+            duration (float): Время обработки в секундах
+            data (dict): Обезличенное обновление
+        """
+        self._queue.put({
+            'ts': round(received_at, 3),
+            'ms': round(duration * 1000, 2),
+            'kind': update_kind(data),
+            'update': data,
+        })
+
+    def _run(self):
+        """
+        Фоновый поток: пишет записи из очереди в файл до сигнала остановки (None)
+        """
+        flushed_at = time.monotonic()
+        while True:
+            try:
+                record = self._queue.get(timeout=1)
+            except queue.Empty:
+                record = False
+            if record is None:
+                break
+
+            if record:
+                self._file.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n")
+            now = time.monotonic()
+            if now - flushed_at >= 1:
+                self._file.flush()
+                flushed_at = now
+        self._file.close()
+
+    def close(self):
+        """
+        Дописывает оставшиеся в очереди записи и закрывает файл
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+
+def read_records(path, start=None, end=None):
+    """
+    Читает записанные обновления в порядке получения
+
+    Args:
+        path (str): Путь к файлу записи
+        start (datetime): Начало периода (включительно) или None
+        end (datetime): Конец периода (не включительно) или None
+
+    Returns:
+        list: Записи (словари с ключами 'ts', 'ms', 'kind', 'update')
+    """
+    start_ts = start.timestamp() if start else float('-inf')
+    end_ts = end.timestamp() if end else float('inf')
+
+    records = []
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if start_ts <= record['ts'] < end_ts:
+                records.append(record)
+
+    records.sort(key=lambda record: record['ts'])
+    return records
+
+
+def latency_summary(records):
+    """
+    Считает задержки обработки по типам обновлений
+
+    Args:
+        records (list): Записи обновлений
+
+    Returns:
+        dict: {тип: {'count', 'p50', 'p95', 'p99', 'max'}} (задержки в миллисекундах)
+    """
+    by_kind = {}
+    for record in records:
+        by_kind.setdefault(record['kind'], []).append(record['ms'])
+
+    summary = {}
+    for kind, values in by_kind.items():
+        values.sort()
+        summary[kind] = {
+            'count': len(values),
+            'p50': values[int(0.50 * (len(values) - 1))],
+            'p95': values[int(0.95 * (len(values) - 1))],
+            'p99': values[int(0.99 * (len(values) - 1))],
+            'max': values[-1],
+        }
+    return summary
+
+
+def format_comparison(baseline, candidate):
+    """
+    Форматирует сравнение задержек двух записей
+
+    Args:
+        baseline (list): Записи исходного прогона
+        candidate (list): Записи нового прогона
+
+    Returns:
+        str: Таблица: тип, количество и p50/p95/p99 в миллисекундах для обоих прогонов
+    """
+    before = latency_summary(baseline)
+    after = latency_summary(candidate)
+
+    lines = [f"{'тип':<20} {'n':>6} {'p50':>15} {'p95':>15} {'p99':>15}"]
+    for kind in sorted(set(before) | set(after), key=lambda kind: -after.get(kind, before.get(kind))['count']):
+        old = before.get(kind)
+        new = after.get(kind)
+        count = (new or old)['count']
+        cells = []
+        for key in ('p50', 'p95', 'p99'):
+            old_value = f"{old[key]:.1f}" if old else "-"
+            new_value = f"{new[key]:.1f}" if new else "-"
+            cells.append(f"{old_value + ' → ' + new_value:>15}")
+        lines.append(f"{kind:<20} {count:>6} " + " ".join(cells))
+    return "\n".join(lines)
+
@@ -7,7 +7,31 @@ load_dotenv()
 # Токен Telegram бота (получается из переменной окружения или задается напрямую)
 BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', 'YOUR_TELEGRAM_BOT_TOKEN')
 
-# Настройки рабочего времени по умолчанию
+# Путь к файлу базы данных SQLite
+DB_FILE = os.getenv('DB_FILE', 'appointments.db')
+
+# Дубликаты в базах старых версий мешают создать уникальные индексы. По умолчанию
+# база с дубликатами не запускается, а они перечисляются в журнале. При
+# MIGRATE_REMOVE_DUPLICATES=1 дубликаты переносятся в таблицы <таблица>_duplicates
+MIGRATE_REMOVE_DUPLICATES = os.getenv('MIGRATE_REMOVE_DUPLICATES', '0') == '1'
+
+# Хранилище данных: 'sqlite' (файл DB_FILE) или 'memory' (в памяти процесса,
+# данные теряются при перезапуске; для тестов и бенчмарков)
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'sqlite')
+
+# ID администраторов бота через запятую (например: ADMIN_IDS=12345,67890)
+ADMIN_IDS = {int(x) for x in os.getenv('ADMIN_IDS', '').replace(' ', '').split(',') if x}
+
+# Несколько бизнесов в одном процессе: JSON-файл со списком
+# [{"id": "clinic1", "token": "...", "db_file": "clinic1.db", "admin_ids": [12345]}, ...].
+# Если не задан, процесс обслуживает один бизнес с BOT_TOKEN, DB_FILE и ADMIN_IDS.
+# Кэши в памяти держатся только для TENANT_MAX_ACTIVE недавно активных бизнесов
+TENANTS_FILE = os.getenv('TENANTS_FILE') or None
+TENANT_MAX_ACTIVE = int(os.getenv('TENANT_MAX_ACTIVE', '20'))
+
+# Настройки рабочего времени по умолчанию (записываются в пустую базу при первом запуске).
+# Перерывы задаются ключом "breaks", например: "breaks": [("13:00", "14:00")].
+# Дальше расписание, праздники и особые дни меняются командой /schedule
 DEFAULT_WORKING_HOURS = {
     0: {"start_time": "09:00", "end_time": "18:00"},  # Понедельник
     1: {"start_time": "09:00", "end_time": "18:00"},  # Вторник
@@ -18,8 +42,117 @@ DEFAULT_WORKING_HOURS = {
     6: None,  # Воскресенье (выходной)
 }
 
+# Услуги, которые добавляются в пустую базу данных при первом запуске
+DEFAULT_SERVICES = [
+    ("Консультация", 30, 1000, 1),
+    ("Диагностика", 60, 2000, 1),
+    ("Тренировка", 90, 3000, 20),
+]
+
+# Защита от повторного выполнения колбэков (двойное нажатие, повторная доставка):
+# сколько секунд помнить нажатие и сколько нажатий хранить
+IDEMPOTENCY_TTL = 600
+IDEMPOTENCY_MAX_KEYS = 10000
+
+# Ограничение нагрузки: сколько обновлений обрабатывать одновременно и сколько держать
+# в очереди (остальные отбрасываются). Если сглаженное ожидание в очереди превышает
+# DEGRADED_ENTER_WAIT секунд, бот переходит в упрощенный режим, а выходит из него
+# при ожидании меньше DEGRADED_EXIT_WAIT секунд
+BACKPRESSURE_MAX_INFLIGHT = 32
+BACKPRESSURE_MAX_QUEUED = 1000
+DEGRADED_ENTER_WAIT = 2.0
+DEGRADED_EXIT_WAIT = 0.5
+
+# Лента календаря (iCalendar) с записями пользователя по подписанной ссылке.
+# ICS_FEED_PORT=0 отключает HTTP-сервер. ICS_FEED_BASE_URL - внешний адрес сервера
+# для ссылок, ICS_FEED_SECRET - ключ подписи (по умолчанию - токен бота)
+ICS_FEED_HOST = os.getenv('ICS_FEED_HOST', '0.0.0.0')
+ICS_FEED_PORT = int(os.getenv('ICS_FEED_PORT', '0'))
+ICS_FEED_BASE_URL = os.getenv('ICS_FEED_BASE_URL', f'http://localhost:{ICS_FEED_PORT}')
+ICS_FEED_SECRET = os.getenv('ICS_FEED_SECRET', BOT_TOKEN)
+
+# Резервное копирование базы данных SQLite без остановки бота: раз в BACKUP_INTERVAL_HOURS
+# часов (0 - только по команде /backup) в папку BACKUP_DIR, хранятся BACKUP_KEEP последних копий.
+# BACKUP_COMPRESS=1 сохраняет копии сжатыми (.db.gz)
+BACKUP_DIR = os.getenv('BACKUP_DIR', 'backups')
+BACKUP_INTERVAL_HOURS = float(os.getenv('BACKUP_INTERVAL_HOURS', '24'))
+BACKUP_KEEP = int(os.getenv('BACKUP_KEEP', '7'))
+BACKUP_COMPRESS = os.getenv('BACKUP_COMPRESS', '0') == '1'
+BACKUP_STEP_PAGES = 1024  # Сколько страниц копировать за один шаг (около 4 МБ)
+BACKUP_STEP_SLEEP = 0.01  # Пауза между шагами в секундах, в это время база доступна для записи
+BACKUP_MAX_RESTARTS = 5  # После стольких перезапусков из-за записи остаток копируется за один шаг
+
+# Профилирование по командам /profile и /memory: папка для результатов, наибольшая
+# длительность профилирования в секундах и сколько строк показывать в сводке
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_MAX_SECONDS = 300
+PROFILE_TOP = 15
+
+# Наблюдение за циклом событий: задержка измеряется каждые LOOP_LAG_INTERVAL секунд
+# (метрики loop.*), а если цикл заблокирован дольше LOOP_LAG_THRESHOLD секунд,
+# в журнал записывается стек блокирующего вызова. LOOP_LAG_THRESHOLD=0 отключает наблюдение
+LOOP_LAG_INTERVAL = 0.25
+LOOP_LAG_THRESHOLD = float(os.getenv('LOOP_LAG_THRESHOLD', '0.5'))
+
+# Настройки журнала: уровень и файл (по умолчанию - стандартный поток ошибок)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FILE = os.getenv('LOG_FILE') or None
+
+# Запись входящих обновлений для воспроизведения (replay.py): путь к файлу, который
+# дописывается обезличенными обновлениями (пусто - запись выключена). CAPTURE_SALT -
+# секрет для псевдонимов ID пользователей; если не задан, создается заново при каждом
+# запуске, и псевдонимы разных запусков не совпадают
+CAPTURE_FILE = os.getenv('CAPTURE_FILE') or None
+CAPTURE_SALT = os.getenv('CAPTURE_SALT', '').encode() or os.urandom(16)
+
 # Настройки временных слотов
 TIME_SLOT_DURATION = 30  # Длительность временного слота в минутах
 
 # Настройки напоминаний
-REMINDER_DAYS_BEFORE = 1  # За сколько дней до записи отправлять напоминание
\ No newline at end of file
+REMINDER_DAYS_BEFORE = 1  # За сколько дней до записи отправлять напоминание
+
+# Настройки экспорта и импорта записей
+EXPORT_CHUNK_SIZE = 1000  # Сколько строк читать из базы за один раз при экспорте
+IMPORT_BATCH_SIZE = 10000  # Сколько строк вставлять за одну транзакцию при импорте
+
+# На сколько дней вперед загружать записи в память при запуске
+WARM_UP_DAYS = 14
+
+# Настройки листа ожидания
+WAITLIST_RANGE_DAYS = 3  # Сколько дней после выбранной даты также подходят пользователю
+WAITLIST_NOTIFY_LIMIT = 5  # Сколько первых заявок уведомлять об освободившемся времени
+
+# Настройки поиска ближайшего свободного времени (/soonest)
+SOONEST_DAYS = 90  # На сколько дней вперед искать
+SOONEST_LIMIT = 6  # Сколько ближайших слотов показывать
+
+# Настройки очереди исходящих сообщений
+OUTBOX_GLOBAL_RATE = 25  # Сообщений в секунду для всего бота (лимит Telegram - около 30)
+OUTBOX_CHAT_RATE = 1  # Сообщений в секунду в один чат
+OUTBOX_CHAT_BURST = 3  # Сколько сообщений подряд можно отправить в один чат без ожидания
+OUTBOX_WORKERS = 8  # Количество параллельных обработчиков очереди
+OUTBOX_IDLE_SECONDS = 60  # Через сколько секунд без отправок обработчики очереди бизнеса завершаются
+OUTBOX_MAX_RETRIES = 3  # Сколько раз повторять отправку после RetryAfter
+FANOUT_PROGRESS_INTERVAL = 3.0  # Как часто (в секундах) обновлять сообщение о ходе массовой рассылки
+
+# Сколько найденных записей показывать на одной странице поиска /find
+FIND_PAGE_SIZE = 10
+
+# Процесс бронирования редактирует одно сообщение вместо отправки нового на каждом шаге
+EDIT_IN_PLACE = True
+
+# Ограничение частоты запросов от одного пользователя
+THROTTLE_RATE = 2  # Запросов в секунду
+THROTTLE_BURST = 5  # Сколько запросов подряд можно сделать без ожидания
+THROTTLE_DEBOUNCE = 1.0  # Повторное нажатие той же кнопки в течение стольких секунд игнорируется
+THROTTLE_MAX_USERS = 10000  # Сколько пользователей хранить в памяти одновременно
+THROTTLE_IDLE_SECONDS = 600  # Через сколько секунд бездействия пользователь удаляется из памяти
+
+# Сколько готовых клавиатур календаря (месяцев) хранить в памяти
+CALENDAR_CACHE_SIZE = 24
+
+# Для скольких дат хранить вычисленные рабочие интервалы расписания
+SCHEDULE_CACHE_DAYS = 1000
+
+# Варианты количества записей в повторяющейся серии
+SERIES_OCCURRENCE_OPTIONS = [4, 8, 12]
\ No newline at end of file
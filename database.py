@@ -1,16 +1,112 @@
+import logging
+import re
 import sqlite3
-from datetime import datetime
+from datetime import datetime, timedelta
+
+from config import MIGRATE_REMOVE_DUPLICATES
+from models import Appointment, Reminder, Service
+from working_schedule import WorkingSchedule, split_by_breaks
+
+logger = logging.getLogger(__name__)
+
+
+class DuplicateRowsError(sqlite3.IntegrityError):
+    """
+    В таблице есть дубликаты, из-за которых нельзя создать уникальный индекс
+    """
+
+
+def _next_day(date_str):
+    """
+    Возвращает следующий день для даты в формате "ГГГГ-ММ-ДД"
+    """
+    return (datetime.strptime(date_str, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+def _import_conflicts(day, key, capacity):
+    """
+    Проверяет, пересекается ли импортируемая запись с занятостью дня
+
+    Args:
+        day (dict): Занятость дня {(начало, ID услуги, длительность): количество записавшихся}
+        key (tuple): (начало "ГГГГ-ММ-ДД ЧЧ:ММ", ID услуги, длительность) новой записи
+        capacity (int): Вместимость услуги новой записи
+
+    Returns:
+        bool: True, если запись пересекается с другой записью или группа заполнена
+    """
+    start = _minutes(key[0])
+    end = start + key[2]
+    for group, booked in day.items():
+        group_start = _minutes(group[0])
+        if not (group_start < end and start < group_start + group[2]):
+            continue
+        if group != key or booked >= capacity:
+            return True
+    return False
+
+
+def _minutes(datetime_str):
+    """
+    Возвращает количество минут от начала дня для строки "ГГГГ-ММ-ДД ЧЧ:ММ"
+    без вызова strptime
+    """
+    return int(datetime_str[11:13]) * 60 + int(datetime_str[14:16])
+
+
+def search_terms(text):
+    """
+    Разбивает поисковый запрос на слова в нижнем регистре
+    """
+    return re.findall(r"\w+", text.lower().replace('ё', 'е'))
+
 
 class Database:
-    def __init__(self, db_file):
+    def __init__(self, db_file, remove_duplicates=MIGRATE_REMOVE_DUPLICATES):
         """
         Инициализация базы данных
         
         Args:
             db_file (str): Путь к файлу базы данных SQLite
+            remove_duplicates (bool): Разрешить миграции переносить дубликаты в таблицы
+                <таблица>_duplicates (иначе база с дубликатами не запускается)
         """
         self.db_file = db_file
         self.conn = None
+        self.remove_duplicates = remove_duplicates
+        
+        # Кэши в памяти заполняются методом warm_up при запуске бота.
+        # Пока они равны None, все запросы идут напрямую в базу данных
+        self._services_cache = None      # {id услуги: услуга}
+        self._schedule = None            # WorkingSchedule, пересобирается при изменении расписания
+        self._reminders_cache = None     # {id напоминания: неотправленное напоминание}
+        # Занятость по дням: {"ГГГГ-ММ-ДД": {(время записи, ID услуги, длительность): число записей}}
+        self._occupancy_cache = None
+        self._cache_window = None        # (первая дата, дата после последней) для _occupancy_cache
+        
+        # Функции, которые вызываются с ID пользователя после изменения его записей
+        self._change_listeners = []
+    
+    def add_change_listener(self, callback):
+        """
+        Подписывает функцию на изменения записей пользователей
+        
+        Args:
+            callback (callable): Функция, принимающая ID пользователя Telegram.
+                Вызывается после фиксации транзакции в том же потоке, поэтому должна быть быстрой
+        """
+        self._change_listeners.append(callback)
+    
+    def _notify_changed(self, user_ids):
+        """
+        Сообщает подписчикам, что записи пользователей изменились
+        """
+        for user_id in user_ids:
+            for callback in self._change_listeners:
+                try:
+                    callback(user_id)
+                except Exception:
+                    logger.exception("Ошибка в обработчике изменения записей")
     
     def _connect(self):
         """
@@ -19,11 +115,22 @@ class Database:
         Returns:
             sqlite3.Connection: Объект соединения с базой данных
         """
-        self.conn = sqlite3.connect(self.db_file)
-        # Настраиваем соединение для возврата строк в виде словарей
-        self.conn.row_factory = sqlite3.Row
+        self.conn = self._new_connection()
         return self.conn
     
+    def _new_connection(self):
+        """
+        Открывает новое соединение, не связанное с self.conn
+        (нужно для потокового чтения, которое живет дольше одного вызова)
+        
+        Returns:
+            sqlite3.Connection: Объект соединения с базой данных
+        """
+        conn = sqlite3.connect(self.db_file)
+        # Настраиваем соединение для возврата строк в виде словарей
+        conn.row_factory = sqlite3.Row
+        return conn
+    
     def _close(self):
         """
         Закрывает соединение с базой данных
@@ -40,68 +147,422 @@ class Database:
             conn = self._connect()
             cursor = conn.cursor()
             
-            # Создаем таблицу услуг
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS services (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    duration INTEGER NOT NULL,
-                    price REAL NOT NULL
-                )
-            ''')
+            self._create_schema(cursor)
             
-            # Создаем таблицу записей
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS appointments (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    user_name TEXT NOT NULL,
-                    service_id INTEGER NOT NULL,
-                    appointment_datetime TEXT NOT NULL,
-                    duration INTEGER NOT NULL,
-                    created_at TEXT NOT NULL,
-                    FOREIGN KEY (service_id) REFERENCES services (id)
-                )
-            ''')
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при создании таблиц: {e}")
+        finally:
+            self._close()
+    
+    def bootstrap(self, default_services, default_working_hours=None):
+        """
+        Подготавливает базу данных при запуске бота: проверяет схему и добавляет
+        услуги и рабочие часы по умолчанию, если их еще нет. Все выполняется
+        в одной транзакции на одном соединении
+        
+        Args:
+            default_services (list): Кортежи (name, duration, price, capacity) для пустой базы
+            default_working_hours (dict): Рабочие часы по дням недели в формате
+                config.DEFAULT_WORKING_HOURS
             
-            # Создаем таблицу рабочих часов (для настройки расписания)
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS working_hours (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    day_of_week INTEGER NOT NULL,  -- 0 = Понедельник, 6 = Воскресенье
-                    start_time TEXT NOT NULL,
-                    end_time TEXT NOT NULL
-                )
-            ''')
+        Returns:
+            bool: True в случае успеха, False в противном случае
+        """
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
             
-            # Создаем таблицу для хранения информации о напоминаниях
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS reminders (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    appointment_id INTEGER NOT NULL,
-                    reminder_datetime TEXT NOT NULL,
-                    sent BOOLEAN NOT NULL DEFAULT 0,
-                    FOREIGN KEY (appointment_id) REFERENCES appointments (id) ON DELETE CASCADE
+            # Явно открываем транзакцию: иначе sqlite3 выполнит DDL в режиме автофиксации
+            cursor.execute("BEGIN")
+            self._create_schema(cursor)
+            
+            cursor.execute("SELECT COUNT(*) FROM services")
+            if cursor.fetchone()[0] == 0:
+                cursor.executemany(
+                    "INSERT INTO services (name, duration, price, capacity) VALUES (?, ?, ?, ?)",
+                    default_services
                 )
-            ''')
             
-            # Заполняем таблицу рабочих часов, если она пуста
             cursor.execute("SELECT COUNT(*) FROM working_hours")
-            if cursor.fetchone()[0] == 0:
-                # Добавляем рабочие часы для будних дней (9:00 - 18:00)
-                for day in range(5):  # Понедельник - Пятница
-                    cursor.execute(
-                        "INSERT INTO working_hours (day_of_week, start_time, end_time) VALUES (?, ?, ?)",
-                        (day, "09:00", "18:00")
-                    )
+            if default_working_hours and cursor.fetchone()[0] == 0:
+                # Рабочий день с перерывами хранится как несколько интервалов
+                cursor.executemany(
+                    "INSERT INTO working_hours (day_of_week, start_time, end_time) VALUES (?, ?, ?)",
+                    [
+                        (day, start_time, end_time)
+                        for day, hours in default_working_hours.items() if hours
+                        for start_time, end_time in split_by_breaks(
+                            hours['start_time'], hours['end_time'], hours.get('breaks', ())
+                        )
+                    ]
+                )
             
             conn.commit()
+            
+            self._schedule = self._load_schedule(cursor)
+            return True
         except sqlite3.Error as e:
-            print(f"Ошибка при создании таблиц: {e}")
+            logger.error(f"Ошибка при подготовке базы данных: {e}")
+            return False
         finally:
             self._close()
     
-    def add_service(self, name, duration, price):
+    def _create_schema(self, cursor):
+        """
+        Создает таблицы, индексы и триггеры, если они не существуют
+        
+        Args:
+            cursor (sqlite3.Cursor): Курсор открытого соединения
+        """
+        # Создаем таблицу услуг
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS services (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                duration INTEGER NOT NULL,
+                price REAL NOT NULL
+            )
+        ''')
+        
+        # Создаем таблицу записей
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS appointments (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                user_name TEXT NOT NULL,
+                service_id INTEGER NOT NULL,
+                appointment_datetime TEXT NOT NULL,
+                duration INTEGER NOT NULL,
+                created_at TEXT NOT NULL,
+                FOREIGN KEY (service_id) REFERENCES services (id)
+            )
+        ''')
+        
+        # Создаем таблицу рабочих часов (для настройки расписания).
+        # Несколько строк на один день недели - рабочие интервалы между перерывами
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS working_hours (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                day_of_week INTEGER NOT NULL,  -- 0 = Понедельник, 6 = Воскресенье
+                start_time TEXT NOT NULL,
+                end_time TEXT NOT NULL
+            )
+        ''')
+        
+        # Особые дни: праздники и дни с измененным расписанием.
+        # Строка с пустым временем означает выходной
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schedule_overrides (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date TEXT NOT NULL,
+                start_time TEXT,
+                end_time TEXT
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_schedule_overrides_date
+            ON schedule_overrides (date)
+        ''')
+        
+        # Создаем таблицу для хранения информации о напоминаниях
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS reminders (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                appointment_id INTEGER NOT NULL,
+                reminder_datetime TEXT NOT NULL,
+                sent BOOLEAN NOT NULL DEFAULT 0,
+                FOREIGN KEY (appointment_id) REFERENCES appointments (id) ON DELETE CASCADE
+            )
+        ''')
+        
+        # Индекс по времени записи для диапазонных запросов
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_appointments_datetime
+            ON appointments (appointment_datetime)
+        ''')
+        
+        # Серии повторяющихся записей (еженедельно, раз в две недели и т.д.)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS appointment_series (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                service_id INTEGER NOT NULL,
+                interval_weeks INTEGER NOT NULL,
+                occurrences INTEGER NOT NULL,
+                created_at TEXT NOT NULL
+            )
+        ''')
+        self._add_column_if_missing(cursor, 'appointments', 'series_id', 'INTEGER')
+        
+        # Вместимость услуги: сколько клиентов может записаться на одно и то же время
+        # (больше 1 для групповых занятий)
+        self._add_column_if_missing(cursor, 'services', 'capacity', 'INTEGER NOT NULL DEFAULT 1')
+        
+        # Покрывающий индекс для подсчета занятости: GROUP BY по времени читает только индекс
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_appointments_occupancy
+            ON appointments (appointment_datetime, service_id, duration)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_appointments_series
+            ON appointments (series_id)
+        ''')
+        
+        # Уникальные ключи: повторная вставка той же записи или того же напоминания
+        # (двойное нажатие, повторная доставка обновления) ничего не делает
+        self._create_unique_index(
+            cursor, 'idx_appointments_unique', 'appointments', ('user_id', 'appointment_datetime')
+        )
+        self._create_unique_index(
+            cursor, 'idx_reminders_unique', 'reminders', ('appointment_id', 'reminder_datetime')
+        )
+        
+        # Сводная таблица статистики по дням и услугам. Поддерживается триггерами
+        # при каждом добавлении и удалении записи, поэтому отчеты не сканируют appointments
+        cursor.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'daily_stats'"
+        )
+        stats_table_exists = cursor.fetchone()[0] > 0
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS daily_stats (
+                date TEXT NOT NULL,
+                service_id INTEGER NOT NULL,
+                bookings INTEGER NOT NULL DEFAULT 0,
+                revenue REAL NOT NULL DEFAULT 0,
+                booked_minutes INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (date, service_id)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_appointments_stats_insert
+            AFTER INSERT ON appointments
+            BEGIN
+                INSERT INTO daily_stats (date, service_id, bookings, revenue, booked_minutes)
+                VALUES (
+                    substr(NEW.appointment_datetime, 1, 10), NEW.service_id, 1,
+                    COALESCE((SELECT price FROM services WHERE id = NEW.service_id), 0),
+                    NEW.duration
+                )
+                ON CONFLICT (date, service_id) DO UPDATE SET
+                    bookings = bookings + 1,
+                    revenue = revenue + excluded.revenue,
+                    booked_minutes = booked_minutes + excluded.booked_minutes;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_appointments_stats_delete
+            AFTER DELETE ON appointments
+            BEGIN
+                UPDATE daily_stats SET
+                    bookings = bookings - 1,
+                    revenue = revenue - COALESCE((SELECT price FROM services WHERE id = OLD.service_id), 0),
+                    booked_minutes = booked_minutes - OLD.duration
+                WHERE date = substr(OLD.appointment_datetime, 1, 10) AND service_id = OLD.service_id;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_appointments_stats_update
+            AFTER UPDATE OF appointment_datetime, duration, service_id ON appointments
+            BEGIN
+                UPDATE daily_stats SET
+                    bookings = bookings - 1,
+                    revenue = revenue - COALESCE((SELECT price FROM services WHERE id = OLD.service_id), 0),
+                    booked_minutes = booked_minutes - OLD.duration
+                WHERE date = substr(OLD.appointment_datetime, 1, 10) AND service_id = OLD.service_id;
+                INSERT INTO daily_stats (date, service_id, bookings, revenue, booked_minutes)
+                VALUES (
+                    substr(NEW.appointment_datetime, 1, 10), NEW.service_id, 1,
+                    COALESCE((SELECT price FROM services WHERE id = NEW.service_id), 0),
+                    NEW.duration
+                )
+                ON CONFLICT (date, service_id) DO UPDATE SET
+                    bookings = bookings + 1,
+                    revenue = revenue + excluded.revenue,
+                    booked_minutes = booked_minutes + excluded.booked_minutes;
+            END
+        ''')
+        # Выручка в сводке считается по текущей цене услуги (как и в _rebuild_stats), а триггеры
+        # записей вычитают текущую цену. Поэтому при изменении цены или удалении услуги выручка
+        # пересчитывается сразу, иначе после отмены старых записей она расходилась бы с ними
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_services_stats_price
+            AFTER UPDATE OF price ON services
+            BEGIN
+                UPDATE daily_stats SET revenue = revenue + bookings * (NEW.price - OLD.price)
+                WHERE service_id = NEW.id;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_services_stats_delete
+            AFTER DELETE ON services
+            BEGIN
+                UPDATE daily_stats SET revenue = revenue - bookings * OLD.price
+                WHERE service_id = OLD.id;
+            END
+        ''')
+        if not stats_table_exists:
+            # Таблица только что создана в существующей базе - заполняем ее по истории
+            self._rebuild_stats(cursor)
+        
+        # Лист ожидания: желаемый период дат, окно времени (в минутах от начала дня) и услуга
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS waitlist (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                service_id INTEGER NOT NULL,
+                duration INTEGER NOT NULL,
+                date_from TEXT NOT NULL,
+                date_to TEXT NOT NULL,
+                time_from INTEGER NOT NULL,
+                time_to INTEGER NOT NULL,
+                created_at TEXT NOT NULL,
+                FOREIGN KEY (service_id) REFERENCES services (id)
+            )
+        ''')
+        
+        # R*Tree-индекс по интервалам листа ожидания (даты в виде ГГГГММДД, время в минутах),
+        # чтобы поиск подходящих заявок при отмене записи не требовал полного перебора
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS waitlist_index USING rtree_i32 (
+                id, date_from, date_to, time_from, time_to
+            )
+        ''')
+        
+        # Полнотекстовый индекс FTS5 по имени клиента и названию услуги для поиска /find.
+        # rowid строки индекса равен ID записи; индекс поддерживается триггерами,
+        # префиксные индексы ускоряют поиск по началу слова. Токенизатор не приравнивает
+        # "ё" к "е", поэтому "ё" заменяется при индексации (и в запросе - в search_terms)
+        cursor.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'appointments_fts'"
+        )
+        fts_table_exists = cursor.fetchone()[0] > 0
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS appointments_fts USING fts5 (
+                user_name, service_name,
+                tokenize = 'unicode61 remove_diacritics 2',
+                prefix = '2 3'
+            )
+        ''')
+        self._create_fts_insert_trigger(cursor)
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_appointments_fts_delete
+            AFTER DELETE ON appointments
+            BEGIN
+                DELETE FROM appointments_fts WHERE rowid = OLD.id;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_appointments_fts_update
+            AFTER UPDATE OF user_name, service_id ON appointments
+            BEGIN
+                UPDATE appointments_fts SET
+                    user_name = replace(replace(NEW.user_name, 'ё', 'е'), 'Ё', 'Е'),
+                    service_name = (
+                        SELECT replace(replace(name, 'ё', 'е'), 'Ё', 'Е') FROM services WHERE id = NEW.service_id
+                    )
+                WHERE rowid = NEW.id;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_services_fts_update
+            AFTER UPDATE OF name ON services
+            BEGIN
+                UPDATE appointments_fts SET service_name = replace(replace(NEW.name, 'ё', 'е'), 'Ё', 'Е')
+                WHERE rowid IN (SELECT id FROM appointments WHERE service_id = NEW.id);
+            END
+        ''')
+        if not fts_table_exists:
+            # Индекс только что создан в существующей базе - заполняем его по истории
+            cursor.execute('''
+                INSERT INTO appointments_fts (rowid, user_name, service_name)
+                SELECT a.id, replace(replace(a.user_name, 'ё', 'е'), 'Ё', 'Е'),
+                       replace(replace(s.name, 'ё', 'е'), 'Ё', 'Е')
+                FROM appointments a
+                LEFT JOIN services s ON s.id = a.service_id
+            ''')
+    
+    def _create_fts_insert_trigger(self, cursor):
+        """
+        Создает триггер, добавляющий новые записи в полнотекстовый индекс
+        
+        Args:
+            cursor (sqlite3.Cursor): Курсор открытого соединения
+        """
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_appointments_fts_insert
+            AFTER INSERT ON appointments
+            BEGIN
+                INSERT INTO appointments_fts (rowid, user_name, service_name)
+                VALUES (
+                    NEW.id,
+                    replace(replace(NEW.user_name, 'ё', 'е'), 'Ё', 'Е'),
+                    (SELECT replace(replace(name, 'ё', 'е'), 'Ё', 'Е') FROM services WHERE id = NEW.service_id)
+                );
+            END
+        ''')
+    
+    def _create_unique_index(self, cursor, name, table, columns):
+        """
+        Создает уникальный индекс. В базах, созданных старыми версиями, могли
+        накопиться дубликаты: каждый из них записывается в журнал, и, если перенос
+        не разрешен (remove_duplicates), миграция прерывается с ошибкой, а данные
+        не меняются. С разрешением дубликаты (кроме первой строки каждого ключа)
+        переносятся в таблицу <таблица>_duplicates и только потом удаляются
+        
+        Args:
+            cursor (sqlite3.Cursor): Курсор открытого соединения
+            name (str): Название индекса
+            table (str): Название таблицы
+            columns (tuple): Столбцы уникального ключа
+            
+        Raises:
+            DuplicateRowsError: Если есть дубликаты, а перенос не разрешен
+        """
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'index' AND name = ?", (name,))
+        if cursor.fetchone()[0]:
+            return
+        
+        key = ", ".join(columns)
+        duplicates = f"SELECT MIN(id) FROM {table} GROUP BY {key}"
+        cursor.execute(f"SELECT * FROM {table} WHERE id NOT IN ({duplicates}) ORDER BY id")
+        found = [dict(row) for row in cursor.fetchall()]
+        for row in found:
+            logger.warning(f"Дубликат в таблице {table}", extra={'table': table, 'row': row})
+        
+        if found:
+            quarantine = f"{table}_duplicates"
+            if not self.remove_duplicates:
+                raise DuplicateRowsError(
+                    f"В таблице {table} найдено дубликатов: {len(found)} (строки в журнале), "
+                    f"поэтому нельзя создать индекс {name}. Данные не изменены. Чтобы перенести "
+                    f"дубликаты в таблицу {quarantine}, запустите бот с MIGRATE_REMOVE_DUPLICATES=1"
+                )
+            cursor.execute(f"CREATE TABLE IF NOT EXISTS {quarantine} AS SELECT * FROM {table} WHERE 0")
+            cursor.execute(f"INSERT INTO {quarantine} SELECT * FROM {table} WHERE id NOT IN ({duplicates})")
+            cursor.execute(f"DELETE FROM {table} WHERE id NOT IN ({duplicates})")
+            logger.warning(
+                f"Перед созданием индекса {name} дубликаты перенесены из таблицы {table} "
+                f"в {quarantine}: {len(found)}",
+                extra={'table': table, 'moved': len(found)}
+            )
+        cursor.execute(f"CREATE UNIQUE INDEX {name} ON {table} ({key})")
+    
+    def _add_column_if_missing(self, cursor, table, column, definition):
+        """
+        Добавляет столбец в существующую таблицу (миграция баз, созданных старыми версиями)
+        
+        Args:
+            cursor (sqlite3.Cursor): Курсор открытого соединения
+            table (str): Название таблицы
+            column (str): Название столбца
+            definition (str): Тип и ограничения столбца
+        """
+        cursor.execute(f"PRAGMA table_info({table})")
+        if column not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    
+    def add_service(self, name, duration, price, capacity=1):
         """
         Добавляет новую услугу в базу данных
         
@@ -109,6 +570,7 @@ class Database:
             name (str): Название услуги
             duration (int): Длительность услуги в минутах
             price (float): Стоимость услуги
+            capacity (int): Сколько клиентов может записаться на одно время
             
         Returns:
             int: ID созданной услуги
@@ -118,14 +580,17 @@ class Database:
             cursor = conn.cursor()
             
             cursor.execute(
-                "INSERT INTO services (name, duration, price) VALUES (?, ?, ?)",
-                (name, duration, price)
+                "INSERT INTO services (name, duration, price, capacity) VALUES (?, ?, ?, ?)",
+                (name, duration, price, capacity)
             )
             
             conn.commit()
+            
+            if self._services_cache is not None:
+                self._services_cache[cursor.lastrowid] = Service(cursor.lastrowid, name, duration, price, capacity)
             return cursor.lastrowid
         except sqlite3.Error as e:
-            print(f"Ошибка при добавлении услуги: {e}")
+            logger.error(f"Ошибка при добавлении услуги: {e}")
             return None
         finally:
             self._close()
@@ -135,20 +600,21 @@ class Database:
         Получает список всех доступных услуг
         
         Returns:
-            list: Список словарей с услугами
+            list: Список услуг (models.Service)
         """
+        if self._services_cache is not None:
+            return list(self._services_cache.values())
+        
         try:
             conn = self._connect()
             cursor = conn.cursor()
+            cursor.row_factory = Service.from_row
             
-            cursor.execute("SELECT id, name, duration, price FROM services")
-            
-            # Преобразуем результат в список словарей
-            services = [dict(row) for row in cursor.fetchall()]
+            cursor.execute("SELECT id, name, duration, price, capacity FROM services")
             
-            return services
+            return cursor.fetchall()
         except sqlite3.Error as e:
-            print(f"Ошибка при получении услуг: {e}")
+            logger.error(f"Ошибка при получении услуг: {e}")
             return []
         finally:
             self._close()
@@ -161,31 +627,33 @@ class Database:
             service_id (int): ID услуги
             
         Returns:
-            dict: Словарь с информацией об услуге
+            Service: Услуга или None
         """
+        if self._services_cache is not None:
+            return self._services_cache.get(service_id)
+        
         try:
             conn = self._connect()
             cursor = conn.cursor()
+            cursor.row_factory = Service.from_row
             
             cursor.execute(
-                "SELECT id, name, duration, price FROM services WHERE id = ?",
+                "SELECT id, name, duration, price, capacity FROM services WHERE id = ?",
                 (service_id,)
             )
             
-            row = cursor.fetchone()
-            
-            if row:
-                return dict(row)
-            return None
+            return cursor.fetchone()
         except sqlite3.Error as e:
-            print(f"Ошибка при получении услуги: {e}")
+            logger.error(f"Ошибка при получении услуги: {e}")
             return None
         finally:
             self._close()
     
-    def add_appointment(self, user_id, user_name, service_id, appointment_datetime, duration):
+    def add_appointment(self, user_id, user_name, service_id, appointment_datetime, duration, capacity=1):
         """
-        Добавляет новую запись на прием
+        Добавляет новую запись на прием. Пересечения с другими записями и места
+        в группе проверяются в той же транзакции, что и вставка, поэтому два
+        одновременных подтверждения не могут занять одно время
         
         Args:
             user_id (int): ID пользователя Telegram
@@ -193,14 +661,34 @@ class Database:
             service_id (int): ID услуги
             appointment_datetime (str): Дата и время приема в формате "ГГГГ-ММ-ДД ЧЧ:ММ"
             duration (int): Длительность приема в минутах
+            capacity (int): Вместимость услуги
             
         Returns:
-            int: ID созданной записи
+            int: ID созданной записи (или уже существующей записи пользователя на это время
+                и эту же услугу) или None, если время занято
         """
         try:
             conn = self._connect()
             cursor = conn.cursor()
             
+            # Блокируем запись сразу, чтобы между проверкой и вставкой никто не занял время
+            cursor.execute("BEGIN IMMEDIATE")
+            
+            # Повторная вставка той же записи (двойное нажатие): возвращаем ее ID.
+            # Если на это время у пользователя запись на другую услугу, запись не создается
+            cursor.execute(
+                "SELECT id, service_id FROM appointments WHERE user_id = ? AND appointment_datetime = ?",
+                (user_id, appointment_datetime)
+            )
+            existing = cursor.fetchone()
+            if existing is not None:
+                conn.rollback()
+                return existing['id'] if existing['service_id'] == service_id else None
+            
+            if self._overlaps(cursor, user_id, service_id, appointment_datetime, duration, capacity):
+                conn.rollback()
+                return None
+            
             created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             
             cursor.execute(
@@ -213,13 +701,63 @@ class Database:
             )
             
             conn.commit()
+            
+            self._cache_appointment({
+                'id': cursor.lastrowid, 'service_id': service_id,
+                'appointment_datetime': appointment_datetime, 'duration': duration
+            })
+            self._notify_changed((user_id,))
             return cursor.lastrowid
         except sqlite3.Error as e:
-            print(f"Ошибка при добавлении записи: {e}")
+            logger.error(f"Ошибка при добавлении записи: {e}")
+            if self.conn:
+                self.conn.rollback()
             return None
         finally:
             self._close()
     
+    def _overlaps(self, cursor, user_id, service_id, appointment_datetime, duration, capacity, exclude_id=None):
+        """
+        Проверяет, пересекается ли время с записями того же дня. К неполной группе
+        той же услуги, начинающейся в то же время, можно присоединиться, если
+        пользователь еще не в ней
+        
+        Args:
+            cursor (sqlite3.Cursor): Курсор открытой транзакции
+            user_id (int): ID пользователя Telegram
+            service_id (int): ID услуги
+            appointment_datetime (str): Дата и время начала "ГГГГ-ММ-ДД ЧЧ:ММ"
+            duration (int): Длительность в минутах
+            capacity (int): Вместимость услуги
+            exclude_id (int): ID записи, которая не учитывается (переносимая запись)
+            
+        Returns:
+            bool: True, если время занято
+        """
+        date = appointment_datetime[:10]
+        cursor.execute(
+            """
+            SELECT appointment_datetime, service_id, duration, COUNT(*), MAX(user_id = ?)
+            FROM appointments
+            WHERE appointment_datetime >= ? AND appointment_datetime < ? AND id != ?
+            GROUP BY appointment_datetime, service_id, duration
+            """,
+            (user_id, date, _next_day(date), exclude_id or 0)
+        )
+        start = _minutes(appointment_datetime)
+        end = start + duration
+        for group_datetime, group_service_id, group_duration, booked, own in cursor.fetchall():
+            group_start = _minutes(group_datetime)
+            if not (start < group_start + group_duration and group_start < end):
+                continue
+            if (
+                group_datetime == appointment_datetime and group_service_id == service_id
+                and group_duration == duration and booked < capacity and not own
+            ):
+                continue
+            return True
+        return False
+    
     def get_user_appointments(self, user_id):
         """
         Получает список записей пользователя
@@ -228,15 +766,16 @@ class Database:
             user_id (int): ID пользователя Telegram
             
         Returns:
-            list: Список словарей с записями
+            list: Список записей (models.Appointment)
         """
         try:
             conn = self._connect()
             cursor = conn.cursor()
+            cursor.row_factory = Appointment.from_row
             
             cursor.execute(
                 """
-                SELECT id, user_id, service_id, appointment_datetime, duration
+                SELECT id, user_id, service_id, appointment_datetime, duration, series_id
                 FROM appointments
                 WHERE user_id = ? AND datetime(appointment_datetime) > datetime('now')
                 ORDER BY datetime(appointment_datetime)
@@ -244,12 +783,9 @@ class Database:
                 (user_id,)
             )
             
-            # Преобразуем результат в список словарей
-            appointments = [dict(row) for row in cursor.fetchall()]
-            
-            return appointments
+            return cursor.fetchall()
         except sqlite3.Error as e:
-            print(f"Ошибка при получении записей пользователя: {e}")
+            logger.error(f"Ошибка при получении записей пользователя: {e}")
             return []
         finally:
             self._close()
@@ -262,28 +798,25 @@ class Database:
             appointment_id (int): ID записи
             
         Returns:
-            dict: Словарь с информацией о записи
+            Appointment: Запись или None
         """
         try:
             conn = self._connect()
             cursor = conn.cursor()
+            cursor.row_factory = Appointment.from_row
             
             cursor.execute(
                 """
-                SELECT id, user_id, service_id, appointment_datetime, duration
+                SELECT id, user_id, service_id, appointment_datetime, duration, series_id
                 FROM appointments
                 WHERE id = ?
                 """,
                 (appointment_id,)
             )
             
-            row = cursor.fetchone()
-            
-            if row:
-                return dict(row)
-            return None
+            return cursor.fetchone()
         except sqlite3.Error as e:
-            print(f"Ошибка при получении записи: {e}")
+            logger.error(f"Ошибка при получении записи: {e}")
             return None
         finally:
             self._close()
@@ -301,164 +834,1335 @@ class Database:
         try:
             conn = self._connect()
             cursor = conn.cursor()
+            cursor.row_factory = Appointment.from_row
+            
+            cursor.execute(
+                "SELECT id, user_id, service_id, appointment_datetime, duration FROM appointments WHERE id = ?",
+                (appointment_id,)
+            )
+            appointment = cursor.fetchone()
             
+            # Внешние ключи SQLite не включены, поэтому напоминания удаляются явно в той же транзакции
+            cursor.execute("DELETE FROM reminders WHERE appointment_id = ?", (appointment_id,))
             cursor.execute("DELETE FROM appointments WHERE id = ?", (appointment_id,))
+            deleted = cursor.rowcount > 0
             
             conn.commit()
-            return cursor.rowcount > 0
+            
+            if appointment:
+                self._uncache_appointments([appointment])
+                self._notify_changed((appointment['user_id'],))
+            return deleted
         except sqlite3.Error as e:
-            print(f"Ошибка при удалении записи: {e}")
+            logger.error(f"Ошибка при удалении записи: {e}")
             return False
         finally:
             self._close()
     
-    def get_appointments_by_date_range(self, start_date, end_date):
+    def reschedule_appointment(self, appointment_id, user_id, appointment_datetime, reminder_datetime, capacity=1):
         """
-        Получает список записей в заданном диапазоне дат
+        Переносит запись пользователя на другое время вместе с напоминанием в одной транзакции.
+        Пересечения с другими записями нового дня проверяются под той же блокировкой,
+        поэтому при занятом времени запись остается на старом месте, а не теряется
         
         Args:
-            start_date (str): Начальная дата в формате "ГГГГ-ММ-ДД"
-            end_date (str): Конечная дата в формате "ГГГГ-ММ-ДД"
+            appointment_id (int): ID записи
+            user_id (int): ID пользователя Telegram (владельца записи)
+            appointment_datetime (str): Новые дата и время приема "ГГГГ-ММ-ДД ЧЧ:ММ"
+            reminder_datetime (str): Дата и время нового напоминания "ГГГГ-ММ-ДД ЧЧ:ММ:СС"
+            capacity (int): Вместимость услуги
             
         Returns:
-            list: Список словарей с записями
+            tuple: (запись до переноса, запись после переноса) или None, если запись
+                не найдена, принадлежит другому пользователю или новое время занято
         """
         try:
             conn = self._connect()
             cursor = conn.cursor()
             
+            # Блокируем запись сразу, чтобы между проверкой и переносом никто не занял время
+            cursor.execute("BEGIN IMMEDIATE")
+            
+            cursor.row_factory = Appointment.from_row
             cursor.execute(
                 """
-                SELECT id, user_id, service_id, appointment_datetime, duration
+                SELECT id, user_id, user_name, service_id, appointment_datetime, duration, series_id, created_at
                 FROM appointments
-                WHERE date(appointment_datetime) BETWEEN date(?) AND date(?)
-                ORDER BY datetime(appointment_datetime)
+                WHERE id = ? AND user_id = ?
                 """,
-                (start_date, end_date)
+                (appointment_id, user_id)
             )
+            old = cursor.fetchone()
+            cursor.row_factory = None
+            if old is None:
+                conn.rollback()
+                return None
             
-            # Преобразуем результат в список словарей
-            appointments = [dict(row) for row in cursor.fetchall()]
+            # Переносимая запись не мешает самой себе: ее старое время для нее свободно
+            if self._overlaps(
+                cursor, user_id, old.service_id, appointment_datetime, old.duration, capacity, appointment_id
+            ):
+                conn.rollback()
+                return None
             
-            return appointments
+            cursor.execute(
+                "UPDATE appointments SET appointment_datetime = ? WHERE id = ?",
+                (appointment_datetime, appointment_id)
+            )
+            # Неотправленные напоминания о старом времени заменяются одним новым
+            cursor.execute("DELETE FROM reminders WHERE appointment_id = ? AND sent = 0", (appointment_id,))
+            cursor.execute(
+                "INSERT OR IGNORE INTO reminders (appointment_id, reminder_datetime, sent) VALUES (?, ?, 0)",
+                (appointment_id, reminder_datetime)
+            )
+            
+            conn.commit()
+            
+            new = old.replace(appointment_datetime=appointment_datetime)
+            self._uncache_appointments([old])
+            self._cache_appointment(new)
+            if self._reminders_cache is not None:
+                cursor.row_factory = Reminder.from_row
+                cursor.execute(
+                    """
+                    SELECT r.id, r.appointment_id, r.reminder_datetime,
+                           a.user_id, a.service_id, a.appointment_datetime
+                    FROM reminders r
+                    JOIN appointments a ON r.appointment_id = a.id
+                    WHERE r.appointment_id = ? AND r.sent = 0
+                    """,
+                    (appointment_id,)
+                )
+                for reminder in cursor.fetchall():
+                    self._reminders_cache[reminder.id] = reminder
+            self._notify_changed((user_id,))
+            return old, new
         except sqlite3.Error as e:
-            print(f"Ошибка при получении записей по диапазону дат: {e}")
-            return []
+            logger.error(f"Ошибка при переносе записи: {e}")
+            if self.conn:
+                self.conn.rollback()
+            return None
         finally:
             self._close()
     
-    def get_working_hours(self, day_of_week):
+    def get_appointments_by_date_range(self, start_date, end_date):
         """
-        Получает информацию о рабочих часах для определенного дня недели
+        Получает список записей в заданном диапазоне дат
         
         Args:
-            day_of_week (int): День недели (0 = Понедельник, 6 = Воскресенье)
+            start_date (str): Начальная дата в формате "ГГГГ-ММ-ДД"
+            end_date (str): Конечная дата в формате "ГГГГ-ММ-ДД"
             
         Returns:
-            dict: Словарь с информацией о рабочих часах
+            list: Список записей (models.Appointment)
         """
         try:
             conn = self._connect()
             cursor = conn.cursor()
+            cursor.row_factory = Appointment.from_row
             
+            # Сравниваем строки напрямую, чтобы запрос использовал индекс по appointment_datetime
             cursor.execute(
-                "SELECT id, day_of_week, start_time, end_time FROM working_hours WHERE day_of_week = ?",
-                (day_of_week,)
+                """
+                SELECT id, user_id, service_id, appointment_datetime, duration
+                FROM appointments
+                WHERE appointment_datetime >= ? AND appointment_datetime < ?
+                ORDER BY appointment_datetime
+                """,
+                (start_date, _next_day(end_date))
             )
             
-            row = cursor.fetchone()
-            
-            if row:
-                return dict(row)
-            return None
+            return cursor.fetchall()
         except sqlite3.Error as e:
-            print(f"Ошибка при получении рабочих часов: {e}")
-            return None
+            logger.error(f"Ошибка при получении записей по диапазону дат: {e}")
+            return []
         finally:
             self._close()
     
-    def add_reminder(self, appointment_id, reminder_datetime):
+    def iter_appointments_by_date_range(self, start_date, end_date, chunk_size=1000):
         """
-        Добавляет напоминание о записи
+        Построчно отдает записи в заданном диапазоне дат, читая их из базы порциями.
+        В отличие от get_appointments_by_date_range не загружает весь диапазон в память,
+        поэтому подходит для экспорта больших объемов данных
         
         Args:
-            appointment_id (int): ID записи
-            reminder_datetime (str): Дата и время напоминания в формате "ГГГГ-ММ-ДД ЧЧ:ММ:СС"
+            start_date (str): Начальная дата в формате "ГГГГ-ММ-ДД"
+            end_date (str): Конечная дата в формате "ГГГГ-ММ-ДД"
+            chunk_size (int): Количество строк, читаемых за один раз
             
-        Returns:
-            int: ID созданного напоминания
+        Yields:
+            Appointment: Запись вместе с названием и стоимостью услуги
         """
+        conn = self._new_connection()
         try:
-            conn = self._connect()
             cursor = conn.cursor()
-            
+            cursor.row_factory = Appointment.from_row
             cursor.execute(
-                "INSERT INTO reminders (appointment_id, reminder_datetime, sent) VALUES (?, ?, 0)",
-                (appointment_id, reminder_datetime)
+                """
+                SELECT a.id, a.user_id, a.user_name, a.service_id,
+                       s.name AS service_name, s.price AS service_price,
+                       a.appointment_datetime, a.duration, a.created_at
+                FROM appointments a
+                LEFT JOIN services s ON s.id = a.service_id
+                WHERE a.appointment_datetime >= ? AND a.appointment_datetime < ?
+                ORDER BY a.appointment_datetime
+                """,
+                (start_date, _next_day(end_date))
             )
             
-            conn.commit()
-            return cursor.lastrowid
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield from rows
         except sqlite3.Error as e:
-            print(f"Ошибка при добавлении напоминания: {e}")
-            return None
+            logger.error(f"Ошибка при потоковом чтении записей: {e}")
         finally:
-            self._close()
+            conn.close()
     
-    def get_pending_reminders(self):
+    def import_appointments(self, rows, batch_size=10000, check_conflicts=True):
         """
-        Получает список неотправленных напоминаний, которые должны быть отправлены
+        Массово импортирует записи (например, историю из другой системы).
+        Строки вставляются через executemany пачками, каждая пачка - одна транзакция.
+        Пересечения проверяются сразу для всей пачки: существующие записи за даты пачки
+        загружаются одним диапазонным запросом
         
+        Args:
+            rows (iterable): Кортежи (user_id, user_name, service_id,
+                appointment_datetime, duration, created_at); created_at может быть None
+            batch_size (int): Количество строк в одной транзакции
+            check_conflicts (bool): Пропускать записи, пересекающиеся с уже существующими
+            
         Returns:
-            list: Список словарей с напоминаниями
+            dict: Количество импортированных ('imported') и пропущенных ('conflicts') строк
         """
+        imported = 0
+        conflicts = 0
+        user_ids = set()
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        
         try:
             conn = self._connect()
             cursor = conn.cursor()
             
-            cursor.execute(
-                """
-                SELECT r.id, r.appointment_id, r.reminder_datetime,
-                       a.user_id, a.service_id, a.appointment_datetime
-                FROM reminders r
-                JOIN appointments a ON r.appointment_id = a.id
-                WHERE r.sent = 0 AND datetime(r.reminder_datetime) <= datetime('now')
-                """
-            )
+            batch = []
+            for row in rows:
+                user_id, user_name, service_id, appointment_datetime, duration, created_at = row
+                batch.append((
+                    int(user_id), user_name, int(service_id),
+                    appointment_datetime, int(duration), created_at or now
+                ))
+                user_ids.add(int(user_id))
+                if len(batch) >= batch_size:
+                    inserted = self._import_batch(cursor, batch, check_conflicts)
+                    conn.commit()
+                    imported += inserted
+                    conflicts += len(batch) - inserted
+                    batch = []
             
-            # Преобразуем результат в список словарей
-            reminders = [dict(row) for row in cursor.fetchall()]
+            if batch:
+                inserted = self._import_batch(cursor, batch, check_conflicts)
+                conn.commit()
+                imported += inserted
+                conflicts += len(batch) - inserted
             
-            return reminders
-        except sqlite3.Error as e:
-            print(f"Ошибка при получении напоминаний: {e}")
-            return []
+            # Импорт мог затронуть закэшированные даты - перечитываем их
+            if self._cache_window is not None:
+                self._load_occupancy_cache(cursor, *self._cache_window)
+        except (sqlite3.Error, ValueError) as e:
+            logger.error(f"Ошибка при импорте записей: {e}")
+            if self.conn:
+                self.conn.rollback()
         finally:
             self._close()
+        
+        if imported:
+            self._notify_changed(user_ids)
+        return {'imported': imported, 'conflicts': conflicts}
     
-    def mark_reminder_as_sent(self, reminder_id):
+    def _import_batch(self, cursor, batch, check_conflicts):
         """
-        Отмечает напоминание как отправленное
+        Вставляет одну пачку импортируемых записей
         
         Args:
-            reminder_id (int): ID напоминания
+            cursor (sqlite3.Cursor): Курсор открытого соединения
+            batch (list): Список кортежей для вставки
+            check_conflicts (bool): Проверять ли пересечения
             
         Returns:
-            bool: True в случае успешного обновления, False в противном случае
+            int: Количество вставленных строк
+        """
+        if check_conflicts:
+            # Сортируем пачку по времени, чтобы пересечения внутри пачки находились так же,
+            # как и пересечения с уже сохраненными записями
+            batch.sort(key=lambda item: item[3])
+            
+            # Загружаем занятость за все даты пачки одним запросом с группировкой:
+            # {дата: {(начало, ID услуги, длительность): количество записавшихся}}
+            cursor.execute("SELECT id, capacity FROM services")
+            capacities = dict(cursor.fetchall())
+            busy = {}
+            for group in self._query_occupancy(cursor, batch[0][3][:10], _next_day(batch[-1][3][:10])):
+                busy.setdefault(group['appointment_datetime'][:10], {})[
+                    (group['appointment_datetime'], group['service_id'], group['duration'])
+                ] = group['booked']
+            
+            accepted = []
+            seen = set()
+            for item in batch:
+                # Повтор строки внутри пачки не вставится (уникальный индекс), места он не занимает
+                if (item[0], item[3]) in seen:
+                    continue
+                seen.add((item[0], item[3]))
+                day = busy.setdefault(item[3][:10], {})
+                key = (item[3], item[2], item[4])
+                # Как и в add_appointment, запись может присоединиться только к неполной
+                # группе той же услуги с тем же временем; любое другое пересечение - конфликт.
+                # Проверяются все группы дня, а не только соседние: уже сохраненные
+                # записи (групповые или импортированные без проверки) могут пересекаться
+                if _import_conflicts(day, key, capacities.get(item[2], 1)):
+                    continue
+                day[key] = day.get(key, 0) + 1
+                accepted.append(item)
+            batch = accepted
+        
+        # Построчный триггер полнотекстового индекса замедляет массовую вставку в несколько раз,
+        # поэтому на время пачки он снимается, а новые строки индексируются одним запросом.
+        # Изменения схемы в SQLite транзакционны: другие соединения видят триггер на месте
+        if not cursor.connection.in_transaction:
+            cursor.execute("BEGIN")
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM appointments")
+        last_id = cursor.fetchone()[0]
+        cursor.execute("DROP TRIGGER IF EXISTS trg_appointments_fts_insert")
+        
+        cursor.executemany(
+            """
+            INSERT OR IGNORE INTO appointments
+            (user_id, user_name, service_id, appointment_datetime, duration, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            batch
+        )
+        # Строки, уже имеющиеся в базе (повторный импорт), не вставляются
+        inserted = cursor.rowcount
+        
+        cursor.execute(
+            """
+            INSERT INTO appointments_fts (rowid, user_name, service_name)
+            SELECT a.id, replace(replace(a.user_name, 'ё', 'е'), 'Ё', 'Е'),
+                   replace(replace(s.name, 'ё', 'е'), 'Ё', 'Е')
+            FROM appointments a
+            LEFT JOIN services s ON s.id = a.service_id
+            WHERE a.id > ?
+            """,
+            (last_id,)
+        )
+        self._create_fts_insert_trigger(cursor)
+        return inserted
+    
+    def get_schedule(self):
+        """
+        Возвращает скомпилированное расписание работы. Расписание читается
+        из базы только при первом обращении и после изменений
+        
+        Returns:
+            WorkingSchedule: Расписание с рабочими интервалами по датам
         """
+        if self._schedule is not None:
+            return self._schedule
+        
         try:
             conn = self._connect()
             cursor = conn.cursor()
             
-            cursor.execute(
-                "UPDATE reminders SET sent = 1 WHERE id = ?",
-                (reminder_id,)
-            )
-            
-            conn.commit()
-            return cursor.rowcount > 0
+            self._schedule = self._load_schedule(cursor)
+            return self._schedule
         except sqlite3.Error as e:
-            print(f"Ошибка при обновлении напоминания: {e}")
-            return False
+            logger.error(f"Ошибка при загрузке расписания: {e}")
+            return WorkingSchedule({}, {})
+        finally:
+            self._close()
+    
+    def _load_schedule(self, cursor):
+        """
+        Читает рабочие часы и особые дни и собирает из них расписание
+        
+        Args:
+            cursor (sqlite3.Cursor): Курсор открытого соединения
+            
+        Returns:
+            WorkingSchedule: Скомпилированное расписание
+        """
+        cursor.execute("SELECT day_of_week, start_time, end_time FROM working_hours")
+        weekly_rows = cursor.fetchall()
+        
+        cursor.execute("SELECT date, start_time, end_time FROM schedule_overrides")
+        override_rows = cursor.fetchall()
+        
+        return WorkingSchedule.from_rows(weekly_rows, override_rows)
+    
+    def set_weekly_hours(self, day_of_week, intervals):
+        """
+        Заменяет рабочие интервалы дня недели
+        
+        Args:
+            day_of_week (int): День недели (0 = Понедельник, 6 = Воскресенье)
+            intervals (list): Кортежи (начало "ЧЧ:ММ", конец "ЧЧ:ММ"),
+                пустой список делает день выходным
+            
+        Returns:
+            bool: True в случае успеха, False в противном случае
+        """
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            
+            cursor.execute("DELETE FROM working_hours WHERE day_of_week = ?", (day_of_week,))
+            cursor.executemany(
+                "INSERT INTO working_hours (day_of_week, start_time, end_time) VALUES (?, ?, ?)",
+                [(day_of_week, start_time, end_time) for start_time, end_time in intervals]
+            )
+            
+            conn.commit()
+            
+            # Сразу пересобираем расписание, чтобы поиск слотов не обращался к базе
+            self._schedule = self._load_schedule(cursor)
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при изменении рабочих часов: {e}")
+            return False
+        finally:
+            self._close()
+    
+    def set_date_override(self, date, intervals):
+        """
+        Задает особое расписание на дату (праздник, сокращенный или перенесенный день)
+        
+        Args:
+            date (str): Дата в формате "ГГГГ-ММ-ДД"
+            intervals (list): Кортежи (начало "ЧЧ:ММ", конец "ЧЧ:ММ"),
+                пустой список делает день выходным
+            
+        Returns:
+            bool: True в случае успеха, False в противном случае
+        """
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            
+            cursor.execute("DELETE FROM schedule_overrides WHERE date = ?", (date,))
+            cursor.executemany(
+                "INSERT INTO schedule_overrides (date, start_time, end_time) VALUES (?, ?, ?)",
+                [(date, start_time, end_time) for start_time, end_time in intervals] or [(date, None, None)]
+            )
+            
+            conn.commit()
+            
+            self._schedule = self._load_schedule(cursor)
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при изменении расписания на дату: {e}")
+            return False
+        finally:
+            self._close()
+    
+    def clear_date_override(self, date):
+        """
+        Удаляет особое расписание на дату, возвращая обычное расписание дня недели
+        
+        Args:
+            date (str): Дата в формате "ГГГГ-ММ-ДД"
+            
+        Returns:
+            bool: True, если особое расписание было удалено, False в противном случае
+        """
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            
+            cursor.execute("DELETE FROM schedule_overrides WHERE date = ?", (date,))
+            
+            conn.commit()
+            
+            self._schedule = self._load_schedule(cursor)
+            return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при удалении расписания на дату: {e}")
+            return False
+        finally:
+            self._close()
+    
+    def add_reminder(self, appointment_id, reminder_datetime):
+        """
+        Добавляет напоминание о записи
+        
+        Args:
+            appointment_id (int): ID записи
+            reminder_datetime (str): Дата и время напоминания в формате "ГГГГ-ММ-ДД ЧЧ:ММ:СС"
+            
+        Returns:
+            int: ID созданного напоминания (или уже существующего такого же)
+        """
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            
+            cursor.execute(
+                "INSERT OR IGNORE INTO reminders (appointment_id, reminder_datetime, sent) VALUES (?, ?, 0)",
+                (appointment_id, reminder_datetime)
+            )
+            
+            if cursor.rowcount == 0:
+                cursor.execute(
+                    "SELECT id FROM reminders WHERE appointment_id = ? AND reminder_datetime = ?",
+                    (appointment_id, reminder_datetime)
+                )
+                return cursor.fetchone()[0]
+            
+            conn.commit()
+            
+            if self._reminders_cache is not None:
+                cursor.execute(
+                    """
+                    SELECT r.id, r.appointment_id, r.reminder_datetime,
+                           a.user_id, a.service_id, a.appointment_datetime
+                    FROM reminders r
+                    JOIN appointments a ON r.appointment_id = a.id
+                    WHERE r.id = ?
+                    """,
+                    (cursor.lastrowid,)
+                )
+                row = cursor.fetchone()
+                if row:
+                    self._reminders_cache[row['id']] = Reminder.from_row(cursor, row)
+            return cursor.lastrowid
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при добавлении напоминания: {e}")
+            return None
+        finally:
+            self._close()
+    
+    def get_pending_reminders(self):
+        """
+        Получает список неотправленных напоминаний, которые должны быть отправлены
+        
+        Returns:
+            list: Список напоминаний (models.Reminder)
+        """
+        if self._reminders_cache is not None:
+            now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            return [
+                reminder for reminder in self._reminders_cache.values()
+                if reminder.reminder_datetime <= now
+            ]
+        
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            cursor.row_factory = Reminder.from_row
+            
+            cursor.execute(
+                """
+                SELECT r.id, r.appointment_id, r.reminder_datetime,
+                       a.user_id, a.service_id, a.appointment_datetime
+                FROM reminders r
+                JOIN appointments a ON r.appointment_id = a.id
+                WHERE r.sent = 0 AND datetime(r.reminder_datetime) <= datetime('now', 'localtime')
+                """
+            )
+            
+            return cursor.fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при получении напоминаний: {e}")
+            return []
+        finally:
+            self._close()
+    
+    def mark_reminder_as_sent(self, reminder_id):
+        """
+        Отмечает напоминание как отправленное
+        
+        Args:
+            reminder_id (int): ID напоминания
+            
+        Returns:
+            bool: True в случае успешного обновления, False в противном случае
+        """
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            
+            cursor.execute(
+                "UPDATE reminders SET sent = 1 WHERE id = ?",
+                (reminder_id,)
+            )
+            
+            conn.commit()
+            
+            if self._reminders_cache is not None:
+                self._reminders_cache.pop(reminder_id, None)
+            return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при обновлении напоминания: {e}")
+            return False
+        finally:
+            self._close()
+    
+    def _rebuild_stats(self, cursor):
+        """
+        Пересчитывает сводную таблицу статистики по всем записям
+        
+        Args:
+            cursor (sqlite3.Cursor): Курсор открытого соединения
+        """
+        cursor.execute("DELETE FROM daily_stats")
+        cursor.execute(
+            """
+            INSERT INTO daily_stats (date, service_id, bookings, revenue, booked_minutes)
+            SELECT substr(a.appointment_datetime, 1, 10), a.service_id, COUNT(*),
+                   COALESCE(SUM(s.price), 0), SUM(a.duration)
+            FROM appointments a
+            LEFT JOIN services s ON s.id = a.service_id
+            GROUP BY substr(a.appointment_datetime, 1, 10), a.service_id
+            """
+        )
+    
+    def rebuild_stats(self):
+        """
+        Полностью пересчитывает статистику (например, после изменения цен услуг)
+        
+        Returns:
+            bool: True в случае успешного пересчета, False в противном случае
+        """
+        # Пересчет выполняется в отдельном потоке (asyncio.to_thread), поэтому
+        # использует свое соединение, а не общее self.conn цикла событий
+        conn = self._new_connection()
+        try:
+            cursor = conn.cursor()
+            
+            self._rebuild_stats(cursor)
+            
+            conn.commit()
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при пересчете статистики: {e}")
+            return False
+        finally:
+            conn.close()
+    
+    def get_stats(self, start_date, end_date):
+        """
+        Получает статистику по услугам за период из сводной таблицы
+        
+        Args:
+            start_date (str): Начальная дата в формате "ГГГГ-ММ-ДД"
+            end_date (str): Конечная дата в формате "ГГГГ-ММ-ДД"
+            
+        Returns:
+            dict: Список услуг со статистикой ('services'), а также количество
+                забронированных ('booked_minutes') и рабочих ('working_minutes') минут
+        """
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            
+            cursor.execute(
+                """
+                SELECT st.service_id, s.name, SUM(st.bookings) AS bookings,
+                       SUM(st.revenue) AS revenue, SUM(st.booked_minutes) AS booked_minutes
+                FROM daily_stats st
+                LEFT JOIN services s ON s.id = st.service_id
+                WHERE st.date BETWEEN ? AND ?
+                GROUP BY st.service_id
+                HAVING SUM(st.bookings) > 0
+                ORDER BY revenue DESC
+                """,
+                (start_date, end_date)
+            )
+            services = [dict(row) for row in cursor.fetchall()]
+            
+            # Рабочее время за период считаем по расписанию с учетом перерывов и особых дней
+            if self._schedule is None:
+                self._schedule = self._load_schedule(cursor)
+            
+            return {
+                'services': services,
+                'booked_minutes': sum(service['booked_minutes'] for service in services),
+                'working_minutes': self._schedule.working_minutes(start_date, end_date),
+            }
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при получении статистики: {e}")
+            return {'services': [], 'booked_minutes': 0, 'working_minutes': 0}
+        finally:
+            self._close()
+    
+    def warm_up(self, days_ahead=14):
+        """
+        Загружает в память каталог услуг, расписание, неотправленные напоминания
+        и записи на ближайшие дни. После этого соответствующие методы чтения
+        отвечают из памяти, а методы записи поддерживают кэш в актуальном состоянии
+        
+        Args:
+            days_ahead (int): На сколько дней вперед (начиная с сегодня) кэшировать записи
+            
+        Returns:
+            dict: Количество загруженных объектов каждого вида
+        """
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            
+            cursor.execute("SELECT id, name, duration, price, capacity FROM services")
+            services = {row['id']: Service.from_row(cursor, row) for row in cursor.fetchall()}
+            
+            schedule = self._load_schedule(cursor)
+            
+            cursor.execute(
+                """
+                SELECT r.id, r.appointment_id, r.reminder_datetime,
+                       a.user_id, a.service_id, a.appointment_datetime
+                FROM reminders r
+                JOIN appointments a ON r.appointment_id = a.id
+                WHERE r.sent = 0
+                """
+            )
+            reminders = {row['id']: Reminder.from_row(cursor, row) for row in cursor.fetchall()}
+            
+            today = datetime.now()
+            self._load_occupancy_cache(
+                cursor,
+                today.strftime("%Y-%m-%d"),
+                (today + timedelta(days=days_ahead)).strftime("%Y-%m-%d")
+            )
+            
+            self._services_cache = services
+            self._schedule = schedule
+            self._reminders_cache = reminders
+            
+            return {
+                'services': len(services),
+                'working_days': len(schedule.weekly),
+                'schedule_overrides': len(schedule.overrides),
+                'reminders': len(reminders),
+                'appointments': sum(sum(day.values()) for day in self._occupancy_cache.values()),
+            }
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при загрузке кэша: {e}")
+            return {}
+        finally:
+            self._close()
+    
+    def cool_down(self):
+        """
+        Освобождает кэши, загруженные методом warm_up. Дальше запросы снова идут
+        напрямую в базу данных, пока warm_up не будет вызван еще раз
+        """
+        self._services_cache = None
+        self._schedule = None
+        self._reminders_cache = None
+        self._occupancy_cache = None
+        self._cache_window = None
+    
+    def _load_occupancy_cache(self, cursor, start_date, end_date):
+        """
+        Загружает занятость за период [start_date, end_date) в кэш
+        
+        Args:
+            cursor (sqlite3.Cursor): Курсор открытого соединения
+            start_date (str): Первая дата в формате "ГГГГ-ММ-ДД"
+            end_date (str): Дата, следующая за последней кэшируемой
+        """
+        occupancy = {}
+        for row in self._query_occupancy(cursor, start_date, end_date):
+            occupancy.setdefault(row['appointment_datetime'][:10], {})[
+                (row['appointment_datetime'], row['service_id'], row['duration'])
+            ] = row['booked']
+        
+        self._occupancy_cache = occupancy
+        self._cache_window = (start_date, end_date)
+    
+    def _cache_appointment(self, appointment):
+        """
+        Учитывает новую запись в кэше занятости, если ее дата попадает в закэшированный период
+        """
+        if self._cache_window is None:
+            return
+        
+        date = appointment['appointment_datetime'][:10]
+        if self._cache_window[0] <= date < self._cache_window[1]:
+            day = self._occupancy_cache.setdefault(date, {})
+            key = (appointment['appointment_datetime'], appointment['service_id'], appointment['duration'])
+            day[key] = day.get(key, 0) + 1
+    
+    def _uncache_appointments(self, appointments):
+        """
+        Убирает удаленные записи из кэша занятости и удаляет их напоминания из кэша.
+        Напоминания всех записей удаляются за один проход по кэшу
+        """
+        if self._cache_window is not None:
+            for appointment in appointments:
+                day = self._occupancy_cache.get(appointment['appointment_datetime'][:10], {})
+                key = (appointment['appointment_datetime'], appointment['service_id'], appointment['duration'])
+                if day.get(key, 0) > 1:
+                    day[key] -= 1
+                else:
+                    day.pop(key, None)
+        
+        if self._reminders_cache is not None and appointments:
+            appointment_ids = {appointment['id'] for appointment in appointments}
+            for reminder_id in [
+                reminder['id'] for reminder in self._reminders_cache.values()
+                if reminder['appointment_id'] in appointment_ids
+            ]:
+                del self._reminders_cache[reminder_id]
+    
+    def _query_occupancy(self, cursor, start_date, end_date):
+        """
+        Считает занятость за период [start_date, end_date) одним запросом с GROUP BY
+        по покрывающему индексу idx_appointments_occupancy
+        
+        Returns:
+            list: Строки с полями appointment_datetime, service_id, duration, booked
+        """
+        cursor.execute(
+            """
+            SELECT appointment_datetime, service_id, duration, COUNT(*) AS booked
+            FROM appointments
+            WHERE appointment_datetime >= ? AND appointment_datetime < ?
+            GROUP BY appointment_datetime, service_id, duration
+            ORDER BY appointment_datetime
+            """,
+            (start_date, end_date)
+        )
+        return cursor.fetchall()
+    
+    def get_occupancy(self, start_date, end_date):
+        """
+        Получает занятость в заданном диапазоне дат: записи, сгруппированные
+        по времени начала, услуге и длительности, с количеством записавшихся
+        
+        Args:
+            start_date (str): Начальная дата в формате "ГГГГ-ММ-ДД"
+            end_date (str): Конечная дата в формате "ГГГГ-ММ-ДД"
+            
+        Returns:
+            list: Список словарей с полями appointment_datetime, service_id,
+                duration и booked, отсортированный по времени
+        """
+        if self._cache_window is not None:
+            window_start, window_end = self._cache_window
+            if window_start <= start_date and _next_day(end_date) <= window_end:
+                occupancy = []
+                day = start_date
+                while day <= end_date:
+                    for (appointment_datetime, service_id, duration), booked in self._occupancy_cache.get(day, {}).items():
+                        occupancy.append({
+                            'appointment_datetime': appointment_datetime, 'service_id': service_id,
+                            'duration': duration, 'booked': booked
+                        })
+                    day = _next_day(day)
+                occupancy.sort(key=lambda item: item['appointment_datetime'])
+                return occupancy
+        
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            
+            return [dict(row) for row in self._query_occupancy(cursor, start_date, _next_day(end_date))]
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при получении занятости: {e}")
+            return []
+        finally:
+            self._close()
+    
+    def set_service_capacity(self, service_id, capacity):
+        """
+        Изменяет вместимость услуги
+        
+        Args:
+            service_id (int): ID услуги
+            capacity (int): Сколько клиентов может записаться на одно время
+            
+        Returns:
+            bool: True в случае успешного обновления, False в противном случае
+        """
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            
+            cursor.execute("UPDATE services SET capacity = ? WHERE id = ?", (capacity, service_id))
+            
+            conn.commit()
+            
+            # Строка в кэше заменяется копией: изменять ее на месте нельзя (она хэшируется)
+            if self._services_cache is not None and service_id in self._services_cache:
+                self._services_cache[service_id] = self._services_cache[service_id].replace(capacity=capacity)
+            return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при изменении вместимости услуги: {e}")
+            return False
+        finally:
+            self._close()
+    
+    def add_to_waitlist(self, user_id, service_id, duration, date_from, date_to, time_from, time_to):
+        """
+        Добавляет пользователя в лист ожидания
+        
+        Args:
+            user_id (int): ID пользователя Telegram
+            service_id (int): ID услуги
+            duration (int): Длительность услуги в минутах
+            date_from (str): Первая подходящая дата в формате "ГГГГ-ММ-ДД"
+            date_to (str): Последняя подходящая дата в формате "ГГГГ-ММ-ДД"
+            time_from (int): Начало подходящего окна в минутах от начала дня
+            time_to (int): Конец подходящего окна в минутах от начала дня
+            
+        Returns:
+            int: ID заявки в листе ожидания
+        """
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            
+            created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            
+            cursor.execute(
+                """
+                INSERT INTO waitlist
+                (user_id, service_id, duration, date_from, date_to, time_from, time_to, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (user_id, service_id, duration, date_from, date_to, time_from, time_to, created_at)
+            )
+            entry_id = cursor.lastrowid
+            cursor.execute(
+                "INSERT INTO waitlist_index (id, date_from, date_to, time_from, time_to) VALUES (?, ?, ?, ?, ?)",
+                (entry_id, int(date_from.replace('-', '')), int(date_to.replace('-', '')), time_from, time_to)
+            )
+            
+            conn.commit()
+            return entry_id
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при добавлении в лист ожидания: {e}")
+            return None
+        finally:
+            self._close()
+    
+    def find_waitlist_matches(self, date, free_from, free_to, limit, service_ids=None, after_id=0):
+        """
+        Находит заявки листа ожидания, которым подходит освободившийся интервал.
+        Кандидаты отбираются по R*Tree-индексу, затем проверяется услуга и то, что она
+        помещается в пересечение окна заявки и свободного интервала
+        
+        Args:
+            date (str): Дата освободившегося интервала в формате "ГГГГ-ММ-ДД"
+            free_from (int): Начало свободного интервала в минутах от начала дня
+            free_to (int): Конец свободного интервала в минутах от начала дня
+            limit (int): Максимальное количество заявок
+            service_ids (list): ID услуг, заявки на которые нужны (None - любые)
+            after_id (int): Вернуть только заявки с ID больше этого (следующая страница)
+            
+        Returns:
+            list: Список словарей с заявками в порядке очереди
+        """
+        if service_ids is not None and not service_ids:
+            return []
+        
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            
+            day = int(date.replace('-', ''))
+            service_filter = ""
+            params = [day, day, free_to, free_from, free_from, free_to, after_id]
+            if service_ids is not None:
+                service_filter = f"AND w.service_id IN ({', '.join('?' * len(service_ids))})"
+                params.extend(service_ids)
+            params.append(limit)
+            cursor.execute(
+                f"""
+                SELECT w.id, w.user_id, w.service_id, w.duration, w.date_from, w.date_to,
+                       w.time_from, w.time_to
+                FROM waitlist_index i
+                JOIN waitlist w ON w.id = i.id
+                WHERE i.date_from <= ? AND i.date_to >= ?
+                  AND i.time_from < ? AND i.time_to > ?
+                  AND MAX(w.time_from, ?) + w.duration <= MIN(w.time_to, ?)
+                  AND i.id > ?
+                  {service_filter}
+                ORDER BY w.id
+                LIMIT ?
+                """,
+                params
+            )
+            
+            return [dict(row) for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при поиске в листе ожидания: {e}")
+            return []
+        finally:
+            self._close()
+    
+    def remove_from_waitlist(self, entry_ids):
+        """
+        Удаляет заявки из листа ожидания (например, после уведомления)
+        
+        Args:
+            entry_ids (list): Список ID заявок
+            
+        Returns:
+            int: Количество удаленных заявок
+        """
+        if not entry_ids:
+            return 0
+        
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            
+            params = [(entry_id,) for entry_id in entry_ids]
+            cursor.executemany("DELETE FROM waitlist_index WHERE id = ?", params)
+            cursor.executemany("DELETE FROM waitlist WHERE id = ?", params)
+            
+            conn.commit()
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при удалении из листа ожидания: {e}")
+            return 0
+        finally:
+            self._close()
+    
+    def purge_expired_waitlist(self, today):
+        """
+        Удаляет заявки, период которых уже закончился
+        
+        Args:
+            today (str): Текущая дата в формате "ГГГГ-ММ-ДД"
+            
+        Returns:
+            int: Количество удаленных заявок
+        """
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            
+            cursor.execute(
+                "DELETE FROM waitlist_index WHERE date_to < ?",
+                (int(today.replace('-', '')),)
+            )
+            cursor.execute("DELETE FROM waitlist WHERE date_to < ?", (today,))
+            
+            conn.commit()
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при очистке листа ожидания: {e}")
+            return 0
+        finally:
+            self._close()
+    
+    def get_client_ids(self):
+        """
+        Получает ID всех пользователей, которые когда-либо записывались
+        
+        Returns:
+            list: Список ID пользователей Telegram
+        """
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            
+            cursor.execute("SELECT DISTINCT user_id FROM appointments")
+            
+            return [row[0] for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при получении списка клиентов: {e}")
+            return []
+        finally:
+            self._close()
+    
+    def search_appointments(self, query, limit=10, offset=0):
+        """
+        Ищет записи по имени клиента и названию услуги через полнотекстовый индекс.
+        Каждое слово запроса ищется как начало слова, все слова должны найтись
+        
+        Args:
+            query (str): Поисковый запрос, например "иван конс"
+            limit (int): Сколько записей вернуть
+            offset (int): Сколько первых найденных записей пропустить
+            
+        Returns:
+            list: Список записей (models.Appointment) вместе с user_name и service_name,
+                сначала самые новые
+        """
+        terms = search_terms(query)
+        if not terms:
+            return []
+        
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            cursor.row_factory = Appointment.from_row
+            
+            # Страница выбирается внутри индекса по rowid (ID записи) без сортировки всех совпадений
+            cursor.execute(
+                """
+                SELECT a.id, a.user_id, a.user_name, a.service_id, s.name AS service_name,
+                       a.appointment_datetime, a.duration
+                FROM (
+                    SELECT rowid FROM appointments_fts
+                    WHERE appointments_fts MATCH ?
+                    ORDER BY rowid DESC
+                    LIMIT ? OFFSET ?
+                ) found
+                JOIN appointments a ON a.id = found.rowid
+                LEFT JOIN services s ON s.id = a.service_id
+                ORDER BY a.id DESC
+                """,
+                (" ".join(f'"{term}"*' for term in terms), limit, offset)
+            )
+            
+            return cursor.fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при поиске записей: {e}")
+            return []
+        finally:
+            self._close()
+    
+    def add_appointment_series(self, user_id, user_name, service_id, duration, occurrences, interval_weeks,
+                               capacity=1):
+        """
+        Создает серию повторяющихся записей вместе с напоминаниями в одной транзакции.
+        Пересечения со всеми уже существующими записями проверяются одним запросом,
+        занятые даты пропускаются. Для групповой услуги можно присоединиться
+        к неполной группе той же услуги
+        
+        Args:
+            user_id (int): ID пользователя Telegram
+            user_name (str): Имя пользователя Telegram
+            service_id (int): ID услуги
+            duration (int): Длительность приема в минутах
+            occurrences (list): Кортежи (дата и время приема "ГГГГ-ММ-ДД ЧЧ:ММ",
+                дата и время напоминания "ГГГГ-ММ-ДД ЧЧ:ММ:СС")
+            interval_weeks (int): Интервал повторения в неделях
+            capacity (int): Вместимость услуги
+            
+        Returns:
+            dict: ID серии ('series_id'), созданные записи ('appointments')
+                и пропущенные из-за пересечений даты ('conflicts')
+        """
+        result = {'series_id': None, 'appointments': [], 'conflicts': []}
+        
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            
+            # Блокируем запись сразу, чтобы между проверкой и вставкой никто не занял время
+            cursor.execute("BEGIN IMMEDIATE")
+            
+            # Один запрос на все даты серии: по диапазону на каждую дату, чтобы работал индекс
+            dates = sorted({appointment_datetime[:10] for appointment_datetime, _ in occurrences})
+            cursor.execute(
+                "SELECT appointment_datetime, service_id, duration, COUNT(*), MAX(user_id = ?) FROM appointments WHERE "
+                + " OR ".join(["(appointment_datetime >= ? AND appointment_datetime < ?)"] * len(dates))
+                + " GROUP BY appointment_datetime, service_id, duration",
+                [user_id] + [value for date in dates for value in (date, _next_day(date))]
+            )
+            busy = {}
+            joinable = set()
+            for appointment_datetime, group_service_id, appointment_duration, booked, own in cursor.fetchall():
+                # К неполной группе той же услуги можно присоединиться в то же время,
+                # если пользователь еще не записан в нее
+                if (
+                    group_service_id == service_id and appointment_duration == duration
+                    and booked < capacity and not own
+                ):
+                    joinable.add(appointment_datetime)
+                start = _minutes(appointment_datetime)
+                busy.setdefault(appointment_datetime[:10], []).append(
+                    (start, start + appointment_duration, appointment_datetime)
+                )
+            
+            free = []
+            for appointment_datetime, reminder_datetime in occurrences:
+                start = _minutes(appointment_datetime)
+                end = start + duration
+                if any(
+                    start < busy_end and busy_start < end
+                    and not (group_datetime == appointment_datetime and group_datetime in joinable)
+                    for busy_start, busy_end, group_datetime in busy.get(appointment_datetime[:10], ())
+                ):
+                    result['conflicts'].append(appointment_datetime)
+                else:
+                    free.append((appointment_datetime, reminder_datetime))
+            
+            if not free:
+                conn.rollback()
+                return result
+            
+            created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            cursor.execute(
+                """
+                INSERT INTO appointment_series (user_id, service_id, interval_weeks, occurrences, created_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (user_id, service_id, interval_weeks, len(free), created_at)
+            )
+            series_id = cursor.lastrowid
+            
+            cursor.executemany(
+                """
+                INSERT INTO appointments
+                (user_id, user_name, service_id, appointment_datetime, duration, created_at, series_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (user_id, user_name, service_id, appointment_datetime, duration, created_at, series_id)
+                    for appointment_datetime, _ in free
+                ]
+            )
+            
+            cursor.execute(
+                "SELECT id, appointment_datetime FROM appointments WHERE series_id = ?",
+                (series_id,)
+            )
+            ids = {row['appointment_datetime']: row['id'] for row in cursor.fetchall()}
+            
+            cursor.executemany(
+                "INSERT INTO reminders (appointment_id, reminder_datetime, sent) VALUES (?, ?, 0)",
+                [(ids[appointment_datetime], reminder_datetime) for appointment_datetime, reminder_datetime in free]
+            )
+            
+            conn.commit()
+            
+            for appointment_datetime, reminder_datetime in free:
+                appointment = Appointment(
+                    id=ids[appointment_datetime], user_id=user_id, service_id=service_id,
+                    appointment_datetime=appointment_datetime, duration=duration, series_id=series_id
+                )
+                self._cache_appointment(appointment)
+                result['appointments'].append(appointment)
+            self._notify_changed((user_id,))
+            
+            # Напоминания серии добавляем в кэш одним запросом
+            if self._reminders_cache is not None:
+                cursor.execute(
+                    """
+                    SELECT r.id, r.appointment_id, r.reminder_datetime,
+                           a.user_id, a.service_id, a.appointment_datetime
+                    FROM reminders r
+                    JOIN appointments a ON r.appointment_id = a.id
+                    WHERE a.series_id = ? AND r.sent = 0
+                    """,
+                    (series_id,)
+                )
+                for row in cursor.fetchall():
+                    self._reminders_cache[row['id']] = Reminder.from_row(cursor, row)
+            
+            result['series_id'] = series_id
+            return result
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при создании серии записей: {e}")
+            if self.conn:
+                self.conn.rollback()
+            return {'series_id': None, 'appointments': [], 'conflicts': []}
+        finally:
+            self._close()
+    
+    def delete_appointment_series(self, series_id, user_id):
+        """
+        Отменяет все будущие записи серии вместе с их напоминаниями одной транзакцией
+        
+        Args:
+            series_id (int): ID серии
+            user_id (int): ID пользователя Telegram (владельца серии)
+            
+        Returns:
+            list: Список отмененных записей (models.Appointment)
+        """
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            
+            now = datetime.now().strftime("%Y-%m-%d %H:%M")
+            params = (series_id, user_id, now)
+            condition = "series_id = ? AND user_id = ? AND appointment_datetime > ?"
+            
+            cursor.execute(
+                f"""
+                SELECT id, user_id, service_id, appointment_datetime, duration, series_id
+                FROM appointments
+                WHERE {condition}
+                """,
+                params
+            )
+            appointments = [Appointment.from_row(cursor, row) for row in cursor.fetchall()]
+            
+            cursor.execute(
+                f"DELETE FROM reminders WHERE appointment_id IN (SELECT id FROM appointments WHERE {condition})",
+                params
+            )
+            cursor.execute(f"DELETE FROM appointments WHERE {condition}", params)
+            
+            conn.commit()
+            
+            self._uncache_appointments(appointments)
+            if appointments:
+                self._notify_changed((user_id,))
+            return appointments
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при отмене серии записей: {e}")
+            return []
+        finally:
+            self._close()
+    
+    def cancel_appointments_in_range(self, start_datetime, end_datetime):
+        """
+        Отменяет все записи, начинающиеся в заданном промежутке, вместе с их напоминаниями
+        одной транзакцией (например, когда специалист заболел)
+        
+        Args:
+            start_datetime (str): Начало промежутка "ГГГГ-ММ-ДД ЧЧ:ММ" (включительно)
+            end_datetime (str): Конец промежутка "ГГГГ-ММ-ДД ЧЧ:ММ" (не включительно)
+            
+        Returns:
+            list: Список отмененных записей (models.Appointment), отсортированный по времени
+        """
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            
+            # Блокируем запись сразу, чтобы между выборкой и удалением не появились новые записи
+            cursor.execute("BEGIN IMMEDIATE")
+            
+            params = (start_datetime, end_datetime)
+            condition = "appointment_datetime >= ? AND appointment_datetime < ?"
+            
+            cursor.execute(
+                f"""
+                SELECT id, user_id, user_name, service_id, appointment_datetime, duration, series_id
+                FROM appointments
+                WHERE {condition}
+                ORDER BY appointment_datetime
+                """,
+                params
+            )
+            appointments = [Appointment.from_row(cursor, row) for row in cursor.fetchall()]
+            
+            cursor.execute(
+                f"DELETE FROM reminders WHERE appointment_id IN (SELECT id FROM appointments WHERE {condition})",
+                params
+            )
+            cursor.execute(f"DELETE FROM appointments WHERE {condition}", params)
+            
+            conn.commit()
+            
+            self._uncache_appointments(appointments)
+            self._notify_changed({appointment['user_id'] for appointment in appointments})
+            return appointments
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при массовой отмене записей: {e}")
+            if self.conn:
+                self.conn.rollback()
+            return []
         finally:
             self._close()
\ No newline at end of file
@@ -0,0 +1,146 @@
+import hashlib
+import hmac
+import io
+import logging
+
+from aiohttp import web
+
+import metrics
+from appointments_io import write_ics
+
+logger = logging.getLogger(__name__)
+
+
+def feed_token(secret, user_id):
+    """
+    Вычисляет подпись ссылки на календарь пользователя
+
+    Args:
+        secret (str): Секретный ключ
+        user_id (int): ID пользователя Telegram
+
+    Returns:
+        str: HMAC-SHA256 от ID пользователя (первые 32 шестнадцатеричных символа)
+    """
+    return hmac.new(secret.encode(), str(user_id).encode(), hashlib.sha256).hexdigest()[:32]
+
+
+class IcsFeed:
+    def __init__(self, db, secret, base_url):
+        """
+        Инициализация HTTP-ленты календаря с записями пользователей
+
+        Каждый пользователь получает ссылку с подписью, по которой приложение календаря
+        периодически забирает его записи в формате iCalendar. Готовый файл и его ETag
+        хранятся в памяти, пока записи пользователя не изменятся (хранилище сообщает
+        об этом через add_change_listener), поэтому повторные запросы не обращаются
+        к базе данных, а запросы с If-None-Match получают пустой ответ 304
+
+        Args:
+            db (Storage): Хранилище записей
+            secret (str): Ключ для подписи ссылок
+            base_url (str): Внешний адрес сервера, например "https://bot.example.com"
+        """
+        self.db = db
+        self.secret = secret
+        self.base_url = base_url.rstrip('/')
+        self._cache = {}        # {id пользователя: (ETag, тело ответа)}
+        self._generations = {}  # {id пользователя: номер изменения записей}
+        self._runner = None
+
+        db.add_change_listener(self.invalidate)
+
+    def url(self, user_id):
+        """
+        Возвращает ссылку на календарь пользователя
+
+        Args:
+            user_id (int): ID пользователя Telegram
+
+        Returns:
+            str: Ссылка для подписки в приложении календаря
+        """
+        return f"{self.base_url}/calendar/{user_id}/{feed_token(self.secret, user_id)}.ics"
+
+    def invalidate(self, user_id):
+        """
+        Сбрасывает закэшированный календарь пользователя после изменения его записей
+        """
+        self._generations[user_id] = self._generations.get(user_id, 0) + 1
+        self._cache.pop(user_id, None)
+
+    def _render(self, user_id):
+        """
+        Строит календарь пользователя
+
+        Returns:
+            tuple: (ETag, тело ответа в UTF-8)
+        """
+        appointments = []
+        for appointment in self.db.get_user_appointments(user_id):
+            service = self.db.get_service_by_id(appointment.service_id)
+            appointments.append(appointment.replace(service_name=service.name if service else None))
+
+        file = io.StringIO()
+        write_ics(appointments, file, calendar_name="Мои записи")
+        body = file.getvalue().encode('utf-8')
+        return f'"{hashlib.sha256(body).hexdigest()[:16]}"', body
+
+    async def handle(self, request):
+        """
+        Отдает календарь пользователя по подписанной ссылке
+        """
+        try:
+            user_id = int(request.match_info['user_id'])
+        except ValueError:
+            raise web.HTTPNotFound()
+        if not hmac.compare_digest(request.match_info['token'], feed_token(self.secret, user_id)):
+            metrics.inc("ics_feed.forbidden")
+            raise web.HTTPNotFound()
+
+        cached = self._cache.get(user_id)
+        if cached is None:
+            metrics.inc("ics_feed.misses")
+            # Файл строится в цикле событий, а не в отдельном потоке: Database держит
+            # одно соединение на объект, и параллельный вызов из потока его бы перехватил.
+            # Запрос записей одного пользователя быстрый и выполняется только после изменений
+            generation = self._generations.get(user_id, 0)
+            cached = self._render(user_id)
+            if self._generations.get(user_id, 0) == generation:
+                self._cache[user_id] = cached
+        else:
+            metrics.inc("ics_feed.hits")
+
+        etag, body = cached
+        headers = {'ETag': etag, 'Cache-Control': 'private, max-age=300'}
+
+        if_none_match = request.headers.get('If-None-Match', '')
+        if if_none_match == '*' or etag in (tag.strip() for tag in if_none_match.split(',')):
+            metrics.inc("ics_feed.not_modified")
+            return web.Response(status=304, headers=headers)
+
+        return web.Response(body=body, content_type='text/calendar', charset='utf-8', headers=headers)
+
+    async def start(self, host, port):
+        """
+        Запускает HTTP-сервер ленты
+
+        Args:
+            host (str): Адрес, на котором слушает сервер
+            port (int): Порт
+        """
+        app = web.Application()
+        app.router.add_get('/calendar/{user_id}/{token}.ics', self.handle)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info(f"Лента календаря доступна на {host}:{port}")
+
+    async def stop(self):
+        """
+        Останавливает HTTP-сервер ленты
+        """
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,60 @@
+import time
+from collections import OrderedDict
+
+
+class IdempotencyStore:
+    def __init__(self, ttl, max_keys):
+        """
+        Инициализация хранилища ключей идемпотентности
+
+        Ключ "занимается" перед выполнением операции; повторная попытка занять его
+        в течение ttl секунд не удается, и операция не выполняется второй раз.
+        Ключи лежат в OrderedDict в порядке добавления, поэтому устаревшие
+        удаляются с начала словаря, а его размер ограничен max_keys
+
+        Args:
+            ttl (float): Сколько секунд помнить ключ
+            max_keys (int): Максимальное количество хранимых ключей
+        """
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._keys = OrderedDict()  # {ключ: время, когда ключ устареет}
+
+    def claim(self, key, now=None):
+        """
+        Занимает ключ, если он еще не занят
+
+        Args:
+            key (str): Ключ операции
+            now (float): Текущее время по time.monotonic()
+
+        Returns:
+            bool: True, если ключ занят впервые и операцию нужно выполнить,
+                False, если это повтор
+        """
+        now = time.monotonic() if now is None else now
+        self._evict(now)
+
+        if key in self._keys:
+            return False
+        self._keys[key] = now + self.ttl
+        return True
+
+    def release(self, key):
+        """
+        Освобождает ключ (например, если операция завершилась ошибкой и ее можно повторить)
+        """
+        self._keys.pop(key, None)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _evict(self, now):
+        """
+        Удаляет устаревшие ключи и самые старые ключи сверх лимита
+        """
+        while self._keys:
+            key, expires_at = next(iter(self._keys.items()))
+            if expires_at > now and len(self._keys) < self.max_keys:
+                break
+            del self._keys[key]
@@ -6,7 +6,7 @@ def get_services_keyboard(services):
     Создает клавиатуру с доступными услугами
     
     Args:
-        services (list): Список словарей с услугами
+        services (list): Список услуг (models.Service)
         
     Returns:
         InlineKeyboardMarkup: Клавиатура с кнопками для выбора услуги
@@ -14,10 +14,9 @@ def get_services_keyboard(services):
     builder = InlineKeyboardBuilder()
     
     for service in services:
-        button_text = f"{service['name']} ({service['duration']} мин, {service['price']} грн.)"
         builder.button(
-            text=button_text,
-            callback_data=f"service_{service['id']}"
+            text=service.label,
+            callback_data=f"service_{service.id}"
         )
     
     # Размещаем кнопки по одной в строке
@@ -25,21 +24,23 @@ def get_services_keyboard(services):
     
     return builder.as_markup()
 
-def get_time_slots_keyboard(time_slots):
+def get_time_slots_keyboard(time_slots, capacity=1):
     """
     Создает клавиатуру с доступными временными слотами
     
     Args:
-        time_slots (list): Список доступных временных слотов
+        time_slots (list): Список кортежей (время "ЧЧ:ММ", количество свободных мест)
+        capacity (int): Вместимость услуги; для групповых занятий на кнопках
+            показывается количество свободных мест
         
     Returns:
         InlineKeyboardMarkup: Клавиатура с кнопками для выбора времени
     """
     builder = InlineKeyboardBuilder()
     
-    for time_slot in time_slots:
+    for time_slot, seats in time_slots:
         builder.button(
-            text=time_slot,
+            text=f"{time_slot} ({seats} мест)" if capacity > 1 else time_slot,
             callback_data=f"time_{time_slot}"
         )
     
@@ -48,12 +49,79 @@ def get_time_slots_keyboard(time_slots):
     
     return builder.as_markup()
 
+def get_soonest_slots_keyboard(slots):
+    """
+    Создает клавиатуру с ближайшими свободными слотами на разные даты
+    
+    Args:
+        slots (list): Список кортежей (дата "ГГГГ-ММ-ДД", время "ЧЧ:ММ")
+        
+    Returns:
+        InlineKeyboardMarkup: Клавиатура с кнопками для выбора слота
+    """
+    builder = InlineKeyboardBuilder()
+    
+    for date, time_slot in slots:
+        # Показываем дату в формате ДД.ММ
+        builder.button(
+            text=f"{date[8:10]}.{date[5:7]} {time_slot}",
+            callback_data=f"soonest_{date}_{time_slot}"
+        )
+    
+    # Размещаем кнопки по 2 в строке
+    builder.adjust(2)
+    
+    return builder.as_markup()
+
+def _add_series_buttons(builder, appointments):
+    """
+    Добавляет кнопки отмены целой серии для повторяющихся записей
+    
+    Args:
+        builder (InlineKeyboardBuilder): Строитель клавиатуры
+        appointments (list): Список записей (models.Appointment)
+    """
+    series_counts = {}
+    for appointment in appointments:
+        if appointment.series_id:
+            series_counts[appointment.series_id] = series_counts.get(appointment.series_id, 0) + 1
+    
+    for series_id, count in series_counts.items():
+        builder.button(
+            text=f"🔁 Отменить всю серию ({count} зап.)",
+            callback_data=f"series_ask_{series_id}"
+        )
+
+def get_series_count_keyboard(options):
+    """
+    Создает клавиатуру выбора количества записей в серии
+    
+    Args:
+        options (list): Варианты количества записей
+        
+    Returns:
+        InlineKeyboardMarkup: Клавиатура с вариантами и кнопкой отмены
+    """
+    builder = InlineKeyboardBuilder()
+    
+    for count in options:
+        builder.button(
+            text=f"{count} раз",
+            callback_data=f"repeat_count_{count}"
+        )
+    builder.button(text="Отмена", callback_data="cancel")
+    
+    # Варианты в один ряд, отмена - отдельной строкой
+    builder.adjust(len(options), 1)
+    
+    return builder.as_markup()
+
 def get_my_appointments_keyboard(appointments):
     """
     Создает клавиатуру для просмотра записей пользователя
     
     Args:
-        appointments (list): Список словарей с записями
+        appointments (list): Список записей (models.Appointment)
         
     Returns:
         InlineKeyboardMarkup: Клавиатура с кнопками для управления записями
@@ -61,18 +129,17 @@ def get_my_appointments_keyboard(appointments):
     builder = InlineKeyboardBuilder()
     
     for appointment in appointments:
-        # Форматируем дату и время для отображения
-        appointment_datetime = appointment['appointment_datetime'].split()[0]
-        appointment_time = appointment['appointment_datetime'].split()[1]
-        
-        # Получаем номер записи для отображения
-        appointment_id = appointment['id']
-        
         builder.button(
-            text=f"❌ Отменить запись на {appointment_time} {appointment_datetime}",
-            callback_data=f"cancel_appointment_{appointment_id}"
+            text=f"🔄 Перенести запись на {appointment.time} {appointment.date}",
+            callback_data=f"reschedule_{appointment.id}"
+        )
+        builder.button(
+            text=f"❌ Отменить запись на {appointment.time} {appointment.date}",
+            callback_data=f"cancel_appointment_{appointment.id}"
         )
     
+    _add_series_buttons(builder, appointments)
+    
     # Размещаем кнопки по одной в строке
     builder.adjust(1)
     
@@ -83,7 +150,7 @@ def get_cancel_keyboard(appointments):
     Создает клавиатуру для отмены записей
     
     Args:
-        appointments (list): Список словарей с записями
+        appointments (list): Список записей (models.Appointment)
         
     Returns:
         InlineKeyboardMarkup: Клавиатура с кнопками для отмены записей
@@ -91,16 +158,39 @@ def get_cancel_keyboard(appointments):
     builder = InlineKeyboardBuilder()
     
     for appointment in appointments:
-        # Форматируем дату и время для отображения
-        appointment_datetime = appointment['appointment_datetime'].split()[0]
-        appointment_time = appointment['appointment_datetime'].split()[1]
-        
-        # Получаем номер записи для отображения
-        appointment_id = appointment['id']
-        
         builder.button(
-            text=f"❌ Отменить запись на {appointment_time} {appointment_datetime}",
-            callback_data=f"cancel_appointment_{appointment_id}"
+            text=f"❌ Отменить запись на {appointment.time} {appointment.date}",
+            callback_data=f"cancel_appointment_{appointment.id}"
+        )
+    
+    _add_series_buttons(builder, appointments)
+    
+    # Размещаем кнопки по одной в строке
+    builder.adjust(1)
+    
+    return builder.as_markup()
+
+# Окна времени для листа ожидания: (текст кнопки, начало и конец в минутах от начала дня)
+WAITLIST_WINDOWS = [
+    ("Любое время", 0, 24 * 60),
+    ("Утро (до 12:00)", 0, 12 * 60),
+    ("День (12:00 - 15:00)", 12 * 60, 15 * 60),
+    ("Вечер (после 15:00)", 15 * 60, 24 * 60),
+]
+
+def get_waitlist_windows_keyboard():
+    """
+    Создает клавиатуру выбора удобного времени для листа ожидания
+    
+    Returns:
+        InlineKeyboardMarkup: Клавиатура с окнами времени
+    """
+    builder = InlineKeyboardBuilder()
+    
+    for text, time_from, time_to in WAITLIST_WINDOWS:
+        builder.button(
+            text=text,
+            callback_data=f"waitlist_window_{time_from}_{time_to}"
         )
     
     # Размещаем кнопки по одной в строке
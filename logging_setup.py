@@ -0,0 +1,99 @@
+import atexit
+import contextvars
+import json
+import logging
+import queue
+import uuid
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+
+# ID трассировки текущего обновления Telegram (или цикла планировщика).
+# Контекстная переменная наследуется задачами asyncio и потоками asyncio.to_thread,
+# поэтому все записи журнала, вызванные одним обновлением, получают один и тот же ID
+trace_id_var = contextvars.ContextVar('trace_id', default='-')
+
+# Стандартные поля LogRecord; все остальные (переданные через extra) попадают в JSON
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'trace_id'}
+
+
+def new_trace_id():
+    """
+    Создает новый ID трассировки
+
+    Returns:
+        str: Короткий случайный ID
+    """
+    return uuid.uuid4().hex[:12]
+
+
+class TraceIdFilter(logging.Filter):
+    def filter(self, record):
+        """
+        Добавляет к записи журнала ID трассировки из текущего контекста
+        """
+        record.trace_id = trace_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        """
+        Форматирует запись журнала как одну строку JSON
+
+        Returns:
+            str: JSON с временем, уровнем, логгером, сообщением, ID трассировки,
+                дополнительными полями и текстом исключения
+        """
+        data = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'trace_id': getattr(record, 'trace_id', '-'),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                data[key] = value
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def setup_logging(level=logging.INFO, log_file=None):
+    """
+    Настраивает журнал: записи форматируются в JSON и кладутся в очередь,
+    а в поток вывода или файл их пишет фоновый поток. Так медленный диск
+    не блокирует цикл событий
+
+    Args:
+        level (int): Уровень журнала
+        log_file (str): Путь к файлу журнала (по умолчанию - стандартный поток ошибок)
+
+    Returns:
+        QueueListener: Запущенный фоновый писатель (останавливается при выходе)
+    """
+    log_queue = queue.SimpleQueue()
+
+    # Форматирование и ID трассировки - в потоке, который пишет в журнал:
+    # контекстная переменная доступна только там
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(TraceIdFilter())
+    queue_handler.setFormatter(JsonFormatter())
+
+    output_handler = logging.FileHandler(log_file, encoding='utf-8') if log_file else logging.StreamHandler()
+    output_handler.setFormatter(logging.Formatter('%(message)s'))
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(level)
+
+    listener = QueueListener(log_queue, output_handler, respect_handler_level=True)
+    listener.start()
+
+    def stop():
+        # Дописываем оставшиеся в очереди записи; повторная остановка ничего не делает
+        if listener._thread is not None:
+            listener.stop()
+
+    atexit.register(stop)
+    return listener
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class LoopWatchdog:
+    def __init__(self, interval, threshold, stack_depth=30):
+        """
+        Инициализация наблюдения за задержкой цикла событий
+
+        Задача в цикле событий просыпается каждые interval секунд и измеряет,
+        на сколько позже она проснулась (метрики loop.lag). Отдельный поток
+        проверяет, давно ли задача просыпалась: если дольше threshold секунд,
+        цикл чем-то заблокирован, и поток записывает в журнал стек потока цикла
+        событий в этот момент - то есть место синхронного вызова, который держит
+        всех пользователей (запрос к базе, долгий расчет слотов и т.п.)
+
+        Args:
+            interval (float): Как часто измерять задержку, в секундах
+            threshold (float): Задержка в секундах, после которой записывается стек
+            stack_depth (int): Сколько последних кадров стека записывать
+        """
+        self.interval = interval
+        self.threshold = threshold
+        self.stack_depth = stack_depth
+        self.running = False
+        self._loop = None
+        self._loop_thread_id = None
+        self._beat = time.monotonic()  # Когда задача в цикле событий просыпалась последний раз
+        self._reported_beat = None     # Для какого пробуждения стек уже записан
+        self._thread = None
+        self._stopped = threading.Event()
+
+    async def start(self):
+        """
+        Запускает измерение задержки и поток, который ловит блокировки
+        """
+        self.running = True
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+
+        while self.running:
+            expected = self._loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(self._loop.time() - expected, 0.0)
+            self._beat = time.monotonic()
+
+            metrics.observe("loop.lag", lag)
+            metrics.set_gauge("loop.lag_ms", round(lag * 1000, 1))
+            if lag >= self.threshold:
+                metrics.inc("loop.stalls")
+                logger.warning(
+                    "Цикл событий был заблокирован",
+                    extra={'lag_ms': round(lag * 1000, 1)}
+                )
+
+    def _watch(self):
+        """
+        Проверяет пробуждения задачи из отдельного потока и записывает стек
+        потока цикла событий, если он заблокирован (один раз на блокировку)
+        """
+        while not self._stopped.wait(self.interval):
+            beat = self._beat
+            blocked_for = time.monotonic() - beat
+            if blocked_for < self.threshold or self._reported_beat == beat:
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            self._reported_beat = beat
+
+            task = asyncio.current_task(self._loop)
+            stack = "".join(traceback.format_stack(frame)[-self.stack_depth:])
+            logger.warning(
+                "Цикл событий заблокирован, стек блокирующего вызова",
+                extra={
+                    'blocked_ms': round(blocked_for * 1000, 1),
+                    'task': task.get_name() if task is not None else None,
+                    'stack': stack,
+                }
+            )
+
+    def stop(self):
+        """
+        Останавливает измерение задержки и поток наблюдения
+        """
+        self.running = False
+        self._stopped.set()
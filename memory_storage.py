@@ -0,0 +1,792 @@
+import itertools
+import logging
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+
+from database import search_terms
+from models import Appointment, Reminder, Service
+from working_schedule import WorkingSchedule, split_by_breaks
+
+logger = logging.getLogger(__name__)
+
+
+def _dates(start_date, end_date):
+    """
+    Перебирает даты "ГГГГ-ММ-ДД" от start_date до end_date включительно
+    """
+    day = datetime.strptime(start_date, "%Y-%m-%d")
+    last_day = datetime.strptime(end_date, "%Y-%m-%d")
+    while day <= last_day:
+        yield day.strftime("%Y-%m-%d")
+        day += timedelta(days=1)
+
+
+def _interval(appointment_datetime, duration):
+    """
+    Возвращает интервал (начало, конец) в минутах от начала дня
+    для времени "ГГГГ-ММ-ДД ЧЧ:ММ" и длительности
+    """
+    start = int(appointment_datetime[11:13]) * 60 + int(appointment_datetime[14:16])
+    return start, start + duration
+
+
+class MemoryDatabase:
+    def __init__(self):
+        """
+        Хранилище, которое держит все данные в памяти процесса
+
+        Реализует тот же интерфейс, что и Database (см. storage.Storage), но вместо
+        таблиц использует индексированные структуры: записи каждого дня лежат
+        в отсортированном списке, для пользователей, серий и напоминаний есть
+        отдельные словари-индексы, а занятость и статистика поддерживаются
+        при каждом изменении. Данные теряются при перезапуске, поэтому хранилище
+        предназначено для тестов, бенчмарков и демонстрации
+        """
+        self._ids = {
+            name: itertools.count(1)
+            for name in ('services', 'appointments', 'series', 'reminders', 'waitlist')
+        }
+
+        self._services = {}          # {id услуги: услуга}
+        self._appointments = {}      # {id записи: запись}
+        self._by_date = {}           # {"ГГГГ-ММ-ДД": [(время записи, id записи), ...] по времени}
+        self._by_user = {}           # {id пользователя: {id записей}}
+        # Уникальные ключи, как у индексов idx_appointments_unique и idx_reminders_unique
+        self._appointment_keys = {}  # {(id пользователя, время записи): id записи}
+        self._reminder_keys = {}     # {(id записи, время напоминания): id напоминания}
+        self._by_series = {}         # {id серии: {id записей}}
+        self._series = {}            # {id серии: серия}
+        # Занятость по дням: {"ГГГГ-ММ-ДД": {(время записи, ID услуги, длительность): число записей}}
+        self._occupancy = {}
+
+        self._reminders = {}         # {id напоминания: напоминание}
+        self._pending_reminders = set()  # id неотправленных напоминаний
+        self._reminders_by_appointment = {}  # {id записи: {id напоминаний}}
+
+        self._weekly_hours = {}      # {день недели: [(начало, конец), ...]}
+        self._overrides = {}         # {"ГГГГ-ММ-ДД": [(начало, конец), ...]}
+        self._schedule = WorkingSchedule({}, {})
+
+        self._daily_stats = {}       # {(дата, ID услуги): [записи, выручка, минуты]}
+        self._waitlist = {}          # {id заявки: заявка} в порядке добавления
+
+        self._change_listeners = []  # Функции, вызываемые с ID пользователя при изменении его записей
+
+    def add_change_listener(self, callback):
+        """
+        Подписывает функцию на изменения записей пользователей
+
+        Args:
+            callback (callable): Функция, принимающая ID пользователя Telegram
+        """
+        self._change_listeners.append(callback)
+
+    def _notify_changed(self, user_id):
+        """
+        Сообщает подписчикам, что записи пользователя изменились
+        """
+        for callback in self._change_listeners:
+            try:
+                callback(user_id)
+            except Exception:
+                logger.exception("Ошибка в обработчике изменения записей")
+
+    def create_tables(self):
+        """
+        Хранилищу в памяти не нужна схема - метод оставлен для совместимости
+        """
+
+    def bootstrap(self, default_services, default_working_hours=None):
+        """
+        Добавляет услуги и рабочие часы по умолчанию, если их еще нет
+
+        Args:
+            default_services (list): Кортежи (name, duration, price, capacity)
+            default_working_hours (dict): Рабочие часы по дням недели в формате
+                config.DEFAULT_WORKING_HOURS
+
+        Returns:
+            bool: Всегда True
+        """
+        if not self._services:
+            for name, duration, price, capacity in default_services:
+                self.add_service(name, duration, price, capacity)
+
+        if default_working_hours and not self._weekly_hours:
+            for day, hours in default_working_hours.items():
+                if hours:
+                    self._weekly_hours[day] = split_by_breaks(
+                        hours['start_time'], hours['end_time'], hours.get('breaks', ())
+                    )
+            self._compile_schedule()
+        return True
+
+    def warm_up(self, days_ahead=14):
+        """
+        Все данные и так находятся в памяти, поэтому метод только возвращает их объем
+
+        Returns:
+            dict: Количество объектов каждого вида
+        """
+        return {
+            'services': len(self._services),
+            'working_days': len(self._weekly_hours),
+            'schedule_overrides': len(self._overrides),
+            'reminders': len(self._pending_reminders),
+            'appointments': len(self._appointments),
+        }
+
+    def cool_down(self):
+        """
+        Данные хранятся только в памяти, поэтому освобождать нечего
+        """
+
+    def add_service(self, name, duration, price, capacity=1):
+        """
+        Добавляет новую услугу
+
+        Returns:
+            int: ID созданной услуги
+        """
+        service_id = next(self._ids['services'])
+        self._services[service_id] = Service(service_id, name, duration, price, capacity)
+        return service_id
+
+    def get_services(self):
+        """
+        Получает список всех услуг
+
+        Returns:
+            list: Список услуг (models.Service)
+        """
+        return list(self._services.values())
+
+    def get_service_by_id(self, service_id):
+        """
+        Получает информацию об услуге по ID
+
+        Returns:
+            Service: Услуга или None
+        """
+        return self._services.get(service_id)
+
+    def set_service_capacity(self, service_id, capacity):
+        """
+        Изменяет вместимость услуги
+
+        Returns:
+            bool: True, если услуга найдена
+        """
+        if service_id not in self._services:
+            return False
+        # Строка заменяется копией: изменять ее на месте нельзя (она хэшируется)
+        self._services[service_id] = self._services[service_id].replace(capacity=capacity)
+        return True
+
+    def add_appointment(self, user_id, user_name, service_id, appointment_datetime, duration, capacity=1):
+        """
+        Добавляет новую запись на прием, если время не занято. Проверка и вставка
+        выполняются без await между ними, поэтому атомарны
+
+        Returns:
+            int: ID созданной записи (или уже существующей записи пользователя на это время
+                и эту же услугу) или None, если время занято
+        """
+        existing_id = self._appointment_keys.get((user_id, appointment_datetime))
+        if existing_id is not None:
+            return existing_id if self._appointments[existing_id].service_id == service_id else None
+        if self._overlaps(appointment_datetime, duration, (service_id, capacity)):
+            return None
+
+        created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return self._insert_appointment(
+            user_id, user_name, service_id, appointment_datetime, duration, created_at
+        )
+
+    def _insert_appointment(self, user_id, user_name, service_id, appointment_datetime, duration,
+                            created_at, series_id=None, appointment_id=None):
+        """
+        Сохраняет запись и обновляет все индексы, занятость и статистику
+        (appointment_id задается при переносе, чтобы запись сохранила свой ID)
+
+        Returns:
+            int: ID созданной записи
+        """
+        if appointment_id is None:
+            appointment_id = next(self._ids['appointments'])
+        self._appointments[appointment_id] = Appointment(
+            id=appointment_id, user_id=user_id, user_name=user_name, service_id=service_id,
+            appointment_datetime=appointment_datetime, duration=duration, series_id=series_id,
+            created_at=created_at
+        )
+
+        self._appointment_keys[(user_id, appointment_datetime)] = appointment_id
+
+        date = appointment_datetime[:10]
+        insort(self._by_date.setdefault(date, []), (appointment_datetime, appointment_id))
+        self._by_user.setdefault(user_id, set()).add(appointment_id)
+        if series_id is not None:
+            self._by_series.setdefault(series_id, set()).add(appointment_id)
+
+        day = self._occupancy.setdefault(date, {})
+        key = (appointment_datetime, service_id, duration)
+        day[key] = day.get(key, 0) + 1
+
+        service = self._services.get(service_id)
+        stats = self._daily_stats.setdefault((date, service_id), [0, 0, 0])
+        stats[0] += 1
+        stats[1] += service.price if service else 0
+        stats[2] += duration
+
+        self._notify_changed(user_id)
+        return appointment_id
+
+    def _remove_appointment(self, appointment_id):
+        """
+        Удаляет запись вместе с ее напоминаниями и обновляет индексы
+
+        Returns:
+            dict: Удаленная запись или None
+        """
+        appointment = self._appointments.pop(appointment_id, None)
+        if appointment is None:
+            return None
+
+        del self._appointment_keys[(appointment.user_id, appointment.appointment_datetime)]
+
+        date = appointment.appointment_datetime[:10]
+        day_list = self._by_date[date]
+        del day_list[bisect_left(day_list, (appointment.appointment_datetime, appointment_id))]
+        self._by_user[appointment.user_id].discard(appointment_id)
+        if appointment.series_id is not None:
+            self._by_series[appointment.series_id].discard(appointment_id)
+
+        day = self._occupancy[date]
+        key = (appointment.appointment_datetime, appointment.service_id, appointment.duration)
+        if day[key] > 1:
+            day[key] -= 1
+        else:
+            del day[key]
+
+        service = self._services.get(appointment.service_id)
+        stats = self._daily_stats[(date, appointment.service_id)]
+        stats[0] -= 1
+        stats[1] -= service.price if service else 0
+        stats[2] -= appointment.duration
+
+        for reminder_id in self._reminders_by_appointment.pop(appointment_id, ()):
+            reminder = self._reminders.pop(reminder_id)
+            del self._reminder_keys[(appointment_id, reminder['reminder_datetime'])]
+            self._pending_reminders.discard(reminder_id)
+
+        self._notify_changed(appointment.user_id)
+        return appointment
+
+    def get_user_appointments(self, user_id):
+        """
+        Получает список будущих записей пользователя
+
+        Returns:
+            list: Список записей (models.Appointment) по времени
+        """
+        now = datetime.now().strftime("%Y-%m-%d %H:%M")
+        appointments = [
+            self._appointments[appointment_id] for appointment_id in self._by_user.get(user_id, ())
+        ]
+        # Записи неизменяемы, поэтому отдаются без копирования
+        return [
+            appointment
+            for appointment in sorted(appointments, key=lambda item: item.appointment_datetime)
+            if appointment.appointment_datetime > now
+        ]
+
+    def get_appointment_by_id(self, appointment_id):
+        """
+        Получает информацию о записи по ID
+
+        Returns:
+            Appointment: Запись или None
+        """
+        return self._appointments.get(appointment_id)
+
+    def delete_appointment(self, appointment_id):
+        """
+        Удаляет запись на прием
+
+        Returns:
+            bool: True в случае успешного удаления, False в противном случае
+        """
+        return self._remove_appointment(appointment_id) is not None
+
+    def reschedule_appointment(self, appointment_id, user_id, appointment_datetime, reminder_datetime, capacity=1):
+        """
+        Переносит запись пользователя на другое время вместе с напоминанием.
+        Проверка и перенос выполняются без await между ними, поэтому атомарны
+
+        Returns:
+            tuple: (запись до переноса, запись после переноса) или None, если запись
+                не найдена, принадлежит другому пользователю или новое время занято
+        """
+        old = self._appointments.get(appointment_id)
+        if old is None or old.user_id != user_id or self._appointment_keys.get(
+            (user_id, appointment_datetime), appointment_id
+        ) != appointment_id:
+            return None
+
+        # Переносимая запись временно убирается из занятости, чтобы не мешать самой себе
+        old_key = (old.appointment_datetime, old.service_id, old.duration)
+        old_day = self._occupancy[old.appointment_datetime[:10]]
+        booked = old_day.pop(old_key)
+        if booked > 1:
+            old_day[old_key] = booked - 1
+        try:
+            if self._overlaps(appointment_datetime, old.duration, (old.service_id, capacity)):
+                return None
+        finally:
+            old_day[old_key] = booked
+
+        # Как и в SQLite, отправленные напоминания остаются, а неотправленные
+        # о старом времени заменяются одним новым
+        reminder_ids = self._reminders_by_appointment.pop(appointment_id, set())
+        for reminder_id in [item for item in reminder_ids if item in self._pending_reminders]:
+            reminder = self._reminders.pop(reminder_id)
+            del self._reminder_keys[(appointment_id, reminder['reminder_datetime'])]
+            self._pending_reminders.discard(reminder_id)
+            reminder_ids.discard(reminder_id)
+
+        self._remove_appointment(appointment_id)
+        if reminder_ids:
+            self._reminders_by_appointment[appointment_id] = reminder_ids
+        self._insert_appointment(
+            user_id, old.user_name, old.service_id, appointment_datetime, old.duration,
+            old.created_at, old.series_id, appointment_id
+        )
+        self.add_reminder(appointment_id, reminder_datetime)
+        return old, self._appointments[appointment_id]
+
+    def _iter_range(self, start_date, end_date):
+        """
+        Перебирает записи диапазона дат в порядке времени
+        """
+        for date in _dates(start_date, end_date):
+            for _, appointment_id in self._by_date.get(date, ()):
+                yield self._appointments[appointment_id]
+
+    def get_appointments_by_date_range(self, start_date, end_date):
+        """
+        Получает список записей в заданном диапазоне дат
+
+        Returns:
+            list: Список записей (models.Appointment)
+        """
+        return list(self._iter_range(start_date, end_date))
+
+    def iter_appointments_by_date_range(self, start_date, end_date, chunk_size=1000):
+        """
+        Построчно отдает записи в заданном диапазоне дат
+
+        Yields:
+            Appointment: Запись вместе с названием и стоимостью услуги
+        """
+        for appointment in self._iter_range(start_date, end_date):
+            service = self._services.get(appointment.service_id)
+            yield appointment.replace(
+                service_name=service.name if service else None,
+                service_price=service.price if service else None
+            )
+
+    def import_appointments(self, rows, batch_size=10000, check_conflicts=True):
+        """
+        Массово импортирует записи, пропуская пересекающиеся с уже существующими
+
+        Returns:
+            dict: Количество импортированных ('imported') и пропущенных ('conflicts') строк
+        """
+        imported = 0
+        conflicts = 0
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        try:
+            for row in rows:
+                user_id, user_name, service_id, appointment_datetime, duration, created_at = row
+                user_id, service_id, duration = int(user_id), int(service_id), int(duration)
+                service = self._services.get(service_id)
+                capacity = service.capacity if service else 1
+                if (user_id, appointment_datetime) in self._appointment_keys or (
+                    check_conflicts and self._overlaps(appointment_datetime, duration, (service_id, capacity))
+                ):
+                    conflicts += 1
+                    continue
+                self._insert_appointment(
+                    user_id, user_name, service_id, appointment_datetime, duration, created_at or now
+                )
+                imported += 1
+        except ValueError as e:
+            logger.error(f"Ошибка при импорте записей: {e}")
+
+        return {'imported': imported, 'conflicts': conflicts}
+
+    def _overlaps(self, appointment_datetime, duration, joinable=None):
+        """
+        Проверяет, пересекается ли интервал с записями того же дня
+
+        Args:
+            appointment_datetime (str): Дата и время начала "ГГГГ-ММ-ДД ЧЧ:ММ"
+            duration (int): Длительность в минутах
+            joinable (tuple): (ID услуги, вместимость) - неполная группа этой услуги,
+                начинающаяся в то же время, пересечением не считается
+
+        Returns:
+            bool: True, если есть пересечение
+        """
+        start, end = _interval(appointment_datetime, duration)
+        for (group_datetime, service_id, group_duration), booked in self._occupancy.get(
+            appointment_datetime[:10], {}
+        ).items():
+            group_start, group_end = _interval(group_datetime, group_duration)
+            if not (group_start < end and start < group_end):
+                continue
+            if (
+                joinable and group_datetime == appointment_datetime and service_id == joinable[0]
+                and group_duration == duration and booked < joinable[1]
+            ):
+                continue
+            return True
+        return False
+
+    def get_occupancy(self, start_date, end_date):
+        """
+        Получает занятость в заданном диапазоне дат
+
+        Returns:
+            list: Список словарей с полями appointment_datetime, service_id,
+                duration и booked, отсортированный по времени
+        """
+        occupancy = []
+        for date in _dates(start_date, end_date):
+            for (appointment_datetime, service_id, duration), booked in self._occupancy.get(date, {}).items():
+                occupancy.append({
+                    'appointment_datetime': appointment_datetime, 'service_id': service_id,
+                    'duration': duration, 'booked': booked
+                })
+        occupancy.sort(key=lambda item: item['appointment_datetime'])
+        return occupancy
+
+    def get_client_ids(self):
+        """
+        Получает ID всех пользователей, у которых есть записи
+
+        Returns:
+            list: Список ID пользователей Telegram
+        """
+        return [user_id for user_id, appointment_ids in self._by_user.items() if appointment_ids]
+
+    def search_appointments(self, query, limit=10, offset=0):
+        """
+        Ищет записи по началу слов в имени клиента и названии услуги (перебором)
+
+        Returns:
+            list: Список записей (models.Appointment) вместе с user_name и service_name,
+                сначала самые новые
+        """
+        terms = search_terms(query)
+        if not terms:
+            return []
+
+        # Порядок как в SQLite: по ID записи, а не по порядку вставки (перенос
+        # записи вставляет ее заново)
+        found = []
+        for appointment_id in sorted(self._appointments, reverse=True):
+            appointment = self._appointments[appointment_id]
+            service = self._services.get(appointment.service_id)
+            service_name = service.name if service else None
+            words = search_terms(f"{appointment.user_name or ''} {service_name or ''}")
+            if all(any(word.startswith(term) for word in words) for term in terms):
+                found.append(appointment.replace(service_name=service_name))
+                if len(found) == offset + limit:
+                    break
+        return found[offset:]
+
+    def add_appointment_series(self, user_id, user_name, service_id, duration, occurrences, interval_weeks,
+                               capacity=1):
+        """
+        Создает серию повторяющихся записей вместе с напоминаниями, пропуская занятые даты
+
+        Returns:
+            dict: ID серии ('series_id'), созданные записи ('appointments')
+                и пропущенные из-за пересечений даты ('conflicts')
+        """
+        result = {'series_id': None, 'appointments': [], 'conflicts': []}
+
+        free = []
+        for appointment_datetime, reminder_datetime in occurrences:
+            if (user_id, appointment_datetime) in self._appointment_keys or self._overlaps(
+                appointment_datetime, duration, (service_id, capacity)
+            ):
+                result['conflicts'].append(appointment_datetime)
+            else:
+                free.append((appointment_datetime, reminder_datetime))
+
+        if not free:
+            return result
+
+        created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        series_id = next(self._ids['series'])
+        self._series[series_id] = {
+            'id': series_id, 'user_id': user_id, 'service_id': service_id,
+            'interval_weeks': interval_weeks, 'occurrences': len(free), 'created_at': created_at
+        }
+
+        for appointment_datetime, reminder_datetime in free:
+            appointment_id = self._insert_appointment(
+                user_id, user_name, service_id, appointment_datetime, duration, created_at, series_id
+            )
+            self.add_reminder(appointment_id, reminder_datetime)
+            result['appointments'].append(self._appointments[appointment_id])
+
+        result['series_id'] = series_id
+        return result
+
+    def delete_appointment_series(self, series_id, user_id):
+        """
+        Отменяет все будущие записи серии вместе с их напоминаниями
+
+        Returns:
+            list: Список отмененных записей (models.Appointment)
+        """
+        now = datetime.now().strftime("%Y-%m-%d %H:%M")
+        appointments = [
+            self._appointments[appointment_id] for appointment_id in self._by_series.get(series_id, ())
+        ]
+
+        deleted = []
+        for appointment in sorted(appointments, key=lambda item: item.appointment_datetime):
+            if appointment.user_id == user_id and appointment.appointment_datetime > now:
+                deleted.append(self._remove_appointment(appointment.id))
+        return deleted
+
+    def cancel_appointments_in_range(self, start_datetime, end_datetime):
+        """
+        Отменяет все записи, начинающиеся в заданном промежутке, вместе с их напоминаниями
+
+        Returns:
+            list: Список отмененных записей (models.Appointment), отсортированный по времени
+        """
+        appointments = [
+            appointment for appointment in self._iter_range(start_datetime[:10], end_datetime[:10])
+            if start_datetime <= appointment.appointment_datetime < end_datetime
+        ]
+
+        for appointment in appointments:
+            self._remove_appointment(appointment.id)
+        return appointments
+
+    def get_schedule(self):
+        """
+        Возвращает скомпилированное расписание работы
+
+        Returns:
+            WorkingSchedule: Расписание с рабочими интервалами по датам
+        """
+        return self._schedule
+
+    def _compile_schedule(self):
+        """
+        Пересобирает расписание после изменения рабочих часов или особых дней
+        """
+        self._schedule = WorkingSchedule(self._weekly_hours, self._overrides)
+
+    def set_weekly_hours(self, day_of_week, intervals):
+        """
+        Заменяет рабочие интервалы дня недели
+
+        Returns:
+            bool: Всегда True
+        """
+        if intervals:
+            self._weekly_hours[day_of_week] = list(intervals)
+        else:
+            self._weekly_hours.pop(day_of_week, None)
+        self._compile_schedule()
+        return True
+
+    def set_date_override(self, date, intervals):
+        """
+        Задает особое расписание на дату (пустой список - выходной)
+
+        Returns:
+            bool: Всегда True
+        """
+        self._overrides[date] = list(intervals)
+        self._compile_schedule()
+        return True
+
+    def clear_date_override(self, date):
+        """
+        Удаляет особое расписание на дату
+
+        Returns:
+            bool: True, если особое расписание было удалено
+        """
+        if self._overrides.pop(date, None) is None:
+            return False
+        self._compile_schedule()
+        return True
+
+    def add_reminder(self, appointment_id, reminder_datetime):
+        """
+        Добавляет напоминание о записи
+
+        Returns:
+            int: ID созданного напоминания (или уже существующего такого же)
+        """
+        existing_id = self._reminder_keys.get((appointment_id, reminder_datetime))
+        if existing_id is not None:
+            return existing_id
+
+        reminder_id = next(self._ids['reminders'])
+        self._reminder_keys[(appointment_id, reminder_datetime)] = reminder_id
+        self._reminders[reminder_id] = {
+            'id': reminder_id, 'appointment_id': appointment_id, 'reminder_datetime': reminder_datetime
+        }
+        self._pending_reminders.add(reminder_id)
+        self._reminders_by_appointment.setdefault(appointment_id, set()).add(reminder_id)
+        return reminder_id
+
+    def get_pending_reminders(self):
+        """
+        Получает список неотправленных напоминаний, которые должны быть отправлены
+
+        Returns:
+            list: Список напоминаний (models.Reminder) вместе с данными записи
+        """
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        reminders = []
+        for reminder_id in self._pending_reminders:
+            reminder = self._reminders[reminder_id]
+            appointment = self._appointments.get(reminder['appointment_id'])
+            if appointment and reminder['reminder_datetime'] <= now:
+                reminders.append(Reminder(
+                    reminder['id'], reminder['appointment_id'], reminder['reminder_datetime'],
+                    appointment.user_id, appointment.service_id, appointment.appointment_datetime
+                ))
+        return reminders
+
+    def mark_reminder_as_sent(self, reminder_id):
+        """
+        Отмечает напоминание как отправленное
+
+        Returns:
+            bool: True, если напоминание найдено
+        """
+        if reminder_id not in self._reminders:
+            return False
+        self._pending_reminders.discard(reminder_id)
+        return True
+
+    def rebuild_stats(self):
+        """
+        Пересчитывает статистику по всем записям (например, после изменения цен услуг)
+
+        Returns:
+            bool: Всегда True
+        """
+        self._daily_stats = {}
+        for appointment in self._appointments.values():
+            service = self._services.get(appointment.service_id)
+            stats = self._daily_stats.setdefault(
+                (appointment.appointment_datetime[:10], appointment.service_id), [0, 0, 0]
+            )
+            stats[0] += 1
+            stats[1] += service.price if service else 0
+            stats[2] += appointment.duration
+        return True
+
+    def get_stats(self, start_date, end_date):
+        """
+        Получает статистику по услугам за период
+
+        Returns:
+            dict: Список услуг со статистикой ('services'), а также количество
+                забронированных ('booked_minutes') и рабочих ('working_minutes') минут
+        """
+        totals = {}
+        for (date, service_id), (bookings, revenue, booked_minutes) in self._daily_stats.items():
+            if start_date <= date <= end_date:
+                total = totals.setdefault(service_id, [0, 0, 0])
+                total[0] += bookings
+                total[1] += revenue
+                total[2] += booked_minutes
+
+        services = sorted(
+            (
+                {
+                    'service_id': service_id,
+                    'name': self._services[service_id].name if service_id in self._services else None,
+                    'bookings': bookings, 'revenue': revenue, 'booked_minutes': booked_minutes
+                }
+                for service_id, (bookings, revenue, booked_minutes) in totals.items() if bookings > 0
+            ),
+            key=lambda service: service['revenue'],
+            reverse=True
+        )
+
+        return {
+            'services': services,
+            'booked_minutes': sum(service['booked_minutes'] for service in services),
+            'working_minutes': self._schedule.working_minutes(start_date, end_date),
+        }
+
+    def add_to_waitlist(self, user_id, service_id, duration, date_from, date_to, time_from, time_to):
+        """
+        Добавляет пользователя в лист ожидания
+
+        Returns:
+            int: ID заявки в листе ожидания
+        """
+        entry_id = next(self._ids['waitlist'])
+        self._waitlist[entry_id] = {
+            'id': entry_id, 'user_id': user_id, 'service_id': service_id, 'duration': duration,
+            'date_from': date_from, 'date_to': date_to, 'time_from': time_from, 'time_to': time_to
+        }
+        return entry_id
+
+    def find_waitlist_matches(self, date, free_from, free_to, limit, service_ids=None, after_id=0):
+        """
+        Находит заявки листа ожидания, которым подходит освободившийся интервал
+        (только на услуги service_ids, если они заданы, и с ID больше after_id)
+
+        Returns:
+            list: Список словарей с заявками в порядке очереди
+        """
+        matches = []
+        for entry in self._waitlist.values():
+            if (
+                entry['id'] > after_id
+                and (service_ids is None or entry['service_id'] in service_ids)
+                and entry['date_from'] <= date <= entry['date_to']
+                and max(entry['time_from'], free_from) + entry['duration'] <= min(entry['time_to'], free_to)
+            ):
+                matches.append(dict(entry))
+                if len(matches) == limit:
+                    break
+        return matches
+
+    def remove_from_waitlist(self, entry_ids):
+        """
+        Удаляет заявки из листа ожидания
+
+        Returns:
+            int: Количество удаленных заявок
+        """
+        return sum(1 for entry_id in entry_ids if self._waitlist.pop(entry_id, None) is not None)
+
+    def purge_expired_waitlist(self, today):
+        """
+        Удаляет заявки, период которых уже закончился
+
+        Returns:
+            int: Количество удаленных заявок
+        """
+        expired = [entry_id for entry_id, entry in self._waitlist.items() if entry['date_to'] < today]
+        return self.remove_from_waitlist(expired)
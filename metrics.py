@@ -0,0 +1,66 @@
+# Простые метрики процесса: счетчики, текущие значения и наблюдения
+# (количество, сумма, максимум). Хранятся в памяти и выводятся командой /metrics
+
+_counters = {}
+_gauges = {}
+_observations = {}
+
+
+def inc(name, value=1):
+    """
+    Увеличивает счетчик
+    """
+    _counters[name] = _counters.get(name, 0) + value
+
+
+def set_gauge(name, value):
+    """
+    Устанавливает текущее значение показателя (например, глубину очереди)
+    """
+    _gauges[name] = value
+
+
+def observe(name, value):
+    """
+    Добавляет наблюдение (например, задержку в секундах)
+    """
+    count, total, maximum = _observations.get(name, (0, 0.0, 0.0))
+    _observations[name] = (count + 1, total + value, max(maximum, value))
+
+
+def snapshot():
+    """
+    Возвращает копию всех метрик
+
+    Returns:
+        dict: Счетчики ('counters'), показатели ('gauges') и наблюдения ('observations')
+            в виде {имя: {'count', 'avg', 'max'}}
+    """
+    return {
+        'counters': dict(_counters),
+        'gauges': dict(_gauges),
+        'observations': {
+            name: {'count': count, 'avg': total / count if count else 0.0, 'max': maximum}
+            for name, (count, total, maximum) in _observations.items()
+        },
+    }
+
+
+def format_snapshot():
+    """
+    Форматирует метрики для отправки в чат
+
+    Returns:
+        str: Текст с метриками
+    """
+    data = snapshot()
+    lines = []
+
+    for name, value in sorted(data['gauges'].items()):
+        lines.append(f"{name} = {value:g}")
+    for name, value in sorted(data['counters'].items()):
+        lines.append(f"{name} = {value}")
+    for name, value in sorted(data['observations'].items()):
+        lines.append(f"{name}: n={value['count']} avg={value['avg']:.3f} max={value['max']:.3f}")
+
+    return "\n".join(lines) or "Метрик пока нет."
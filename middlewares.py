@@ -0,0 +1,322 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, TelegramObject, Update
+
+import metrics
+from logging_setup import trace_id_var, new_trace_id
+from tenants import current_tenant
+from config import (
+    THROTTLE_RATE, THROTTLE_BURST, THROTTLE_DEBOUNCE,
+    THROTTLE_MAX_USERS, THROTTLE_IDLE_SECONDS,
+    IDEMPOTENCY_TTL, IDEMPOTENCY_MAX_KEYS,
+    BACKPRESSURE_MAX_INFLIGHT, BACKPRESSURE_MAX_QUEUED,
+    DEGRADED_ENTER_WAIT, DEGRADED_EXIT_WAIT
+)
+from idempotency import IdempotencyStore
+from ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class TraceMiddleware(BaseMiddleware):
+    """
+    Присваивает каждому обновлению Telegram ID трассировки. Он попадает во все
+    записи журнала, сделанные при обработке обновления (в том числе в Database
+    и AppointmentScheduler), и в исходящие сообщения очереди отправки
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        token = trace_id_var.set(new_trace_id())
+        update_id = event.update_id if isinstance(event, Update) else None
+        started_at = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            # Здесь ID трассировки еще установлен, в отличие от журнала aiogram
+            logger.exception("Ошибка при обработке обновления", extra={'update_id': update_id})
+            raise
+        finally:
+            logger.debug(
+                "Обновление обработано",
+                extra={
+                    'update_id': update_id,
+                    'duration_ms': round((time.perf_counter() - started_at) * 1000, 1),
+                }
+            )
+            trace_id_var.reset(token)
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    def __init__(self):
+        """
+        Инициализация ограничителя частоты запросов от пользователей
+
+        Для каждого пользователя хранится "ведро с токенами" и последний колбэк.
+        Записи лежат в OrderedDict в порядке последней активности: давно неактивные
+        пользователи удаляются, а размер словаря ограничен THROTTLE_MAX_USERS
+        """
+        self._users = OrderedDict()  # {user_id: [TokenBucket, данные последнего колбэка, время]}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get('event_from_user')
+        if user is None:
+            return await handler(event, data)
+
+        now = time.monotonic()
+        entry = self._get_entry(user.id, now)
+        bucket, last_data, last_time = entry
+
+        if isinstance(event, CallbackQuery):
+            # Повторное нажатие той же кнопки сразу после первого не доходит до обработчиков
+            if event.data == last_data and now - last_time < THROTTLE_DEBOUNCE:
+                metrics.inc("throttle.debounced")
+                await event.answer()
+                return None
+            entry[1] = event.data
+            entry[2] = now
+
+        if bucket.try_acquire(now):
+            metrics.inc("throttle.limited")
+            if isinstance(event, CallbackQuery):
+                await event.answer("Слишком много нажатий, подождите секунду.")
+            return None
+
+        return await handler(event, data)
+
+    def _get_entry(self, user_id, now):
+        """
+        Возвращает запись пользователя, создавая ее при необходимости
+        и удаляя записи неактивных пользователей
+        """
+        entry = self._users.get(user_id)
+        if entry is not None:
+            self._users.move_to_end(user_id)
+            return entry
+
+        # Самые давние записи находятся в начале словаря
+        while self._users:
+            oldest_id, oldest = next(iter(self._users.items()))
+            if len(self._users) < THROTTLE_MAX_USERS and now - oldest[0].updated_at < THROTTLE_IDLE_SECONDS:
+                break
+            del self._users[oldest_id]
+
+        entry = self._users[user_id] = [TokenBucket(THROTTLE_RATE, THROTTLE_BURST), None, 0.0]
+        return entry
+
+
+class IdempotencyMiddleware(BaseMiddleware):
+    def __init__(self, callbacks):
+        """
+        Инициализация защиты от повторного выполнения колбэков
+
+        Подключается как внутренний middleware, то есть срабатывает только для колбэка,
+        который уже прошел фильтры обработчика. Повторное нажатие кнопки в том же
+        сообщении (двойное нажатие, повторная доставка обновления Telegram или
+        параллельная обработка) отбрасывается до обращения к базе данных
+
+        Args:
+            callbacks (tuple): Данные колбэков (или их начала до "_<параметр>"),
+                которые должны выполняться не более одного раза
+        """
+        self.callbacks = callbacks
+        self.store = IdempotencyStore(IDEMPOTENCY_TTL, IDEMPOTENCY_MAX_KEYS)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not isinstance(event, CallbackQuery) or not event.message or not any(
+            event.data == callback or event.data.startswith(f"{callback}_") for callback in self.callbacks
+        ):
+            return await handler(event, data)
+
+        # Ключ - бот, сообщение сценария и нажатая кнопка: у каждого сообщения своя сессия,
+        # а ID сообщений в разных ботах одного процесса могут совпадать
+        key = f"{data['bot'].id}:{event.message.chat.id}:{event.message.message_id}:{event.data}"
+        if not self.store.claim(key):
+            metrics.inc("idempotency.duplicates")
+            await event.answer()
+            return None
+
+        try:
+            return await handler(event, data)
+        except Exception:
+            # Операция не выполнилась - разрешаем повторить ее
+            self.store.release(key)
+            raise
+
+
+class BackpressureMiddleware(BaseMiddleware):
+    def __init__(self, reject_when_degraded=()):
+        """
+        Инициализация ограничителя нагрузки на диспетчер
+
+        Одновременно обрабатывается не больше BACKPRESSURE_MAX_INFLIGHT обновлений,
+        остальные ждут в очереди. Если очередь длиннее BACKPRESSURE_MAX_QUEUED,
+        новые обновления сразу отбрасываются. По сглаженному времени ожидания
+        бот переходит в упрощенный режим (и выходит из него с гистерезисом):
+        обработчики получают флаг degraded, а колбэки из reject_when_degraded
+        получают ответ "попробуйте чуть позже", не обращаясь к базе данных
+
+        Args:
+            reject_when_degraded (tuple): Данные колбэков (или их начала до "_<параметр>"),
+                которые не выполняются в упрощенном режиме
+        """
+        self.reject_when_degraded = reject_when_degraded
+        self.degraded = False
+        self._semaphore = asyncio.Semaphore(BACKPRESSURE_MAX_INFLIGHT)
+        self._queued = 0
+        self._inflight = 0
+        self._average_wait = 0.0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        callback_query = event.callback_query if isinstance(event, Update) else None
+
+        if self._queued >= BACKPRESSURE_MAX_QUEUED:
+            metrics.inc("backpressure.shed")
+            if callback_query:
+                await callback_query.answer("Сейчас слишком много запросов, попробуйте через минуту.")
+            return None
+
+        started_at = time.monotonic()
+        self._set_queued(self._queued + 1)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._set_queued(self._queued - 1)
+
+        try:
+            wait = time.monotonic() - started_at
+            metrics.observe("backpressure.wait", wait)
+            self._update_mode(wait)
+
+            if self.degraded and callback_query and any(
+                callback_query.data == callback or callback_query.data.startswith(f"{callback}_")
+                for callback in self.reject_when_degraded
+            ):
+                metrics.inc("backpressure.rejected")
+                await callback_query.answer(
+                    "Сейчас много запросов. Попробуйте подтвердить через минуту.", show_alert=True
+                )
+                return None
+
+            data['degraded'] = self.degraded
+            self._set_inflight(self._inflight + 1)
+            try:
+                return await handler(event, data)
+            finally:
+                self._set_inflight(self._inflight - 1)
+        finally:
+            self._semaphore.release()
+
+    def _update_mode(self, wait):
+        """
+        Обновляет сглаженное время ожидания и включает или выключает упрощенный режим
+        """
+        self._average_wait = self._average_wait * 0.8 + wait * 0.2
+
+        if not self.degraded and self._average_wait > DEGRADED_ENTER_WAIT:
+            self.degraded = True
+            logger.warning(
+                "Перегрузка: включен упрощенный режим",
+                extra={'average_wait': round(self._average_wait, 3), 'queued': self._queued}
+            )
+        elif self.degraded and self._average_wait < DEGRADED_EXIT_WAIT:
+            self.degraded = False
+            logger.info("Нагрузка снизилась: упрощенный режим выключен")
+        metrics.set_gauge("backpressure.degraded", int(self.degraded))
+
+    def _set_queued(self, value):
+        self._queued = value
+        metrics.set_gauge("backpressure.queued", value)
+
+    def _set_inflight(self, value):
+        self._inflight = value
+        metrics.set_gauge("backpressure.inflight", value)
+
+
+class CaptureMiddleware(BaseMiddleware):
+    def __init__(self, recorder):
+        """
+        Инициализация записи входящих обновлений для последующего воспроизведения
+
+        Подключается первой, поэтому время обработки включает ожидание в очереди
+        BackpressureMiddleware - то, что видит пользователь
+
+        Args:
+            recorder (UpdateRecorder): Файл записи
+        """
+        self.recorder = recorder
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        received_at = time.time()
+        prepared = self.recorder.prepare(event)
+        started_at = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            try:
+                self.recorder.write(received_at, time.perf_counter() - started_at, prepared)
+            except Exception as e:
+                # Ошибка записи не должна мешать работе бота
+                logger.warning(f"Не удалось записать обновление: {e}")
+
+
+class TenantMiddleware(BaseMiddleware):
+    def __init__(self, registry):
+        """
+        Инициализация выбора бизнеса по боту, получившему обновление
+
+        Бизнес делается текущим (current_tenant) на время обработки обновления,
+        поэтому обработчики работают с его хранилищем, планировщиком и очередью
+        отправки. Кэши бизнеса загружаются при первом обновлении (см. TenantRegistry)
+
+        Args:
+            registry (TenantRegistry): Бизнесы процесса
+        """
+        self.registry = registry
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        tenant = self.registry.get(data['bot'].id)
+        if tenant is None:
+            logger.error("Обновление для неизвестного бота", extra={'bot_id': data['bot'].id})
+            return None
+
+        token = current_tenant.set(tenant)
+        data['tenant'] = tenant
+        try:
+            return await handler(event, data)
+        finally:
+            current_tenant.reset(token)
@@ -0,0 +1,163 @@
+from datetime import datetime, timedelta
+
+
+class Row:
+    """
+    Базовый класс компактных строк результата (услуг, записей, напоминаний)
+
+    Поля хранятся в __slots__, поэтому объект заметно меньше словаря, а кэши
+    в памяти занимают меньше места. Для совместимости строку можно читать
+    как словарь: row['id'], row.get('user_name'), dict(row)
+    """
+    __slots__ = ()
+    FIELDS = ()
+
+    @classmethod
+    def from_row(cls, cursor, row):
+        """
+        row_factory для sqlite3: создает объект из строки результата запроса.
+        Поля, которых нет в запросе, равны None
+        """
+        return cls(**{column[0]: value for column, value in zip(cursor.description, row)})
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def keys(self):
+        return self.FIELDS
+
+    def replace(self, **changes):
+        """
+        Возвращает копию строки с измененными полями (единственный способ изменить строку)
+        """
+        values = {field: getattr(self, field) for field in self.FIELDS}
+        values.update(changes)
+        return type(self)(**values)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, field) == getattr(other, field) for field in self.FIELDS
+        )
+
+    def __hash__(self):
+        # Хэш считается по значениям полей, поэтому строки нельзя менять на месте:
+        # хранилища заменяют измененную строку копией через replace()
+        return hash((type(self),) + tuple(getattr(self, field) for field in self.FIELDS))
+
+    def __repr__(self):
+        fields = ", ".join(f"{field}={getattr(self, field)!r}" for field in self.FIELDS)
+        return f"{type(self).__name__}({fields})"
+
+
+def _date_label(datetime_str):
+    """
+    Переводит "ГГГГ-ММ-ДД ..." в "ДД.ММ.ГГГГ" без разбора даты
+    """
+    return f"{datetime_str[8:10]}.{datetime_str[5:7]}.{datetime_str[:4]}"
+
+
+class Service(Row):
+    FIELDS = ('id', 'name', 'duration', 'price', 'capacity')
+    __slots__ = FIELDS + ('label',)
+
+    def __init__(self, id=None, name=None, duration=None, price=None, capacity=1):
+        self.id = id
+        self.name = name
+        self.duration = duration
+        self.price = price
+        self.capacity = capacity
+        # Текст кнопки услуги строится один раз, а не при каждом показе клавиатуры
+        self.label = f"{name} ({duration} мин, {price} грн.)"
+
+
+class Appointment(Row):
+    FIELDS = (
+        'id', 'user_id', 'user_name', 'service_id', 'service_name', 'service_price',
+        'appointment_datetime', 'duration', 'series_id', 'created_at'
+    )
+    __slots__ = FIELDS + ('start',)
+
+    def __init__(self, id=None, user_id=None, user_name=None, service_id=None, service_name=None,
+                 service_price=None, appointment_datetime=None, duration=None, series_id=None,
+                 created_at=None):
+        self.id = id
+        self.user_id = user_id
+        self.user_name = user_name
+        self.service_id = service_id
+        self.service_name = service_name
+        self.service_price = service_price
+        self.appointment_datetime = appointment_datetime
+        self.duration = duration
+        self.series_id = series_id
+        self.created_at = created_at
+        # Время начала разбирается один раз при чтении из базы
+        self.start = datetime.fromisoformat(appointment_datetime) if appointment_datetime else None
+
+    @property
+    def end(self):
+        """
+        Время окончания приема
+        """
+        return self.start + timedelta(minutes=self.duration)
+
+    @property
+    def date(self):
+        """
+        Дата приема "ГГГГ-ММ-ДД"
+        """
+        return self.appointment_datetime[:10]
+
+    @property
+    def time(self):
+        """
+        Время приема "ЧЧ:ММ"
+        """
+        return self.appointment_datetime[11:16]
+
+    @property
+    def date_label(self):
+        """
+        Дата приема для показа пользователю "ДД.ММ.ГГГГ"
+        """
+        return _date_label(self.appointment_datetime)
+
+    @property
+    def day_label(self):
+        """
+        Короткая дата приема "ДД.ММ"
+        """
+        return f"{self.appointment_datetime[8:10]}.{self.appointment_datetime[5:7]}"
+
+
+class Reminder(Row):
+    FIELDS = ('id', 'appointment_id', 'reminder_datetime', 'user_id', 'service_id', 'appointment_datetime')
+    __slots__ = FIELDS
+
+    def __init__(self, id=None, appointment_id=None, reminder_datetime=None, user_id=None, service_id=None,
+                 appointment_datetime=None):
+        self.id = id
+        self.appointment_id = appointment_id
+        self.reminder_datetime = reminder_datetime
+        self.user_id = user_id
+        self.service_id = service_id
+        self.appointment_datetime = appointment_datetime
+
+    @property
+    def date_label(self):
+        """
+        Дата приема для показа пользователю "ДД.ММ.ГГГГ"
+        """
+        return _date_label(self.appointment_datetime)
+
+    @property
+    def time(self):
+        """
+        Время приема "ЧЧ:ММ"
+        """
+        return self.appointment_datetime[11:16]
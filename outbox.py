@@ -0,0 +1,287 @@
+import asyncio
+import itertools
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+
+import metrics
+from logging_setup import trace_id_var
+from config import (
+    OUTBOX_GLOBAL_RATE, OUTBOX_CHAT_RATE, OUTBOX_CHAT_BURST,
+    OUTBOX_WORKERS, OUTBOX_IDLE_SECONDS, OUTBOX_MAX_RETRIES
+)
+from ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Полосы очереди: интерактивные ответы всегда отправляются раньше массовых рассылок
+INTERACTIVE = 0
+BULK = 1
+LANE_NAMES = {INTERACTIVE: 'interactive', BULK: 'bulk'}
+
+
+class Outbox:
+    def __init__(self, bot: Bot, limited=True):
+        """
+        Инициализация очереди исходящих сообщений
+
+        Все отправки в Telegram проходят через эту очередь. Она соблюдает общий лимит
+        бота и лимит на каждый чат, обрабатывает RetryAfter и пропускает интерактивные
+        ответы вперед массовых рассылок (напоминаний, уведомлений, /broadcast).
+        Обработчики очереди создаются при отправке и завершаются после
+        OUTBOX_IDLE_SECONDS без работы, поэтому неактивные бизнесы их не держат
+
+        Args:
+            bot (Bot): Экземпляр бота
+            limited (bool): Соблюдать лимиты Telegram (False - для воспроизведения
+                записи с заглушкой вместо Telegram)
+        """
+        self.bot = bot
+        self.limited = limited
+        self._queue = asyncio.PriorityQueue()
+        self._sequence = itertools.count()
+        self._global_bucket = TokenBucket(OUTBOX_GLOBAL_RATE, OUTBOX_GLOBAL_RATE)
+        self._chat_buckets = {}
+        self._deferred = {}  # Вызовы в чаты, исчерпавшие свой лимит: {ID чата: [элементы очереди]}
+        self._paused_until = 0
+        self._depth = {INTERACTIVE: 0, BULK: 0}
+        self._workers = set()
+        self._running = False
+
+    async def start(self):
+        """
+        Разрешает отправку; обработчики очереди запускаются при первом вызове
+        """
+        self._running = True
+        if not self._queue.empty():
+            self._ensure_workers()
+
+    async def stop(self):
+        """
+        Останавливает обработчики очереди
+        """
+        self._running = False
+        workers = list(self._workers)
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        self._workers = set()
+        for items in self._deferred.values():
+            for item in items:
+                item[4].cancel()
+        self._deferred = {}
+
+    def submit(self, chat_id, call, lane=INTERACTIVE):
+        """
+        Ставит вызов Telegram API в очередь
+
+        Args:
+            chat_id (int): ID чата, в который отправляется сообщение
+            call (function): Функция без аргументов, возвращающая корутину вызова API
+            lane (int): INTERACTIVE или BULK
+
+        Returns:
+            asyncio.Future: Результат вызова API
+        """
+        future = asyncio.get_running_loop().create_future()
+        # ID трассировки сохраняется вместе с вызовом, чтобы ошибки отправки
+        # в журнале относились к обновлению, которое ее запросило
+        self._queue.put_nowait(
+            (lane, next(self._sequence), chat_id, call, future, time.monotonic(), trace_id_var.get())
+        )
+        self._update_depth(lane, 1)
+        self._ensure_workers()
+        return future
+
+    def _ensure_workers(self):
+        """
+        Дозапускает обработчики очереди до OUTBOX_WORKERS (после простоя их нет)
+        """
+        if not self._running:
+            return
+        for _ in range(OUTBOX_WORKERS - len(self._workers)):
+            self._workers.add(asyncio.create_task(self._worker()))
+
+    async def send(self, chat_id, text, lane=INTERACTIVE, **kwargs):
+        """
+        Отправляет текстовое сообщение через очередь
+
+        Returns:
+            Message: Отправленное сообщение
+        """
+        return await self.submit(chat_id, lambda: self.bot.send_message(chat_id, text, **kwargs), lane)
+
+    async def answer(self, message, text, lane=INTERACTIVE, **kwargs):
+        """
+        Отвечает в чат, из которого пришло сообщение
+
+        Returns:
+            Message: Отправленное сообщение
+        """
+        return await self.send(message.chat.id, text, lane, **kwargs)
+
+    async def send_document(self, chat_id, document, lane=INTERACTIVE, **kwargs):
+        """
+        Отправляет файл через очередь
+
+        Returns:
+            Message: Отправленное сообщение
+        """
+        return await self.submit(chat_id, lambda: self.bot.send_document(chat_id, document, **kwargs), lane)
+
+    async def edit_text(self, chat_id, message_id, text, lane=INTERACTIVE, **kwargs):
+        """
+        Редактирует текст сообщения через очередь
+
+        Returns:
+            Message | bool: Результат вызова API
+        """
+        return await self.submit(
+            chat_id,
+            lambda: self.bot.edit_message_text(text=text, chat_id=chat_id, message_id=message_id, **kwargs),
+            lane
+        )
+
+    async def edit_reply_markup(self, chat_id, message_id, reply_markup, lane=INTERACTIVE):
+        """
+        Заменяет клавиатуру сообщения через очередь
+
+        Returns:
+            Message | bool: Результат вызова API
+        """
+        return await self.submit(
+            chat_id,
+            lambda: self.bot.edit_message_reply_markup(
+                chat_id=chat_id, message_id=message_id, reply_markup=reply_markup
+            ),
+            lane
+        )
+
+    def stats(self):
+        """
+        Возвращает текущую глубину очереди по полосам
+
+        Returns:
+            dict: {название полосы: количество ожидающих отправки вызовов}
+        """
+        return {LANE_NAMES[lane]: depth for lane, depth in self._depth.items()}
+
+    def _update_depth(self, lane, delta):
+        """
+        Обновляет счетчик глубины очереди и соответствующую метрику
+        """
+        self._depth[lane] += delta
+        metrics.set_gauge(f"outbox.queue.{LANE_NAMES[lane]}", self._depth[lane])
+
+    async def _worker(self):
+        """
+        Обработчик очереди: берет самый приоритетный вызов и выполняет его с учетом лимитов
+        """
+        while True:
+            # Сначала получаем общий токен, а потом берем задачу: так в момент отправки
+            # из очереди выбирается самый приоритетный вызов, а не тот, что ждал дольше
+            if self.limited:
+                await self._global_bucket.acquire()
+            # Вызов в чат, исчерпавший свой лимит, откладывается, а не занимает обработчик:
+            # общий токен достается следующему вызову из очереди
+            while True:
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), OUTBOX_IDLE_SECONDS)
+                except asyncio.TimeoutError:
+                    # Очередь простаивает: обработчик завершается, при следующей отправке
+                    # submit запустит его снова
+                    self._workers.discard(asyncio.current_task())
+                    if not self._queue.empty():
+                        self._ensure_workers()
+                    return
+                if self._chat_ready(item):
+                    break
+                self._queue.task_done()
+            lane, _, chat_id, call, future, queued_at, trace_id = item
+            self._update_depth(lane, -1)
+            trace_id_var.set(trace_id)
+
+            try:
+                result = await self._execute(call)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                metrics.inc(f"outbox.failed.{LANE_NAMES[lane]}")
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                metrics.inc(f"outbox.sent.{LANE_NAMES[lane]}")
+                metrics.observe(f"outbox.latency.{LANE_NAMES[lane]}", time.monotonic() - queued_at)
+                if not future.done():
+                    future.set_result(result)
+            finally:
+                self._queue.task_done()
+
+    def _chat_ready(self, item):
+        """
+        Забирает токен чата для вызова из очереди. Если лимит чата исчерпан, вызов
+        откладывается и возвращается в очередь, когда появится токен; более поздние
+        вызовы в тот же чат откладываются вместе с ним, чтобы не нарушать порядок
+
+        Returns:
+            bool: True, если вызов можно выполнять сейчас
+        """
+        if not self.limited:
+            return True
+        chat_id = item[2]
+        deferred = self._deferred.get(chat_id)
+        if deferred is not None:
+            deferred.append(item)
+            return False
+
+        wait = self._chat_bucket(chat_id).try_acquire()
+        if not wait:
+            return True
+        self._deferred[chat_id] = [item]
+        asyncio.get_running_loop().call_later(wait, self._resume_chat, chat_id)
+        return False
+
+    def _resume_chat(self, chat_id):
+        """
+        Возвращает в очередь отложенные вызовы чата (с исходными приоритетом и номером)
+        """
+        for item in self._deferred.pop(chat_id, ()):
+            self._queue.put_nowait(item)
+        self._ensure_workers()
+
+    def _chat_bucket(self, chat_id):
+        """
+        Ведро лимита сообщений в один чат
+        """
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            # Заодно удаляем восстановившиеся ведра неактивных чатов, чтобы словарь не рос
+            if len(self._chat_buckets) > 10000:
+                now = time.monotonic()
+                self._chat_buckets = {
+                    key: value for key, value in self._chat_buckets.items() if not value.is_full(now)
+                }
+            bucket = self._chat_buckets[chat_id] = TokenBucket(OUTBOX_CHAT_RATE, OUTBOX_CHAT_BURST)
+        return bucket
+
+    async def _execute(self, call):
+        """
+        Выполняет вызов API, повторяя его после RetryAfter
+        """
+        for attempt in range(OUTBOX_MAX_RETRIES + 1):
+            # Пока действует ограничение Telegram, не отправляем ничего
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+
+            try:
+                return await call()
+            except TelegramRetryAfter as e:
+                metrics.inc("outbox.retry_after")
+                if attempt == OUTBOX_MAX_RETRIES:
+                    raise
+                logger.warning(f"Превышен лимит Telegram, пауза {e.retry_after} с")
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
@@ -0,0 +1,169 @@
+import asyncio
+import cProfile
+import linecache
+import logging
+import os
+import pstats
+import tracemalloc
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Функции из файлов этой папки считаются кодом бота, остальные - библиотеками
+_PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _is_project(filename):
+    return filename.startswith(_PROJECT_DIR) and 'site-packages' not in filename and filename != __file__
+
+
+def _label(function):
+    filename, line, name = function
+    return f"{os.path.basename(filename)}:{line} {name}" if filename != '~' else name
+
+
+class Profiler:
+    def __init__(self, directory, top=15):
+        """
+        Инициализация профилирования работающего бота по команде администратора
+
+        cProfile включается на заданное время в потоке цикла событий, поэтому
+        учитывает все обработчики, которые выполнялись за это время. tracemalloc
+        запускается отдельно и показывает, какие строки кода выделили память
+        между двумя снимками. Результаты сохраняются в файлы, а в чат
+        отправляется краткая сводка
+
+        Args:
+            directory (str): Папка для файлов профилей и снимков памяти
+            top (int): Сколько строк показывать в сводке
+        """
+        self.directory = directory
+        self.top = top
+        self.profiling = False
+        self._snapshot = None  # Предыдущий снимок памяти для сравнения
+
+    def _path(self, kind, extension):
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory, f"{kind}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{extension}")
+
+    async def profile(self, seconds, function=None):
+        """
+        Профилирует бота в течение заданного времени
+
+        Args:
+            seconds (float): Длительность профилирования
+            function (str): Часть имени функции: если задана, сводка показывает,
+                на какие вызовы уходит время внутри этой функции
+
+        Returns:
+            tuple: (путь к файлу .prof для pstats/snakeviz, текст сводки)
+
+        Raises:
+            RuntimeError: Если профилирование уже идет
+        """
+        if self.profiling:
+            raise RuntimeError("Профилирование уже запущено")
+
+        self.profiling = True
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profile.disable()
+        finally:
+            self.profiling = False
+
+        path = self._path('profile', 'prof')
+        profile.dump_stats(path)
+        stats = pstats.Stats(profile).stats
+        summary = self._callees(stats, function) if function else self._top(stats)
+        logger.info("Профиль сохранен", extra={'path': path, 'seconds': seconds})
+        return path, summary
+
+    def _top(self, stats):
+        """
+        Функции бота с наибольшим общим временем (вместе с вложенными вызовами)
+        """
+        rows = sorted(
+            ((function, calls, own, total) for function, (_, calls, own, total, _) in stats.items()
+             if _is_project(function[0])),
+            key=lambda row: -row[3]
+        )
+        lines = [f"{'вызовов':>8} {'всего, мс':>10} {'своё, мс':>9}  функция"]
+        for function, calls, own, total in rows[:self.top]:
+            lines.append(f"{calls:>8} {total * 1000:>10.1f} {own * 1000:>9.1f}  {_label(function)}")
+        return "\n".join(lines) if rows else "Код бота за это время не выполнялся."
+
+    def _callees(self, stats, function):
+        """
+        Вызовы внутри функций, имя которых содержит function, и время на каждый из них
+        """
+        targets = [key for key in stats if function in key[2] and _is_project(key[0])]
+        if not targets:
+            return f"Функция {function} за это время не вызывалась."
+
+        lines = []
+        for target in targets:
+            _, calls, own, total, _ = stats[target]
+            lines.append(f"{_label(target)}: вызовов {calls}, всего {total * 1000:.1f} мс, своё {own * 1000:.1f} мс")
+            callees = sorted(
+                ((callee, callers[target]) for callee, (*_, callers) in stats.items() if target in callers),
+                key=lambda item: -item[1][3]
+            )
+            for callee, (_, callee_calls, _, callee_total) in callees[:self.top]:
+                lines.append(f"  {callee_calls:>7} {callee_total * 1000:>10.1f} мс  {_label(callee)}")
+        return "\n".join(lines)
+
+    def start_memory(self, frames=1):
+        """
+        Запускает отслеживание выделений памяти и делает первый снимок
+
+        Args:
+            frames (int): Сколько кадров стека хранить для каждого выделения
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self._snapshot = tracemalloc.take_snapshot()
+
+    def stop_memory(self):
+        """
+        Останавливает отслеживание выделений памяти
+        """
+        tracemalloc.stop()
+        self._snapshot = None
+
+    def memory_diff(self):
+        """
+        Делает снимок памяти и сравнивает его с предыдущим
+
+        Returns:
+            tuple: (путь к файлу снимка для tracemalloc.Snapshot.load, текст сводки)
+
+        Raises:
+            RuntimeError: Если отслеживание памяти не запущено
+        """
+        if not tracemalloc.is_tracing() or self._snapshot is None:
+            raise RuntimeError("Отслеживание памяти не запущено")
+
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, linecache.__file__),
+        ))
+        path = self._path('memory', 'snapshot')
+        snapshot.dump(path)
+
+        differences = snapshot.compare_to(self._snapshot, 'lineno')
+        self._snapshot = snapshot
+
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"Отслеживается: {current / 1024 / 1024:.1f} МБ, пик {peak / 1024 / 1024:.1f} МБ"]
+        for difference in differences[:self.top]:
+            frame = difference.traceback[0]
+            lines.append(
+                f"{difference.size_diff / 1024:>+9.1f} КБ {difference.count_diff:>+7}  "
+                f"{os.path.basename(frame.filename)}:{frame.lineno}"
+            )
+        logger.info("Снимок памяти сохранен", extra={'path': path})
+        return path, "\n".join(lines)
@@ -0,0 +1,60 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        """
+        Инициализация "ведра с токенами" для ограничения частоты действий
+
+        Args:
+            rate (float): Сколько токенов добавляется в секунду
+            capacity (float): Максимальное количество накопленных токенов (размер всплеска)
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now):
+        """
+        Добавляет токены, накопившиеся с момента последнего обращения
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, now=None):
+        """
+        Пытается забрать один токен
+
+        Args:
+            now (float): Текущее время по time.monotonic()
+
+        Returns:
+            float: 0, если токен получен, иначе через сколько секунд он появится
+        """
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        """
+        Ждет, пока появится токен, и забирает его
+        """
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def is_full(self, now=None):
+        """
+        Проверяет, что ведро полностью восстановилось (им давно не пользовались)
+        """
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        return self.tokens >= self.capacity
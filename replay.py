@@ -0,0 +1,232 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.types import Message, Update
+
+import metrics
+from capture import UpdateRecorder, read_records, format_comparison
+from config import ADMIN_IDS
+
+# Токен-заглушка: запросы к Telegram при воспроизведении не отправляются
+REPLAY_TOKEN = "123456:replay"
+
+
+class StubSession(BaseSession):
+    def __init__(self, latency=0.0):
+        """
+        Инициализация сессии-заглушки вместо Telegram Bot API
+
+        Отправленные сообщения получают новые ID, остальные вызовы возвращают True,
+        а скачанные файлы пустые. Для каждого чата запоминается ID последнего
+        отправленного сообщения
+
+        Args:
+            latency (float): Имитация задержки ответа Telegram в секундах
+        """
+        super().__init__()
+        self.latency = latency
+        self.calls = 0
+        self.last_message_ids = {}
+        self._message_ids = itertools.count(1_000_000)
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        result = True
+        if method.__returning__ is Message:
+            chat_id = getattr(method, 'chat_id', 0)
+            message_id = next(self._message_ids)
+            self.last_message_ids[chat_id] = message_id
+            result = {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'text': getattr(method, 'text', None) or '',
+            }
+
+        response = self.check_response(bot, method, 200, json.dumps({'ok': True, 'result': result}))
+        return response.result
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        yield b''
+
+    async def close(self):
+        pass
+
+
+def copy_snapshot(source):
+    """
+    Копирует снимок базы данных во временный файл, чтобы воспроизведение его не меняло
+
+    Args:
+        source (str): Путь к снимку базы данных SQLite
+
+    Returns:
+        str: Путь к копии
+    """
+    fd, path = tempfile.mkstemp(suffix='.db', prefix='replay_')
+    os.close(fd)
+    with sqlite3.connect(source) as src, sqlite3.connect(path) as dst:
+        src.backup(dst)
+    return path
+
+
+def _remap_message_id(data, session, message_ids):
+    """
+    Подставляет в колбэк ID сообщения, отправленного при воспроизведении.
+
+    Сообщения получают другие ID, чем в исходной записи, а процесс бронирования
+    принимает колбэки только из своего сообщения. Каждому исходному ID сообщения
+    сопоставляется последнее сообщение, отправленное в этот чат к моменту первого
+    колбэка с этим ID
+    """
+    message = (data.get('callback_query') or {}).get('message')
+    if not message:
+        return
+    chat_id = message['chat']['id']
+    key = (chat_id, message['message_id'])
+    if key not in message_ids:
+        message_ids[key] = session.last_message_ids.get(chat_id, message['message_id'])
+    message['message_id'] = message_ids[key]
+
+
+async def replay(records, output, speed=1.0, latency=0.0, snapshot=None):
+    """
+    Воспроизводит записанные обновления на текущей версии бота
+
+    Обновления подаются в Dispatcher в исходном порядке: с исходными интервалами,
+    ускоренными в speed раз, или подряд без пауз (speed=0, тогда ограничения частоты
+    запросов, нагрузки и отправки выключаются). Вместо Telegram используется StubSession,
+    вместо рабочей базы - копия снимка (или пустое хранилище в памяти). Обновления,
+    отброшенные ограничителем нагрузки, учитываются в результате отдельно
+
+    Args:
+        records (list): Записи обновлений (из read_records)
+        output (str): Путь к файлу, куда записываются задержки воспроизведения
+        speed (float): Ускорение воспроизведения, 0 - как можно быстрее
+        latency (float): Имитация задержки ответа Telegram в секундах
+        snapshot (str): Путь к снимку базы данных SQLite или None
+
+    Returns:
+        dict: Количество обновлений ('updates'), из них отброшенных ограничителем
+            нагрузки ('shed'), вызовов API ('api_calls') и время воспроизведения
+            в секундах ('seconds')
+    """
+    import bot as app
+    from storage import create_storage
+    from tenants import Tenant, TenantRegistry
+
+    snapshot_copy = copy_snapshot(snapshot) if snapshot else None
+    db = create_storage('sqlite', snapshot_copy) if snapshot_copy else create_storage('memory', None)
+
+    session = StubSession(latency)
+    bot = Bot(token=REPLAY_TOKEN, session=session)
+    tenant = Tenant('replay', bot, db, snapshot_copy, ADMIN_IDS, limited=speed > 0)
+    registry = TenantRegistry(1)
+    registry.add(tenant)
+    recorder = UpdateRecorder(output, b'replay', ADMIN_IDS)
+    dp = app.create_dispatcher(registry, recorder, limits=speed > 0)
+    if not app.prepare_tenants(registry):
+        raise RuntimeError("Не удалось подготовить базу данных для воспроизведения")
+    await tenant.outbox.start()
+
+    shed_before = metrics.snapshot()['counters'].get('backpressure.shed', 0)
+    loop = asyncio.get_running_loop()
+    started_at = loop.time()
+    first_ts = records[0]['ts'] if records else 0
+    message_ids = {}
+    tasks = []
+    try:
+        for record in records:
+            if speed:
+                delay = (record['ts'] - first_ts) / speed - (loop.time() - started_at)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            data = record['update']
+            _remap_message_id(data, session, message_ids)
+            update = Update.model_validate(data, context={'bot': bot})
+            tasks.append(asyncio.create_task(dp.feed_update(bot, update)))
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        await tenant.outbox.stop()
+        recorder.close()
+        await bot.session.close()
+        if snapshot_copy:
+            os.remove(snapshot_copy)
+
+    return {
+        'updates': len(records),
+        'shed': metrics.snapshot()['counters'].get('backpressure.shed', 0) - shed_before,
+        'api_calls': session.calls,
+        'seconds': loop.time() - started_at,
+    }
+
+
+def _parse_time(value):
+    return datetime.strptime(value, "%Y-%m-%d %H:%M")
+
+
+def main():
+    """
+    Точка входа для воспроизведения записи и сравнения задержек:
+
+        python replay.py run capture.jsonl --db snapshot.db --from "2024-05-13 08:00" --to "2024-05-13 11:00"
+        python replay.py compare replay_old.jsonl replay_new.jsonl
+    """
+    parser = argparse.ArgumentParser(description="Воспроизведение записанных обновлений")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="Воспроизвести запись и сравнить задержки с исходными")
+    run_parser.add_argument('path')
+    run_parser.add_argument('--db', help="Снимок базы данных SQLite (по умолчанию - пустое хранилище в памяти)")
+    run_parser.add_argument('--from', dest='start', type=_parse_time, help="Начало периода \"ГГГГ-ММ-ДД ЧЧ:ММ\"")
+    run_parser.add_argument('--to', dest='end', type=_parse_time, help="Конец периода \"ГГГГ-ММ-ДД ЧЧ:ММ\"")
+    run_parser.add_argument('--speed', type=float, default=1.0, help="Ускорение, 0 - как можно быстрее")
+    run_parser.add_argument('--latency', type=float, default=0.0, help="Задержка ответа Telegram в секундах")
+    run_parser.add_argument('--out', default='replay.jsonl', help="Файл с задержками воспроизведения")
+
+    compare_parser = subparsers.add_parser('compare', help="Сравнить задержки двух записей")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('candidate')
+
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        print(format_comparison(read_records(args.baseline), read_records(args.candidate)))
+        return
+
+    if os.path.exists(args.out):
+        sys.exit(f"Файл {args.out} уже существует")
+
+    records = read_records(args.path, args.start, args.end)
+    if not records:
+        sys.exit("В записи нет обновлений за указанный период")
+
+    result = asyncio.run(replay(records, args.out, args.speed, args.latency, args.db))
+    print(
+        f"Воспроизведено обновлений: {result['updates']} (отброшено при перегрузке: {result['shed']}), "
+        f"вызовов API: {result['api_calls']}, "
+        f"время: {result['seconds']:.1f} с\n"
+    )
+    print(format_comparison(records, read_records(args.out)))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,76 +1,395 @@
 import asyncio
+import logging
 from datetime import datetime, timedelta
 
+from config import TIME_SLOT_DURATION, REMINDER_DAYS_BEFORE
+from logging_setup import trace_id_var, new_trace_id
+from working_schedule import time_to_minutes, minutes_to_time
+
+logger = logging.getLogger(__name__)
+
+
+def _appointment_interval(appointment):
+    """
+    Возвращает интервал записи (начало, конец) в минутах от начала дня
+    """
+    start = time_to_minutes(appointment['appointment_datetime'][11:16])
+    return start, start + appointment['duration']
+
+
 class AppointmentScheduler:
     def __init__(self, db):
         """
         Инициализация планировщика
         
         Args:
-            db (Database): Экземпляр класса для работы с базой данных
+            db (Storage): Хранилище данных (database.Database или memory_storage.MemoryDatabase)
         """
         self.db = db
-        self.running = False
     
-    def get_available_slots(self, date, duration):
+    def get_available_slots(self, date, duration, service_id=None, capacity=1):
         """
         Получает доступные временные слоты для выбранной даты и длительности услуги
         
         Args:
             date (datetime): Дата для проверки
             duration (int): Длительность услуги в минутах
+            service_id (int): ID услуги (нужен для групповых занятий)
+            capacity (int): Вместимость услуги
             
         Returns:
             list: Список доступных временных слотов в формате "ЧЧ:ММ"
         """
-        # Получаем день недели (0 = Понедельник, 6 = Воскресенье)
-        day_of_week = date.weekday()
+        return [slot for slot, _ in self.get_slot_availability(date, duration, service_id, capacity)]
+    
+    def get_slot_availability(self, date, duration, service_id=None, capacity=1, exclude=None):
+        """
+        Получает доступные временные слоты вместе с количеством свободных мест.
+        Для групповой услуги (capacity > 1) доступны и уже набираемые группы той же
+        услуги, в которых остались места
         
-        # Получаем рабочие часы для выбранного дня недели
-        working_hours = self.db.get_working_hours(day_of_week)
+        Args:
+            date (datetime): Дата для проверки
+            duration (int): Длительность услуги в минутах
+            service_id (int): ID услуги
+            capacity (int): Вместимость услуги
+            exclude (str): Дата и время "ГГГГ-ММ-ДД ЧЧ:ММ" переносимой записи этой услуги:
+                она не считается занятой, чтобы ее можно было сдвинуть в пределах своего времени
+            
+        Returns:
+            list: Список кортежей (время "ЧЧ:ММ", количество свободных мест)
+        """
+        # Рабочие интервалы даты берем из скомпилированного расписания (без запроса к базе)
+        date_str = date.strftime("%Y-%m-%d")
+        working_intervals = self.db.get_schedule().intervals(date_str)
         
-        # Если для выбранного дня нет рабочих часов (например, выходной), возвращаем пустой список
-        if not working_hours:
+        # Если дата нерабочая (выходной или праздник), возвращаем пустой список
+        if not working_intervals:
             return []
         
-        # Разбираем время начала и окончания работы
-        start_time = datetime.strptime(working_hours['start_time'], "%H:%M")
-        end_time = datetime.strptime(working_hours['end_time'], "%H:%M")
+        # Получаем занятость на выбранную дату: одна строка на каждую группу записей
+        groups = self.db.get_occupancy(date_str, date_str)
+        if exclude is not None and exclude[:10] == date_str:
+            groups = self._without(groups, exclude, service_id, duration)
+        
+        slots = self._day_slots(
+            working_intervals,
+            groups,
+            duration,
+            service_id,
+            capacity
+        )
+        return [(minutes_to_time(slot), seats) for slot, seats in slots]
+    
+    def _without(self, groups, appointment_datetime, service_id, duration):
+        """
+        Убирает одну запись из занятости дня
+        
+        Returns:
+            list: Занятость без этой записи (исходные строки не меняются)
+        """
+        result = []
+        for group in groups:
+            if (group['appointment_datetime'], group['service_id'], group['duration']) == (
+                appointment_datetime, service_id, duration
+            ):
+                if group['booked'] > 1:
+                    result.append({**group, 'booked': group['booked'] - 1})
+                continue
+            result.append(group)
+        return result
+    
+    def find_first_available(self, duration, days=90, limit=5, now=None, service_id=None, capacity=1):
+        """
+        Ищет ближайшие свободные слоты на несколько дней вперед.
+        Занятость всего периода загружается одним запросом с группировкой, рабочие
+        интервалы берутся из скомпилированного расписания, после чего дни
+        просматриваются за один проход
+        
+        Args:
+            duration (int): Длительность услуги в минутах
+            days (int): Сколько дней просматривать, начиная с сегодняшнего
+            limit (int): Сколько слотов вернуть
+            now (datetime): Текущий момент (по умолчанию datetime.now())
+            service_id (int): ID услуги (нужен для групповых занятий)
+            capacity (int): Вместимость услуги
+            
+        Returns:
+            list: Список кортежей (дата "ГГГГ-ММ-ДД", время "ЧЧ:ММ") в порядке времени
+        """
+        now = now or datetime.now()
+        first_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        last_day = first_day + timedelta(days=days - 1)
+        
+        schedule = self.db.get_schedule()
+        
+        # Группируем занятость по датам
+        groups_by_date = {}
+        for group in self.db.get_occupancy(
+            first_day.strftime("%Y-%m-%d"), last_day.strftime("%Y-%m-%d")
+        ):
+            groups_by_date.setdefault(group['appointment_datetime'][:10], []).append(group)
+        
+        result = []
+        day = first_day
+        while day <= last_day and len(result) < limit:
+            date_str = day.strftime("%Y-%m-%d")
+            working_intervals = schedule.intervals(date_str)
+            if working_intervals:
+                # Для сегодняшнего дня пропускаем уже прошедшее время
+                not_before = now.hour * 60 + now.minute if day == first_day else 0
+                for slot, _ in self._day_slots(
+                    working_intervals, groups_by_date.get(date_str, []),
+                    duration, service_id, capacity, not_before
+                ):
+                    result.append((date_str, minutes_to_time(slot)))
+                    if len(result) == limit:
+                        break
+            day += timedelta(days=1)
+        
+        return result
+    
+    def _day_slots(self, working_intervals, groups, duration, service_id, capacity, not_before=0):
+        """
+        Вычисляет слоты одного дня с количеством свободных мест
+        
+        Args:
+            working_intervals (tuple): Рабочие интервалы (начало, конец) в минутах
+            groups (list): Занятость дня (строки get_occupancy)
+            duration (int): Длительность услуги в минутах
+            service_id (int): ID услуги
+            capacity (int): Вместимость услуги
+            not_before (int): Не предлагать слоты раньше этого времени (в минутах)
+            
+        Returns:
+            list: Кортежи (начало слота в минутах, количество свободных мест) по времени
+        """
+        intervals = [_appointment_interval(group) for group in groups]
+        # Сетка слотов начинается заново после каждого перерыва
+        slots = {
+            slot: capacity
+            for day_start, day_end in working_intervals
+            for slot in self._free_slots(day_start, day_end, intervals, duration, not_before)
+        }
+        
+        if capacity > 1:
+            # К неполной группе той же услуги можно присоединиться, если ее время
+            # не пересекается ни с одной другой записью
+            for index, group in enumerate(groups):
+                start, end = intervals[index]
+                if (
+                    group['service_id'] == service_id
+                    and group['duration'] == duration
+                    and group['booked'] < capacity
+                    and any(day_start <= start and end <= day_end for day_start, day_end in working_intervals)
+                    and start >= not_before
+                    and not any(
+                        other_start < end and start < other_end
+                        for other_index, (other_start, other_end) in enumerate(intervals)
+                        if other_index != index
+                    )
+                ):
+                    slots[start] = capacity - group['booked']
+        
+        return sorted(slots.items())
+    
+    def _free_slots(self, day_start, day_end, busy, duration, not_before=0):
+        """
+        Вычисляет свободные слоты одного дня за один проход по занятым интервалам
+        
+        Args:
+            day_start (int): Начало рабочего дня в минутах
+            day_end (int): Конец рабочего дня в минутах
+            busy (list): Занятые интервалы (начало, конец) в минутах
+            duration (int): Длительность услуги в минутах
+            not_before (int): Не предлагать слоты раньше этого времени (в минутах)
+            
+        Returns:
+            list: Начала свободных слотов в минутах
+        """
+        # Объединяем пересекающиеся занятые интервалы, чтобы проход был линейным
+        merged = []
+        for start, end in sorted(busy):
+            if merged and start < merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
         
-        # Создаем временные слоты с интервалом в 30 минут
         slots = []
-        current_time = start_time
+        index = 0
+        slot = day_start
+        while slot + duration <= day_end:
+            slot_end = slot + duration
+            # Пропускаем интервалы, которые закончились до начала слота
+            while index < len(merged) and merged[index][1] <= slot:
+                index += 1
+            if slot >= not_before and (index == len(merged) or merged[index][0] >= slot_end):
+                slots.append(slot)
+            slot += TIME_SLOT_DURATION
         
-        while current_time <= end_time - timedelta(minutes=duration):
-            slot = current_time.strftime("%H:%M")
-            slots.append(slot)
-            current_time += timedelta(minutes=30)
+        return slots
+    
+    def find_waitlist_matches(self, appointment, limit):
+        """
+        Находит заявки листа ожидания, которым подходит время, освободившееся
+        после отмены записи. Свободным считается весь промежуток между соседними
+        записями (в пределах рабочего интервала), а не только отмененная запись.
+        Если в группе отмененной записи остались участники, освободилось место
+        в этой группе, и к ней могут присоединиться заявки на ту же услугу.
         
-        # Получаем все записи на выбранную дату
-        date_str = date.strftime("%Y-%m-%d")
-        next_date = (date + timedelta(days=1)).strftime("%Y-%m-%d")
-        appointments = self.db.get_appointments_by_date_range(date_str, date_str)
-        
-        # Исключаем занятые слоты
-        available_slots = slots.copy()
-        for appointment in appointments:
-            appointment_time = datetime.strptime(appointment['appointment_datetime'], "%Y-%m-%d %H:%M").time()
-            appointment_duration = appointment['duration']
+        Расписание и занятость дня загружаются один раз, слоты считаются один раз
+        для каждой пары (услуга, длительность). Индекс отбирает заявки только на
+        услуги, у которых есть слоты в освободившемся промежутке, страницами
+        по limit заявок, пока не наберется limit подходящих
+        
+        Args:
+            appointment (Appointment): Отмененная запись
+            limit (int): Максимальное количество заявок
             
-            # Проверяем каждый доступный слот
-            for slot in slots:
-                slot_time = datetime.strptime(slot, "%H:%M").time()
-                slot_end_time = (datetime.strptime(slot, "%H:%M") + timedelta(minutes=duration)).time()
-                appointment_end_time = (datetime.strptime(appointment_time.strftime("%H:%M"), "%H:%M") + timedelta(minutes=appointment_duration)).time()
-                
-                # Если слот пересекается с уже существующей записью, удаляем его из доступных
-                if (slot_time <= appointment_time < slot_end_time) or \
-                   (slot_time < appointment_end_time <= slot_end_time) or \
-                   (appointment_time <= slot_time and appointment_end_time >= slot_end_time):
-                    if slot in available_slots:
-                        available_slots.remove(slot)
-        
-        return available_slots
+        Returns:
+            list: Список подходящих заявок
+        """
+        date_str = appointment.date
+        start, end = _appointment_interval(appointment)
+        
+        # Освободившееся время не выходит за пределы рабочего интервала (до перерыва)
+        schedule = self.db.get_schedule()
+        working_interval = schedule.interval_at(date_str, start, end)
+        if not working_interval:
+            return []
+        day_start, day_end = working_interval
+        
+        # Расширяем освободившийся интервал до ближайших оставшихся записей.
+        # Если в группе отмененной записи остались участники, освободилось
+        # только место в ней: слоты считаются лишь для времени группы
+        own_key = (appointment.appointment_datetime, appointment.service_id, appointment.duration)
+        groups = self.db.get_occupancy(date_str, date_str)
+        free_from, free_to = day_start, day_end
+        for group in groups:
+            if (group['appointment_datetime'], group['service_id'], group['duration']) == own_key:
+                free_from, free_to = start, end
+                break
+        for group in groups:
+            if (group['appointment_datetime'], group['service_id'], group['duration']) == own_key:
+                continue
+            other_start, other_end = _appointment_interval(group)
+            if other_end <= start:
+                free_from = max(free_from, other_end)
+            elif other_start >= end:
+                free_to = min(free_to, other_start)
+            else:
+                return []
+        
+        if free_from >= free_to:
+            return []
+        
+        working_intervals = schedule.intervals(date_str)
+        services = {service.id: service for service in self.db.get_services()}
+        slots = {}
+        
+        def free_slots(service_id, duration):
+            # Начала слотов внутри освободившегося промежутка (с учетом мест в группах)
+            key = (service_id, duration)
+            if key not in slots:
+                slots[key] = [
+                    slot for slot, _ in self._day_slots(
+                        working_intervals, groups, duration, service_id, services[service_id].capacity
+                    )
+                    if free_from <= slot and slot + duration <= free_to
+                ]
+            return slots[key]
+        
+        service_ids = [service.id for service in services.values() if free_slots(service.id, service.duration)]
+        
+        matches = []
+        after_id = 0
+        while len(matches) < limit:
+            entries = self.db.find_waitlist_matches(date_str, free_from, free_to, limit, service_ids, after_id)
+            for entry in entries:
+                if any(
+                    entry['time_from'] <= slot and slot + entry['duration'] <= entry['time_to']
+                    for slot in free_slots(entry['service_id'], entry['duration'])
+                ):
+                    matches.append(entry)
+                    if len(matches) == limit:
+                        break
+            if len(entries) < limit:
+                break
+            after_id = entries[-1]['id']
+        return matches
+    
+    def book_series(self, user_id, user_name, service_id, duration, first_datetime, interval_weeks, count, capacity=1):
+        """
+        Создает серию повторяющихся записей. Даты вне рабочего времени отбрасываются
+        без обращения к базе, остальные проверяются на пересечения и сохраняются
+        вместе с напоминаниями одной транзакцией
+        
+        Args:
+            user_id (int): ID пользователя Telegram
+            user_name (str): Имя пользователя Telegram
+            service_id (int): ID услуги
+            duration (int): Длительность услуги в минутах
+            first_datetime (datetime): Дата и время первой записи
+            interval_weeks (int): Интервал повторения в неделях
+            count (int): Количество записей в серии
+            capacity (int): Вместимость услуги
+            
+        Returns:
+            dict: ID серии ('series_id'), созданные записи ('appointments')
+                и даты, на которые записаться не удалось ('conflicts')
+        """
+        start = first_datetime.hour * 60 + first_datetime.minute
+        schedule = self.db.get_schedule()
+        occurrences = []
+        skipped = []
+        
+        for index in range(count):
+            appointment_datetime = first_datetime + timedelta(weeks=interval_weeks * index)
+            appointment_datetime_str = appointment_datetime.strftime("%Y-%m-%d %H:%M")
+            
+            if not schedule.interval_at(appointment_datetime_str[:10], start, start + duration):
+                skipped.append(appointment_datetime_str)
+                continue
+            
+            reminder_datetime = appointment_datetime - timedelta(days=REMINDER_DAYS_BEFORE)
+            occurrences.append((appointment_datetime_str, reminder_datetime.strftime("%Y-%m-%d %H:%M:%S")))
+        
+        if not occurrences:
+            return {'series_id': None, 'appointments': [], 'conflicts': skipped}
+        
+        result = self.db.add_appointment_series(
+            user_id, user_name, service_id, duration, occurrences, interval_weeks, capacity
+        )
+        result['conflicts'] = sorted(result['conflicts'] + skipped)
+        return result
+    
+    def reschedule(self, appointment, new_datetime, capacity=1):
+        """
+        Переносит запись на новое время. Время вне рабочего расписания отбрасывается
+        без обращения к базе, остальное проверяется на пересечения и сохраняется
+        вместе с новым напоминанием одной транзакцией
+        
+        Args:
+            appointment (Appointment): Переносимая запись
+            new_datetime (datetime): Новые дата и время приема
+            capacity (int): Вместимость услуги
+            
+        Returns:
+            tuple: (запись до переноса, запись после переноса) или None, если время занято
+        """
+        new_datetime_str = new_datetime.strftime("%Y-%m-%d %H:%M")
+        start = new_datetime.hour * 60 + new_datetime.minute
+        if not self.db.get_schedule().interval_at(new_datetime_str[:10], start, start + appointment.duration):
+            return None
+        
+        reminder_datetime = new_datetime - timedelta(days=REMINDER_DAYS_BEFORE)
+        return self.db.reschedule_appointment(
+            appointment.id,
+            appointment.user_id,
+            new_datetime_str,
+            reminder_datetime.strftime("%Y-%m-%d %H:%M:%S"),
+            capacity
+        )
     
     def schedule_reminder(self, appointment_id, user_id, service_name, date, time, reminder_datetime):
         """
@@ -90,48 +409,50 @@ class AppointmentScheduler:
         # Добавляем напоминание в базу данных
         self.db.add_reminder(appointment_id, reminder_datetime_str)
     
-    async def start_scheduler(self, send_reminder_callback):
+    async def check_reminders(self, send_reminder_callback):
         """
-        Запускает планировщик для отправки напоминаний
+        Один проход планировщика: отправляет наступившие напоминания и удаляет
+        устаревшие заявки листа ожидания. Проходы для всех бизнесов процесса
+        запускает общий цикл (tenants.run_reminder_checks)
         
         Args:
             send_reminder_callback (function): Функция обратного вызова для отправки напоминаний
         """
-        self.running = True
+        # Каждый проход планировщика получает свой ID трассировки в журнале
+        trace_id_var.set(new_trace_id())
         
-        while self.running:
-            # Получаем все напоминания, которые должны быть отправлены
-            reminders = self.db.get_pending_reminders()
-            
-            for reminder in reminders:
-                # Получаем информацию о записи
-                appointment = self.db.get_appointment_by_id(reminder['appointment_id'])
-                
-                if appointment:
-                    # Получаем информацию об услуге
-                    service = self.db.get_service_by_id(appointment['service_id'])
-                    
-                    # Форматируем дату и время для отображения
-                    appointment_datetime = datetime.strptime(appointment['appointment_datetime'], "%Y-%m-%d %H:%M")
-                    formatted_date = appointment_datetime.strftime("%d.%m.%Y")
-                    formatted_time = appointment_datetime.strftime("%H:%M")
-                    
-                    # Отправляем напоминание
-                    await send_reminder_callback(
-                        appointment['user_id'],
-                        service['name'],
-                        formatted_date,
-                        formatted_time
-                    )
-                    
-                    # Отмечаем напоминание как отправленное
-                    self.db.mark_reminder_as_sent(reminder['id'])
-            
-            # Проверяем напоминания каждые 5 минут
-            await asyncio.sleep(300)
+        # Получаем все напоминания, которые должны быть отправлены
+        reminders = self.db.get_pending_reminders()
+        
+        # Отправляем все напоминания одновременно: очередь отправки сама соблюдает лимиты
+        await asyncio.gather(*(
+            self._send_reminder(reminder, send_reminder_callback) for reminder in reminders
+        ))
+        
+        # Удаляем заявки листа ожидания с истекшим периодом
+        self.db.purge_expired_waitlist(datetime.now().strftime("%Y-%m-%d"))
     
-    def stop_scheduler(self):
+    async def _send_reminder(self, reminder, send_reminder_callback):
         """
-        Останавливает планировщик
+        Отправляет одно напоминание и отмечает его как отправленное
+        
+        Args:
+            reminder (Reminder): Напоминание вместе с данными записи
+            send_reminder_callback (function): Функция обратного вызова для отправки напоминаний
         """
-        self.running = False
\ No newline at end of file
+        # Получаем информацию об услуге
+        service = self.db.get_service_by_id(reminder.service_id)
+        
+        try:
+            await send_reminder_callback(
+                reminder.user_id,
+                service.name if service else "",
+                reminder.date_label,
+                reminder.time
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось отправить напоминание {reminder.id}: {e}")
+            return
+        
+        # Отмечаем напоминание как отправленное
+        self.db.mark_reminder_as_sent(reminder.id)
\ No newline at end of file
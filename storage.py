@@ -0,0 +1,118 @@
+from typing import Protocol, runtime_checkable
+
+
+@runtime_checkable
+class Storage(Protocol):
+    """
+    Интерфейс хранилища записей
+
+    Его реализуют database.Database (SQLite) и memory_storage.MemoryDatabase
+    (все данные в памяти процесса). Планировщик, бот и импорт/экспорт работают
+    только через эти методы, поэтому хранилище выбирается в config.STORAGE_BACKEND.
+    Форматы аргументов и результатов описаны в docstring-ах database.Database
+    """
+
+    # Подготовка хранилища
+    def create_tables(self): ...
+
+    def bootstrap(self, default_services, default_working_hours=None): ...
+
+    def warm_up(self, days_ahead=14): ...
+
+    def cool_down(self): ...
+
+    # Услуги
+    def add_service(self, name, duration, price, capacity=1): ...
+
+    def get_services(self): ...
+
+    def get_service_by_id(self, service_id): ...
+
+    def set_service_capacity(self, service_id, capacity): ...
+
+    # Записи
+    def add_change_listener(self, callback): ...
+
+    def add_appointment(self, user_id, user_name, service_id, appointment_datetime, duration, capacity=1): ...
+
+    def get_user_appointments(self, user_id): ...
+
+    def get_appointment_by_id(self, appointment_id): ...
+
+    def delete_appointment(self, appointment_id): ...
+
+    def reschedule_appointment(self, appointment_id, user_id, appointment_datetime, reminder_datetime,
+                               capacity=1): ...
+
+    def get_appointments_by_date_range(self, start_date, end_date): ...
+
+    def iter_appointments_by_date_range(self, start_date, end_date, chunk_size=1000): ...
+
+    def import_appointments(self, rows, batch_size=10000, check_conflicts=True): ...
+
+    def get_occupancy(self, start_date, end_date): ...
+
+    def get_client_ids(self): ...
+
+    def search_appointments(self, query, limit=10, offset=0): ...
+
+    # Серии записей
+    def add_appointment_series(self, user_id, user_name, service_id, duration, occurrences, interval_weeks,
+                               capacity=1): ...
+
+    def delete_appointment_series(self, series_id, user_id): ...
+
+    def cancel_appointments_in_range(self, start_datetime, end_datetime): ...
+
+    # Расписание
+    def get_schedule(self): ...
+
+    def set_weekly_hours(self, day_of_week, intervals): ...
+
+    def set_date_override(self, date, intervals): ...
+
+    def clear_date_override(self, date): ...
+
+    # Напоминания
+    def add_reminder(self, appointment_id, reminder_datetime): ...
+
+    def get_pending_reminders(self): ...
+
+    def mark_reminder_as_sent(self, reminder_id): ...
+
+    # Статистика
+    def rebuild_stats(self): ...
+
+    def get_stats(self, start_date, end_date): ...
+
+    # Лист ожидания
+    def add_to_waitlist(self, user_id, service_id, duration, date_from, date_to, time_from, time_to): ...
+
+    def find_waitlist_matches(self, date, free_from, free_to, limit, service_ids=None, after_id=0): ...
+
+    def remove_from_waitlist(self, entry_ids): ...
+
+    def purge_expired_waitlist(self, today): ...
+
+
+def create_storage(backend, db_file):
+    """
+    Создает хранилище выбранного типа
+
+    Args:
+        backend (str): 'sqlite' или 'memory'
+        db_file (str): Путь к файлу базы данных SQLite (для 'sqlite')
+
+    Returns:
+        Storage: Экземпляр хранилища
+
+    Raises:
+        ValueError: Если тип хранилища неизвестен
+    """
+    if backend == 'sqlite':
+        from database import Database
+        return Database(db_file)
+    if backend == 'memory':
+        from memory_storage import MemoryDatabase
+        return MemoryDatabase()
+    raise ValueError(f"Неизвестный тип хранилища: {backend}")
@@ -1,8 +1,11 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from calendar import monthrange
 
+from config import CALENDAR_CACHE_SIZE
+
 # Константы для календаря
 MONTHS = [
     'Январь', 'Февраль', 'Март', 'Апрель',
@@ -11,6 +14,13 @@ MONTHS = [
 ]
 DAYS = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
 
+# Готовые клавиатуры календаря: {(год, месяц): клавиатура}.
+# Клавиатура зависит от сегодняшней даты (прошедшие дни неактивны),
+# поэтому кэш сбрасывается при смене дня. Месяцы лежат в порядке последнего
+# обращения: когда их больше CALENDAR_CACHE_SIZE, самый давний удаляется
+_calendar_cache = OrderedDict()
+_calendar_cache_day = None
+
 def create_calendar(year=None, month=None):
     """
     Создает клавиатуру с календарем
@@ -82,6 +92,47 @@ def create_calendar(year=None, month=None):
     
     return builder.as_markup()
 
+def get_calendar(year=None, month=None):
+    """
+    Возвращает клавиатуру с календарем из кэша, создавая ее при первом обращении
+    
+    Args:
+        year (int): Год для отображения
+        month (int): Месяц для отображения
+        
+    Returns:
+        InlineKeyboardMarkup: Клавиатура с календарем
+    """
+    global _calendar_cache_day
+    now = datetime.now()
+    if _calendar_cache_day != now.date():
+        _calendar_cache.clear()
+        _calendar_cache_day = now.date()
+    
+    key = (year or now.year, month or now.month)
+    markup = _calendar_cache.get(key)
+    if markup is not None:
+        _calendar_cache.move_to_end(key)
+        return markup
+    
+    markup = _calendar_cache[key] = create_calendar(*key)
+    if len(_calendar_cache) > CALENDAR_CACHE_SIZE:
+        _calendar_cache.popitem(last=False)
+    return markup
+
+def precompute_calendars(months=3):
+    """
+    Заранее строит календари на текущий и следующие месяцы
+    
+    Args:
+        months (int): Количество месяцев, начиная с текущего
+    """
+    now = datetime.now()
+    year, month = now.year, now.month
+    for _ in range(months):
+        get_calendar(year, month)
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
 def process_calendar_selection(callback_data):
     """
     Обрабатывает данные колбэка календаря
@@ -126,7 +177,7 @@ def process_calendar_selection(callback_data):
             else:
                 month += 1
         
-        return None, create_calendar(year, month), action
+        return None, get_calendar(year, month), action
     
     # Обработка выбора дня
     if action == 'day':
@@ -0,0 +1,223 @@
+import asyncio
+import contextvars
+import json
+import logging
+from collections import OrderedDict
+
+from aiogram import Bot
+
+import metrics
+from config import (
+    BOT_TOKEN, DB_FILE, ADMIN_IDS, STORAGE_BACKEND, DEFAULT_SERVICES, DEFAULT_WORKING_HOURS,
+    WARM_UP_DAYS, TENANTS_FILE, TENANT_MAX_ACTIVE
+)
+from keyboards import get_services_keyboard
+from outbox import Outbox
+from scheduler import AppointmentScheduler
+from storage import create_storage
+
+logger = logging.getLogger(__name__)
+
+# Бизнес, обновление которого сейчас обрабатывается. Как и ID трассировки,
+# контекстная переменная наследуется задачами asyncio, созданными при обработке
+current_tenant = contextvars.ContextVar('current_tenant')
+
+
+class Tenant:
+    def __init__(self, tenant_id, bot, db, db_file=None, admin_ids=(), limited=True):
+        """
+        Инициализация бизнеса: его бот, хранилище и то, что к ним привязано
+
+        Объект создается для каждого бизнеса при запуске и почти не занимает памяти:
+        кэши хранилища загружаются только при активации (см. TenantRegistry)
+
+        Args:
+            tenant_id (str): Название бизнеса (для журнала и папки резервных копий)
+            bot (Bot): Бот бизнеса
+            db (Storage): Хранилище бизнеса
+            db_file (str): Путь к файлу базы данных
+            admin_ids (iterable): ID администраторов бизнеса
+            limited (bool): Соблюдать лимиты Telegram в очереди отправки
+        """
+        self.id = tenant_id
+        self.bot = bot
+        self.db = db
+        self.db_file = db_file
+        self.admin_ids = set(admin_ids)
+        self.scheduler = AppointmentScheduler(db)
+        self.outbox = Outbox(bot, limited=limited)
+        self.backup_job = None
+        self.services_keyboard = None  # Последняя построенная клавиатура услуг
+        self.ready = False
+        self.active = False
+
+    def prepare(self):
+        """
+        Проверяет схему и добавляет услуги и рабочие часы по умолчанию (один раз)
+
+        Returns:
+            bool: True, если хранилище готово к работе
+        """
+        if not self.ready:
+            self.ready = self.db.bootstrap(DEFAULT_SERVICES, DEFAULT_WORKING_HOURS)
+            if not self.ready:
+                logger.error(f"Не удалось подготовить базу данных бизнеса {self.id}")
+        return self.ready
+
+    def activate(self):
+        """
+        Загружает в память услуги, расписание, напоминания и ближайшие записи
+        и строит клавиатуру услуг для упрощенного режима
+        """
+        warmed = self.db.warm_up(days_ahead=WARM_UP_DAYS)
+        self.services_keyboard = get_services_keyboard(self.db.get_services())
+        self.active = True
+        logger.info(f"Бизнес {self.id}: кэш загружен: {warmed}")
+
+    def deactivate(self):
+        """
+        Освобождает кэши бизнеса; запросы снова идут напрямую в базу данных
+        """
+        self.db.cool_down()
+        self.services_keyboard = None
+        self.active = False
+        logger.info(f"Бизнес {self.id}: кэш выгружен")
+
+    def create_task(self, coro):
+        """
+        Запускает фоновую задачу, для которой этот бизнес является текущим
+
+        Returns:
+            asyncio.Task: Задача
+        """
+        token = current_tenant.set(self)
+        try:
+            return asyncio.create_task(coro)
+        finally:
+            current_tenant.reset(token)
+
+
+async def run_reminder_checks(tenants, send_reminder_callback, interval=300):
+    """
+    Общий для всех бизнесов процесса планировщик напоминаний: раз в interval секунд
+    выполняет проход планировщика каждого бизнеса в задаче, для которой этот бизнес
+    текущий. Бизнесов может быть много, поэтому отдельный цикл на каждый не заводится
+
+    Args:
+        tenants (list): Бизнесы, готовые к работе
+        send_reminder_callback (function): Функция обратного вызова для отправки напоминаний
+        interval (float): Пауза между проходами в секундах
+    """
+    while True:
+        results = await asyncio.gather(
+            *(tenant.create_task(tenant.scheduler.check_reminders(send_reminder_callback)) for tenant in tenants),
+            return_exceptions=True
+        )
+        for tenant, result in zip(tenants, results):
+            if isinstance(result, Exception):
+                logger.error(f"Бизнес {tenant.id}: ошибка планировщика напоминаний: {result}")
+        await asyncio.sleep(interval)
+
+
+class TenantRegistry:
+    def __init__(self, max_active):
+        """
+        Инициализация списка бизнесов процесса
+
+        Бизнесы ищутся по ID бота. Активные (с загруженными кэшами) хранятся
+        в OrderedDict в порядке последнего обращения: когда их больше max_active,
+        кэши самого давнего выгружаются. Так память зависит от числа активных
+        бизнесов, а не от их общего количества
+
+        Args:
+            max_active (int): Сколько бизнесов держать с загруженными кэшами
+        """
+        self.max_active = max_active
+        self._tenants = {}            # {ID бота: Tenant}
+        self._active = OrderedDict()  # {ID бота: Tenant}, последний - самый недавний
+
+    def add(self, tenant):
+        self._tenants[tenant.bot.id] = tenant
+
+    def __iter__(self):
+        return iter(list(self._tenants.values()))
+
+    def __len__(self):
+        return len(self._tenants)
+
+    def get(self, bot_id):
+        """
+        Возвращает бизнес бота, при необходимости загружая его кэши
+
+        Args:
+            bot_id (int): ID бота
+
+        Returns:
+            Tenant: Бизнес или None, если бот неизвестен или его база данных недоступна
+        """
+        tenant = self._tenants.get(bot_id)
+        if tenant is None:
+            return None
+
+        if tenant.active:
+            self._active.move_to_end(bot_id)
+            return tenant
+
+        if not tenant.prepare():
+            return None
+        tenant.activate()
+        self._active[bot_id] = tenant
+        metrics.inc("tenants.activated")
+
+        while len(self._active) > self.max_active:
+            _, oldest = self._active.popitem(last=False)
+            oldest.deactivate()
+            metrics.inc("tenants.evicted")
+        metrics.set_gauge("tenants.active", len(self._active))
+        return tenant
+
+
+class TenantProxy:
+    """
+    Объект, который переадресует обращения к атрибуту текущего бизнеса:
+    db.get_services() в обработчике вызывает current_tenant.get().db.get_services()
+    """
+    __slots__ = ('_attribute',)
+
+    def __init__(self, attribute):
+        self._attribute = attribute
+
+    def __getattr__(self, name):
+        return getattr(getattr(current_tenant.get(), self._attribute), name)
+
+
+def create_registry(session=None, limited=True):
+    """
+    Создает бизнесы из TENANTS_FILE или, если он не задан, один бизнес
+    из BOT_TOKEN, DB_FILE и ADMIN_IDS
+
+    Args:
+        session (BaseSession): HTTP-сессия, общая для всех ботов процесса
+        limited (bool): Соблюдать лимиты Telegram в очередях отправки
+
+    Returns:
+        TenantRegistry: Бизнесы процесса
+    """
+    if TENANTS_FILE:
+        with open(TENANTS_FILE, encoding='utf-8') as file:
+            entries = json.load(file)
+    else:
+        entries = [{'id': 'default', 'token': BOT_TOKEN, 'db_file': DB_FILE}]
+
+    registry = TenantRegistry(TENANT_MAX_ACTIVE)
+    for entry in entries:
+        bot = Bot(token=entry['token'], session=session)
+        registry.add(Tenant(
+            entry['id'],
+            bot,
+            create_storage(STORAGE_BACKEND, entry['db_file']),
+            entry['db_file'],
+            entry.get('admin_ids', ADMIN_IDS),
+            limited
+        ))
+    return registry
@@ -0,0 +1,50 @@
+"""
+Повторная доставка обновлений: ключи идемпотентности и воспроизведение записей
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from capture import read_records
+from idempotency import IdempotencyStore
+
+
+def test_claim_release_and_ttl():
+    store = IdempotencyStore(ttl=10, max_keys=100)
+
+    assert store.claim('a', now=0) is True
+    assert store.claim('a', now=5) is False
+    store.release('a')
+    assert store.claim('a', now=5) is True
+    assert store.claim('a', now=16) is True
+
+
+def test_max_keys_evicts_oldest():
+    store = IdempotencyStore(ttl=10, max_keys=2)
+    for key in ('a', 'b', 'c'):
+        assert store.claim(key, now=0) is True
+
+    assert len(store) == 2
+    assert store.claim('a', now=0) is True
+
+
+def _start_update(index):
+    return {'update_id': index + 1, 'message': {
+        'message_id': index + 1, 'date': 0, 'chat': {'id': 1000 + index, 'type': 'private'},
+        'from': {'id': 1000 + index, 'is_bot': False, 'first_name': 'U'}, 'text': '/start'
+    }}
+
+
+def test_replay_without_limits_answers_every_update(tmp_path):
+    import replay
+
+    records = [{'ts': index * 0.001, 'ms': 1, 'kind': '/start', 'update': _start_update(index)}
+               for index in range(30)]
+    output = str(tmp_path / 'replay.jsonl')
+
+    result = asyncio.run(replay.replay(records, output, speed=0))
+
+    assert (result['updates'], result['shed'], result['api_calls']) == (30, 0, 30)
+    assert len(read_records(output)) == 30
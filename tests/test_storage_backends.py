@@ -0,0 +1,223 @@
+"""
+Одинаковые сценарии для хранилища SQLite и хранилища в памяти: результаты
+обоих бэкендов должны совпадать
+"""
+import os
+import sqlite3
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import DEFAULT_SERVICES, DEFAULT_WORKING_HOURS
+from database import Database
+from scheduler import AppointmentScheduler
+from storage import create_storage
+
+# ID услуг по умолчанию: Консультация (30 мин), Диагностика (60 мин), Тренировка (90 мин, 20 мест)
+CONSULTATION, DIAGNOSTICS, TRAINING = 1, 2, 3
+
+
+@pytest.fixture(params=['sqlite', 'memory'])
+def db(request, tmp_path):
+    storage = create_storage(request.param, str(tmp_path / 'appointments.db'))
+    storage.bootstrap(DEFAULT_SERVICES, DEFAULT_WORKING_HOURS)
+    return storage
+
+
+def _day(days):
+    return (date.today() + timedelta(days=days)).strftime('%Y-%m-%d')
+
+
+def _workday(days):
+    # Ближайший будний день (рабочие часы по умолчанию 09:00-18:00) не раньше чем через days дней
+    day = date.today() + timedelta(days=days)
+    while day.weekday() > 4:
+        day += timedelta(days=1)
+    return day.strftime('%Y-%m-%d')
+
+
+def test_reschedule_keeps_sent_reminders(db):
+    day = _day(3)
+    appointment_id = db.add_appointment(1, 'Иван', 1, f"{day} 10:00", 30)
+    sent_id = db.add_reminder(appointment_id, f"{_day(-2)} 10:00:00")
+    unsent_id = db.add_reminder(appointment_id, f"{_day(-1)} 10:00:00")
+    db.mark_reminder_as_sent(sent_id)
+
+    assert db.reschedule_appointment(appointment_id, 1, f"{day} 12:00", f"{_day(-1)} 12:00:00") is not None
+
+    # Неотправленное напоминание заменено новым, отправленное осталось
+    pending = db.get_pending_reminders()
+    assert [(item.appointment_id, item.reminder_datetime, item.appointment_datetime) for item in pending] == [
+        (appointment_id, f"{_day(-1)} 12:00:00", f"{day} 12:00")
+    ]
+    assert db.add_reminder(appointment_id, f"{_day(-2)} 10:00:00") == sent_id
+    assert db.add_reminder(appointment_id, f"{_day(-1)} 10:00:00") != unsent_id
+
+
+def test_search_order_after_reschedule(db):
+    day = _day(3)
+    first = db.add_appointment(1, 'Иван Петров', 1, f"{day} 10:00", 30)
+    second = db.add_appointment(2, 'Иван Сидоров', 1, f"{day} 11:00", 30)
+    third = db.add_appointment(3, 'Мария', 1, f"{day} 12:00", 30)
+    db.reschedule_appointment(first, 1, f"{day} 15:00", f"{day} 09:00:00")
+
+    assert [item.id for item in db.search_appointments('иван')] == [second, first]
+    assert [item.id for item in db.search_appointments('конс')] == [third, second, first]
+    assert [item.id for item in db.search_appointments('конс', limit=1, offset=1)] == [second]
+    assert db.search_appointments('иван')[0].service_name == 'Консультация'
+
+
+def test_repeated_booking_and_reminder_are_idempotent(db):
+    day = _day(3)
+    appointment_id = db.add_appointment(1, 'Иван', CONSULTATION, f"{day} 10:00", 30)
+    reminder_id = db.add_reminder(appointment_id, f"{day} 09:00:00")
+
+    assert db.add_appointment(1, 'Иван', CONSULTATION, f"{day} 10:00", 30) == appointment_id
+    assert db.add_appointment(1, 'Иван', DIAGNOSTICS, f"{day} 10:00", 60) is None
+    assert db.add_reminder(appointment_id, f"{day} 09:00:00") == reminder_id
+    assert len(db.get_occupancy(day, day)) == 1
+
+
+def test_group_booking_respects_capacity(db):
+    day = _day(3)
+    db.set_service_capacity(TRAINING, 2)
+    assert db.add_appointment(1, 'a', TRAINING, f"{day} 10:00", 90, capacity=2) is not None
+    assert db.add_appointment(2, 'b', TRAINING, f"{day} 10:00", 90, capacity=2) is not None
+    assert db.add_appointment(3, 'c', TRAINING, f"{day} 10:00", 90, capacity=2) is None
+    assert db.add_appointment(4, 'd', CONSULTATION, f"{day} 11:00", 30) is None
+    assert db.get_occupancy(day, day)[0]['booked'] == 2
+
+
+def test_import_joins_groups_up_to_capacity(db):
+    day = _day(3)
+    rows = [(user_id, 'u', TRAINING, f"{day} 10:00", 90, None) for user_id in range(25)]
+
+    assert db.import_appointments(rows) == {'imported': 20, 'conflicts': 5}
+    assert db.import_appointments([(99, 'x', CONSULTATION, f"{day} 10:30", 30, None)]) == {
+        'imported': 0, 'conflicts': 1
+    }
+
+
+def test_import_checks_every_overlap(db):
+    day = _day(3)
+    # Пересекающиеся записи, импортированные без проверки (как в старых базах)
+    db.import_appointments([
+        (1, 'a', CONSULTATION, f"{day} 14:00", 120, None),
+        (2, 'b', CONSULTATION, f"{day} 14:30", 30, None),
+    ], check_conflicts=False)
+
+    result = db.import_appointments([
+        (3, 'c', CONSULTATION, f"{day} 15:30", 30, None),
+        (4, 'd', CONSULTATION, f"{day} 16:00", 30, None),
+    ])
+
+    assert result == {'imported': 1, 'conflicts': 1}
+    assert [group['appointment_datetime'][11:] for group in db.get_occupancy(day, day)] == [
+        '14:00', '14:30', '16:00'
+    ]
+
+
+def test_reschedule_to_same_time_and_conflicts(db):
+    day = _day(3)
+    first = db.add_appointment(1, 'a', CONSULTATION, f"{day} 10:00", 30)
+    db.add_appointment(1, 'a', CONSULTATION, f"{day} 12:00", 30)
+    db.add_appointment(2, 'b', CONSULTATION, f"{day} 14:00", 30)
+
+    assert db.reschedule_appointment(first, 1, f"{day} 10:00", f"{day} 09:00:00") is not None
+    assert db.reschedule_appointment(first, 1, f"{day} 10:15", f"{day} 09:00:00") is not None
+    assert db.reschedule_appointment(first, 1, f"{day} 12:00", f"{day} 09:00:00") is None
+    assert db.reschedule_appointment(first, 1, f"{day} 14:00", f"{day} 09:00:00") is None
+    assert db.reschedule_appointment(first, 2, f"{day} 16:00", f"{day} 09:00:00") is None
+    assert db.get_appointment_by_id(first).appointment_datetime == f"{day} 10:15"
+
+
+def test_stats_follow_bookings(db):
+    day, other_day = _day(3), _day(4)
+    first = db.add_appointment(1, 'a', CONSULTATION, f"{day} 10:00", 30)
+    db.add_appointment(2, 'b', DIAGNOSTICS, f"{day} 11:00", 60)
+    db.add_appointment(3, 'c', CONSULTATION, f"{day} 13:00", 30)
+    db.reschedule_appointment(first, 1, f"{other_day} 10:00", f"{day} 09:00:00")
+
+    stats = db.get_stats(day, day)
+    assert sorted((item['service_id'], item['bookings'], item['revenue']) for item in stats['services']) == [
+        (CONSULTATION, 1, 1000), (DIAGNOSTICS, 1, 2000)
+    ]
+    assert stats['booked_minutes'] == 90
+
+    db.cancel_appointments_in_range(f"{day} 00:00", f"{day} 23:59")
+    assert db.get_stats(day, other_day)['booked_minutes'] == 30
+
+
+def test_waitlist_matches_service_slots(db):
+    day = _workday(3)
+    scheduler = AppointmentScheduler(db)
+    cancelled = db.add_appointment(1, 'a', CONSULTATION, f"{day} 10:00", 30)
+    db.add_appointment(2, 'b', CONSULTATION, f"{day} 09:30", 30)
+    db.add_appointment(3, 'c', CONSULTATION, f"{day} 10:30", 30)
+    appointment = db.get_appointment_by_id(cancelled)
+
+    long_entry = db.add_to_waitlist(10, DIAGNOSTICS, 60, day, day, 0, 24 * 60)
+    short_entry = db.add_to_waitlist(11, CONSULTATION, 30, day, day, 0, 24 * 60)
+    db.add_to_waitlist(12, 999, 30, day, day, 0, 24 * 60)  # Услуга удалена
+    db.add_to_waitlist(13, CONSULTATION, 30, day, day, 12 * 60, 13 * 60)  # Другое окно
+    later = [db.add_to_waitlist(20 + index, CONSULTATION, 30, day, day, 0, 24 * 60) for index in range(5)]
+    db.delete_appointment(cancelled)
+
+    matches = [entry['id'] for entry in scheduler.find_waitlist_matches(appointment, 3)]
+    assert long_entry not in matches
+    assert matches == [short_entry] + later[:2]
+
+
+def test_waitlist_matches_freed_group_seat(db):
+    day = _workday(3)
+    scheduler = AppointmentScheduler(db)
+    members = [db.add_appointment(user_id, 'u', TRAINING, f"{day} 14:00", 90, capacity=20) for user_id in range(3)]
+    appointment = db.get_appointment_by_id(members[0])
+
+    joining = db.add_to_waitlist(10, TRAINING, 90, day, day, 13 * 60, 16 * 60)
+    db.add_to_waitlist(11, TRAINING, 90, day, day, 15 * 60, 18 * 60)  # Группа вне окна
+    db.add_to_waitlist(12, CONSULTATION, 30, day, day, 0, 24 * 60)  # Время группы занято
+    db.delete_appointment(members[0])
+
+    assert [entry['id'] for entry in scheduler.find_waitlist_matches(appointment, 5)] == [joining]
+
+
+def test_stats_follow_price_change(tmp_path):
+    db = Database(str(tmp_path / 'appointments.db'))
+    db.bootstrap(DEFAULT_SERVICES, DEFAULT_WORKING_HOURS)
+    day = _day(3)
+    first = db.add_appointment(1, 'a', CONSULTATION, f"{day} 10:00", 30)
+    db.add_appointment(2, 'b', CONSULTATION, f"{day} 11:00", 30)
+
+    conn = db._connect()
+    conn.execute("UPDATE services SET price = 5000 WHERE id = ?", (CONSULTATION,))
+    conn.commit()
+    db.delete_appointment(first)
+
+    revenue = db.get_stats(day, day)['services'][0]['revenue']
+    db.rebuild_stats()
+    assert revenue == db.get_stats(day, day)['services'][0]['revenue'] == 5000
+
+
+def test_duplicates_block_migration_until_allowed(tmp_path):
+    path = str(tmp_path / 'appointments.db')
+    Database(path).bootstrap(DEFAULT_SERVICES, DEFAULT_WORKING_HOURS)
+    conn = sqlite3.connect(path)
+    conn.execute("DROP INDEX idx_appointments_unique")
+    conn.executemany(
+        "INSERT INTO appointments (user_id, user_name, service_id, appointment_datetime, duration, created_at) "
+        "VALUES (1, 'a', 1, '2030-01-02 10:00', 30, '2030-01-01 00:00:00')",
+        [()] * 3
+    )
+    conn.commit()
+
+    assert Database(path).bootstrap(DEFAULT_SERVICES, DEFAULT_WORKING_HOURS) is False
+    assert conn.execute("SELECT COUNT(*) FROM appointments").fetchone()[0] == 3
+
+    assert Database(path, remove_duplicates=True).bootstrap(DEFAULT_SERVICES, DEFAULT_WORKING_HOURS) is True
+    assert conn.execute("SELECT COUNT(*) FROM appointments").fetchone()[0] == 1
+    assert conn.execute("SELECT COUNT(*) FROM appointments_duplicates").fetchone()[0] == 2
+    conn.close()
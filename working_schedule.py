@@ -0,0 +1,194 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from config import SCHEDULE_CACHE_DAYS
+
+DAY_NAMES = ("Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье")
+
+
+def time_to_minutes(time_str):
+    """
+    Переводит время "ЧЧ:ММ" в минуты от начала дня
+    """
+    return int(time_str[:2]) * 60 + int(time_str[3:5])
+
+
+def minutes_to_time(minutes):
+    """
+    Переводит минуты от начала дня во время "ЧЧ:ММ"
+    """
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def parse_intervals(values):
+    """
+    Разбирает интервалы вида "09:00-13:00"
+
+    Args:
+        values (list): Строки с интервалами
+
+    Returns:
+        list: Кортежи (начало "ЧЧ:ММ", конец "ЧЧ:ММ")
+
+    Raises:
+        ValueError: Если интервал записан неверно или его конец не позже начала
+    """
+    intervals = []
+    for value in values:
+        start, end = value.split('-')
+        start = datetime.strptime(start, "%H:%M").strftime("%H:%M")
+        end = datetime.strptime(end, "%H:%M").strftime("%H:%M")
+        if end <= start:
+            raise ValueError(f"Неверный интервал: {value}")
+        intervals.append((start, end))
+    return intervals
+
+
+def split_by_breaks(start_time, end_time, breaks):
+    """
+    Делит рабочий интервал на части, исключая перерывы
+
+    Args:
+        start_time (str): Начало рабочего дня "ЧЧ:ММ"
+        end_time (str): Конец рабочего дня "ЧЧ:ММ"
+        breaks (list): Кортежи (начало "ЧЧ:ММ", конец "ЧЧ:ММ")
+
+    Returns:
+        list: Кортежи (начало "ЧЧ:ММ", конец "ЧЧ:ММ") без перерывов
+    """
+    intervals = []
+    current = start_time
+    for break_start, break_end in sorted(breaks):
+        if break_start > current:
+            intervals.append((current, min(break_start, end_time)))
+        current = max(current, break_end)
+        if current >= end_time:
+            break
+    if current < end_time:
+        intervals.append((current, end_time))
+    return intervals
+
+
+def _merge(intervals):
+    """
+    Сортирует интервалы в минутах и объединяет пересекающиеся
+    """
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return tuple(merged)
+
+
+class WorkingSchedule:
+    def __init__(self, weekly, overrides):
+        """
+        Скомпилированное расписание работы
+
+        Хранит рабочие интервалы по дням недели и особые дни (праздники, сокращенные
+        и перенесенные дни). Интервалы конкретной даты вычисляются один раз
+        и запоминаются (не больше SCHEDULE_CACHE_DAYS последних запрошенных дат),
+        поэтому поиск слотов не обращается к базе данных. Объект неизменяемый:
+        при изменении расписания база данных собирает новый
+
+        Args:
+            weekly (dict): {день недели: [(начало "ЧЧ:ММ", конец "ЧЧ:ММ"), ...]}
+            overrides (dict): {"ГГГГ-ММ-ДД": [(начало "ЧЧ:ММ", конец "ЧЧ:ММ"), ...]},
+                пустой список означает выходной
+        """
+        self.weekly = {
+            day: _merge((time_to_minutes(start), time_to_minutes(end)) for start, end in intervals)
+            for day, intervals in weekly.items()
+        }
+        self.overrides = {
+            date: _merge((time_to_minutes(start), time_to_minutes(end)) for start, end in intervals)
+            for date, intervals in overrides.items()
+        }
+        self._by_date = OrderedDict()  # {"ГГГГ-ММ-ДД": интервалы в минутах}, последняя - самая недавняя
+
+    @classmethod
+    def from_rows(cls, weekly_rows, override_rows):
+        """
+        Собирает расписание из строк таблиц working_hours и schedule_overrides
+
+        Args:
+            weekly_rows (list): Строки с полями day_of_week, start_time, end_time
+            override_rows (list): Строки с полями date, start_time, end_time
+                (NULL во времени означает выходной)
+
+        Returns:
+            WorkingSchedule: Скомпилированное расписание
+        """
+        weekly = {}
+        for row in weekly_rows:
+            weekly.setdefault(row['day_of_week'], []).append((row['start_time'], row['end_time']))
+
+        overrides = {}
+        for row in override_rows:
+            intervals = overrides.setdefault(row['date'], [])
+            if row['start_time'] is not None:
+                intervals.append((row['start_time'], row['end_time']))
+
+        return cls(weekly, overrides)
+
+    def intervals(self, date_str):
+        """
+        Возвращает рабочие интервалы даты
+
+        Args:
+            date_str (str): Дата в формате "ГГГГ-ММ-ДД"
+
+        Returns:
+            tuple: Отсортированные кортежи (начало, конец) в минутах от начала дня,
+                пустой для выходного
+        """
+        intervals = self._by_date.get(date_str)
+        if intervals is not None:
+            self._by_date.move_to_end(date_str)
+            return intervals
+
+        intervals = self.overrides.get(date_str)
+        if intervals is None:
+            intervals = self.weekly.get(datetime.strptime(date_str, "%Y-%m-%d").weekday(), ())
+        self._by_date[date_str] = intervals
+        if len(self._by_date) > SCHEDULE_CACHE_DAYS:
+            self._by_date.popitem(last=False)
+        return intervals
+
+    def interval_at(self, date_str, start, end):
+        """
+        Находит рабочий интервал, в который целиком попадает [start, end)
+
+        Args:
+            date_str (str): Дата в формате "ГГГГ-ММ-ДД"
+            start (int): Начало в минутах от начала дня
+            end (int): Конец в минутах от начала дня
+
+        Returns:
+            tuple: Интервал (начало, конец) в минутах или None
+        """
+        for interval_start, interval_end in self.intervals(date_str):
+            if interval_start <= start and end <= interval_end:
+                return interval_start, interval_end
+        return None
+
+    def working_minutes(self, start_date, end_date):
+        """
+        Считает рабочее время за период с учетом особых дней
+
+        Args:
+            start_date (str): Начальная дата в формате "ГГГГ-ММ-ДД"
+            end_date (str): Конечная дата в формате "ГГГГ-ММ-ДД"
+
+        Returns:
+            int: Количество рабочих минут
+        """
+        total = 0
+        day = datetime.strptime(start_date, "%Y-%m-%d")
+        last_day = datetime.strptime(end_date, "%Y-%m-%d")
+        while day <= last_day:
+            total += sum(end - start for start, end in self.intervals(day.strftime("%Y-%m-%d")))
+            day += timedelta(days=1)
+        return total